@@ -0,0 +1,247 @@
+"""
+Асинхронные версии списков блюд для развертывания под ASGI:
+
+    uvicorn main.asgi:application --workers 4
+
+Пока запрос ждет базу, воркер обслуживает другие запросы, а не держит
+поток. Фильтры, сортировка, сериализаторы и формат ответа берутся из
+синхронных DRF-представлений (views.py), поэтому ответы совпадают.
+
+Запросы выполняются через async ORM (acount, aiterator с предзагрузкой
+связей). Сериализация идет уже по загруженным данным и в базу не
+обращается (состав для быстрых сериализаторов загружается заранее),
+так что выполняется прямо в цикле событий. Сборка queryset
+(фильтры DRF, проверка поискового индекса) и версия каталога при промахе
+кэша синхронны и делаются через sync_to_async; подбор в индексе в памяти
+идет в отдельном потоке (thread_sensitive=False).
+
+Keyset-пагинация (?cursor=), фасеты (?facets=true), режимы ranked и
+substitutions пока только синхронные: такие запросы передаются синхронному представлению.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import acatalog_version, get_cache, response_cache_key
+from .facets import wants_facets
+from .fast_serializers import FastElasticDishSerializer, aquery_ingredient_rows, fast_serializers_enabled
+from .loaders import with_related
+from .matching import filter_matches, ingredient_index, load_dishes, memory_engine_enabled, request_ordering
+from .models import Dish
+from .renderers import FastJSONRenderer
+from .serializers import ElasticDishSerializer
+from .views import AllDishListView, PossibleDishesListView, StarredDishView
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def not_found():
+    return json_response({'detail': 'Invalid page.'}, status=404)
+
+
+def wants_cursor(request):
+    return request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET
+
+
+def needs_sync_view(request):
+    # Keyset-пагинацию и фасеты считает синхронное представление
+    return wants_cursor(request) or wants_facets(request)
+
+
+class PageNumberPage:
+    """Страница в формате PageNumberPagination: count, next, previous, results"""
+
+    def __init__(self, request, paginator):
+        self.request = request
+        self.page_size = paginator.get_page_size(request)
+        self.query_param = paginator.page_query_param
+        try:
+            self.number = int(request.query_params.get(self.query_param, 1))
+        except ValueError:
+            self.number = 0
+        self.count = 0
+
+    @property
+    def offset(self):
+        return (self.number - 1) * self.page_size
+
+    def valid(self, count):
+        self.count = count
+        last = max(1, -(-count // self.page_size))
+        self.last = last
+        return 1 <= self.number <= last
+
+    def response_data(self, results):
+        url = self.request.build_absolute_uri()
+        next_url = previous_url = None
+        if self.number < self.last:
+            next_url = replace_query_param(url, self.query_param, self.number + 1)
+        if self.number == 2:
+            previous_url = remove_query_param(url, self.query_param)
+        elif self.number > 2:
+            previous_url = replace_query_param(url, self.query_param, self.number - 1)
+        return {'count': self.count, 'next': next_url, 'previous': previous_url, 'results': results}
+
+
+async def fetch(queryset, size):
+    """Строки queryset через async ORM; prefetch_related выполняется пачкой на size строк"""
+    return [obj async for obj in queryset.aiterator(chunk_size=max(size, 1))]
+
+
+def page_queryset(queryset):
+    """Связи страницы: быстрым сериализаторам нужны только category и type"""
+    if fast_serializers_enabled():
+        return queryset.select_related('category', 'type')
+    return with_related(queryset)
+
+
+async def serializer_context(dishes, context):
+    # Быстрый сериализатор сам запросил бы состав синхронно — загружаем заранее
+    if fast_serializers_enabled():
+        context['ingredient_rows'] = await aquery_ingredient_rows([dish.id for dish in dishes])
+    return context
+
+
+class AsyncDishView(View):
+    sync_view = None  # DRF-представление с фильтрами, сортировкой и сериализатором
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_view(self, request):
+        view = self.sync_view()
+        view.request = Request(request)
+        view.args, view.kwargs = self.args, self.kwargs
+        view.format_kwarg = None
+        return view
+
+    async def fallback(self, request):
+        """Передает запрос синхронному представлению (в отдельном потоке)"""
+        return await sync_to_async(self.sync_view.as_view())(request, *self.args, **self.kwargs)
+
+
+class AsyncCachedListView(AsyncDishView):
+    """Асинхронный аналог CachedListMixin + ListAPIView"""
+
+    async def get(self, request, *args, **kwargs):
+        if needs_sync_view(request):
+            return await self.fallback(request)
+
+        view = self.get_view(request)
+        state = await acatalog_version()
+        modified = state[1]
+        key = response_cache_key(view.request, state)
+        etag = f'"{key.rsplit(":", 1)[1]}"'
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache = get_cache()
+        data = await cache.aget(key)
+        if data is None:
+            data = await self.list(view)
+            if data is None:
+                return not_found()
+            await cache.aset(key, data, getattr(settings, 'COOKING_CACHE_TIMEOUT', 300))
+
+        response = json_response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
+
+    async def list(self, view):
+        queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+        paginator = view.paginator
+        if paginator is None:
+            dishes = await fetch(queryset, 100)
+            context = await serializer_context(dishes, view.get_serializer_context())
+            return view.get_serializer(dishes, many=True, context=context).data
+
+        page = PageNumberPage(view.request, paginator)
+        if not page.valid(await queryset.acount()):
+            return None
+        dishes = await fetch(queryset[page.offset:page.offset + page.page_size], page.page_size)
+        context = await serializer_context(dishes, view.get_serializer_context())
+        return page.response_data(view.get_serializer(dishes, many=True, context=context).data)
+
+
+class AsyncAllDishListView(AsyncCachedListView):
+    sync_view = AllDishListView
+
+
+class AsyncStarredDishView(AsyncCachedListView):
+    sync_view = StarredDishView
+
+
+class AsyncPossibleDishesListView(AsyncDishView):
+    sync_view = PossibleDishesListView
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as exc:
+            return json_response({'detail': f'JSON parse error - {exc}'}, status=400)
+        if not isinstance(data, dict):
+            return json_response({'detail': 'Expected a JSON object.'}, status=400)
+        if data.get('ranked') or data.get('substitutions') or needs_sync_view(request):
+            return await self.fallback(request)
+
+        user_ingredients = data.get('ingredients', [])
+        willing_to_buy = data.get('willing_to_buy', False)
+        if not user_ingredients:
+            return json_response({'count': 0, 'next': None, 'previous': None, 'results': []})
+
+        view = self.get_view(request)
+        view.set_default_ordering(willing_to_buy)
+        page = PageNumberPage(view.request, view.pagination_class())
+
+        if memory_engine_enabled():
+            dishes = await self.match_in_memory(view, page, user_ingredients, willing_to_buy)
+        else:
+            queryset = await sync_to_async(view.get_matching_queryset)(
+                view.request, user_ingredients, willing_to_buy
+            )
+            if not page.valid(await queryset.acount()):
+                return not_found()
+            dishes = await fetch(
+                page_queryset(queryset[page.offset:page.offset + page.page_size]), page.page_size
+            )
+        if dishes is None:
+            return not_found()
+
+        context = await serializer_context(dishes, {'user_ingredients': user_ingredients})
+        serializer_class = FastElasticDishSerializer if fast_serializers_enabled() else ElasticDishSerializer
+        serializer = serializer_class(dishes, many=True, context=context)
+        return json_response(page.response_data(serializer.data))
+
+    async def match_in_memory(self, view, page, user_ingredients, willing_to_buy):
+        # Версия каталога и догоняющая синхронизация индекса читают базу
+        await sync_to_async(ingredient_index.ensure_built)()
+        # Проход по всему каталогу — работа процессора: в отдельном потоке,
+        # чтобы цикл событий продолжал обслуживать другие запросы
+        matches = await sync_to_async(ingredient_index.match, thread_sensitive=False)(
+            user_ingredients, willing_to_buy
+        )
+        params = view.request.query_params
+        ordering = request_ordering(view.request, view)
+        # Фильтры обращаются к поисковому бэкенду (проверка таблицы, поиск в базе)
+        matches = await sync_to_async(filter_matches)(matches, params, ordering)
+
+        if not page.valid(len(matches)):
+            return None
+        matches = matches[page.offset:page.offset + page.page_size]
+        dishes = await fetch(page_queryset(Dish.objects.filter(id__in=[m.id for m in matches])), page.page_size)
+        return load_dishes(matches, {dish.id: dish for dish in dishes})
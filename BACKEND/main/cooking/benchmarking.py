@@ -0,0 +1,293 @@
+"""
+Общие помощники для бенчмарков: перцентили, прогон запросов через
+тестовый клиент Django, сбор планов выполнения SQL, нагрузочный
+HTTP-клиент для запущенного сервера и сравнение отчетов с базовым.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .models import Category, Dish, Ingredient, Type
+from .views import CustomPagination
+
+
+def percentile(values, p):
+    """Перцентиль методом ближайшего ранга; values не обязаны быть отсортированы"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(latencies_ms, queries=None):
+    summary = {
+        'requests': len(latencies_ms),
+        'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else None,
+        'p50_ms': round(percentile(latencies_ms, 50), 3) if latencies_ms else None,
+        'p95_ms': round(percentile(latencies_ms, 95), 3) if latencies_ms else None,
+        'p99_ms': round(percentile(latencies_ms, 99), 3) if latencies_ms else None,
+    }
+    if queries:
+        summary['queries_per_request'] = round(sum(queries) / len(queries), 2)
+    return summary
+
+
+def default_scenarios(seed=0, pantry_sizes=(5, 15)):
+    """Типичные запросы к API по текущему содержимому базы"""
+    rng = random.Random(seed)
+    ingredient_ids = list(Ingredient.objects.order_by('id').values_list('id', flat=True))
+    category = Category.objects.order_by('id').values_list('name', flat=True).first()
+    dish_type = Type.objects.order_by('id').values_list('name', flat=True).first()
+    popular = ingredient_ids[:max(pantry_sizes)]
+    # Глубокая страница — 500-я, а на малом каталоге последняя, чтобы не получить 404
+    last_page = max(1, -(-Dish.objects.count() // CustomPagination.page_size))
+
+    scenarios = [
+        ('all_first_page', 'get', '/dishes/all/', None),
+        ('all_deep_page', 'get', f'/dishes/all/?page={min(500, last_page)}', None),
+        ('all_cursor', 'get', '/dishes/all/?pagination=cursor', None),
+        ('starred', 'get', '/starred/', None),
+        ('categories', 'get', '/categories/', None),
+    ]
+    for size in pantry_sizes:
+        # Популярные ингредиенты дают много совпадений — худший случай для подбора
+        pantry = popular[:size] if size <= len(popular) else rng.sample(ingredient_ids, size)
+        for willing in (False, True):
+            mode = 'willing' if willing else 'complete'
+            data = {'ingredients': pantry, 'willing_to_buy': willing}
+            scenarios.append((f'possible_{mode}_{size}', 'post', '/dishes/possible/', data))
+    data = {'ingredients': popular[:max(pantry_sizes)], 'willing_to_buy': True}
+    filters = f'?category={category}&type={dish_type}&cooktime_min=10&cooktime_max=60&title=Суп'
+    scenarios.append(('possible_filtered', 'post', '/dishes/possible/' + filters, data))
+    # Запись: отметка уже избранного блюда не меняет выдачу между повторами
+    starred = Dish.objects.filter(starred=True).order_by('id').values_list('id', flat=True).first()
+    if starred is not None:
+        scenarios.append(('starred_update', 'patch', f'/starred/{starred}/', {'starred': True}))
+    return scenarios
+
+
+def run_scenario(method, url, data=None, repeat=20, warmup=2, client=None):
+    """Прогоняет запрос repeat раз, возвращает задержки (мс) и число SQL-запросов"""
+    client = client or Client()
+    latencies, queries = [], []
+    with override_settings(COOKING_CACHE_TIMEOUT=0):
+        for i in range(warmup + repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(url)
+                else:
+                    response = getattr(client, method)(url, data, content_type='application/json')
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method.upper()} {url} returned {response.status_code}')
+            if i >= warmup:
+                latencies.append(elapsed)
+                queries.append(len(captured))
+    return latencies, queries
+
+
+def explain_scenario(method, url, data=None, client=None):
+    """Выполняет запрос один раз и возвращает планы всех его SELECT"""
+    client = client or Client()
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with override_settings(COOKING_CACHE_TIMEOUT=0), connection.execute_wrapper(record):
+        if method == 'get':
+            client.get(url)
+        else:
+            getattr(client, method)(url, data, content_type='application/json')
+
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    plans = []
+    with connection.cursor() as cursor:
+        for sql, params in statements:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(prefix + sql, params)
+            plans.append({
+                'sql': sql,
+                'plan': [' '.join(str(col) for col in row) for row in cursor.fetchall()],
+            })
+    return plans
+
+
+async def _http_request(reader, writer, host, method, path, body):
+    """Один запрос HTTP/1.1 по открытому keep-alive соединению; возвращает статус"""
+    head = f'{method.upper()} {path} HTTP/1.1\r\nHost: {host}\r\n'
+    if body is not None:
+        head += f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+    writer.write(head.encode('latin-1') + b'\r\n' + (body or b''))
+    await writer.drain()
+
+    status_line, *header_lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split()[1])
+
+
+async def _load_worker(host, port, requests, weights, deadline, latencies, errors, rng):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = rng.choices(requests, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = await _http_request(reader, writer, host, method, path, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors.append('connection')
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        writer.close()
+
+
+def load_test(host, port, requests, concurrency=32, duration=10.0, seed=0, weights=None):
+    """
+    Держит concurrency соединений, каждое шлет запросы из requests
+    ((method, path, data)) подряд в течение duration секунд; weights —
+    относительные частоты запросов (по умолчанию равные).
+    Возвращает сводку summarize() плюс пропускную способность и ошибки.
+    """
+    prepared = [
+        (method, quote(path, safe='/?&=%'), json.dumps(data).encode() if data is not None else None)
+        for method, path, data in requests
+    ]
+    latencies, errors = [], []
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            _load_worker(host, port, prepared, weights, deadline, latencies, errors, random.Random(seed + i))
+            for i in range(concurrency)
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    summary = summarize(latencies)
+    summary['throughput_rps'] = round(len(latencies) / elapsed, 1)
+    summary['errors'] = len(errors)
+    return summary
+
+
+def server_command(kind, host, port, workers=2, threads=4):
+    """Команда запуска приложения: 'asgi' — uvicorn, 'wsgi' — gunicorn с потоками"""
+    if kind == 'asgi':
+        return [
+            sys.executable, '-m', 'uvicorn', 'main.asgi:application',
+            '--host', host, '--port', str(port), '--workers', str(workers),
+            '--log-level', 'warning', '--no-access-log',
+        ]
+    return [
+        sys.executable, '-m', 'gunicorn', 'main.wsgi:application',
+        '--bind', f'{host}:{port}', '--workers', str(workers),
+        '--worker-class', 'gthread', '--threads', str(threads),
+        '--log-level', 'warning',
+    ]
+
+
+class running_server:
+    """Запускает сервер в дочернем процессе и ждет, пока он начнет отвечать"""
+
+    def __init__(self, command, host, port, timeout=30):
+        self.command, self.host, self.port, self.timeout = command, host, port, timeout
+
+    def __enter__(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='main.settings')
+        # Меряем сами представления, а не кэш ответов
+        env['COOKING_CACHE_TIMEOUT'] = '0'
+        self.process = subprocess.Popen(self.command, cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"{' '.join(self.command[2:4])} exited with code {self.process.returncode}")
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError(f"Server did not start on {self.host}:{self.port}")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# Метрика -> в какую сторону изменение считается ухудшением
+REGRESSION_METRICS = {
+    'p50_ms': 'higher',
+    'p95_ms': 'higher',
+    'p99_ms': 'higher',
+    'throughput_rps': 'lower',
+    'queries_per_request': 'higher',
+}
+
+
+def compare_reports(baseline, current, threshold=0.25, min_delta_ms=1.0):
+    """
+    Сравнивает отчеты manage.py benchmark по сценариям. Регрессия — ухудшение
+    метрики больше чем на threshold (доля); задержки дополнительно должны
+    вырасти хотя бы на min_delta_ms, чтобы шум на быстрых запросах не считался.
+    Любой рост числа SQL-запросов — регрессия.
+    """
+    regressions = []
+    for name, now in current.get('scenarios', {}).items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric, worse in REGRESSION_METRICS.items():
+            old, new = before.get(metric), now.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == 'queries_per_request':
+                regressed = new > old
+            elif worse == 'higher':
+                regressed = new > old * (1 + threshold) and new - old >= min_delta_ms
+            else:
+                regressed = new < old * (1 - threshold)
+            if regressed:
+                regressions.append({
+                    'scenario': name,
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change_pct': round((new - old) / old * 100, 1) if old else None,
+                })
+    return regressions
@@ -0,0 +1,122 @@
+"""
+Кэш ответов для списочных эндпоинтов каталога.
+
+Ключ ответа строится из пути, параметров запроса (включая страницу),
+версии каталога и времени ее появления. Любое изменение Dish,
+DishIngredient, Ingredient, Category или Type увеличивает версию (см.
+signals.py), и все старые ключи просто перестают использоваться — явное
+удаление не нужно.
+
+Версия и время последнего изменения также дают ETag и Last-Modified,
+поэтому повторные запросы клиента получают 304 без тела.
+
+Сама версия хранится в базе (CatalogVersion) и увеличивается одним
+атомарным UPDATE: кэш может вытеснить ключ, и версия не должна при этом
+откатываться к уже выданной. В кэше лежит только ее копия на
+COOKING_CATALOG_VERSION_TTL секунд — столько другие воркеры могут
+отдавать прежнюю версию после изменения.
+
+По той же версии индексы в памяти (matching.py, facets.py) замечают
+изменения, сделанные другими воркерами. Индексы, которым важна только
+часть данных, следят за своей областью версии (scope): автодополнение —
+за 'ingredients', граф замен — за 'substitutions'.
+
+Поддерживаются LocMemCache (кэш в пределах процесса) и FileBasedCache
+(общий для всех воркеров на машине); алиас задается COOKING_CACHE_ALIAS.
+"""
+import datetime
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import CatalogVersion, DeletedDish, Dish
+
+CATALOG = 'catalog'
+
+
+def get_cache():
+    return caches[getattr(settings, 'COOKING_CACHE_ALIAS', 'default')]
+
+
+def version_key(scope):
+    return f'cooking:version:{scope}'
+
+
+def catalog_version(scope=CATALOG):
+    """Текущая версия данных scope и время ее появления (unix time)"""
+    cache = get_cache()
+    state = cache.get(version_key(scope))
+    if state is None:
+        row, _ = CatalogVersion.objects.get_or_create(scope=scope)
+        state = (row.version, int(row.modified.timestamp()))
+        cache.set(version_key(scope), state, getattr(settings, 'COOKING_CATALOG_VERSION_TTL', 1))
+    return state
+
+
+async def acatalog_version(scope=CATALOG):
+    """catalog_version() для асинхронных представлений: в базу — только при промахе кэша"""
+    state = await get_cache().aget(version_key(scope))
+    if state is None:
+        state = await sync_to_async(catalog_version)(scope)
+    return state
+
+
+def bump_catalog_version(scope=CATALOG):
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(scope=scope).update(version=F('version') + 1, modified=now):
+        CatalogVersion.objects.get_or_create(scope=scope, defaults={'version': 2, 'modified': now})
+    get_cache().delete(version_key(scope))
+
+
+def changed_dish_ids(since):
+    """
+    id блюд, измененных или удаленных начиная с since, — для индексов в памяти.
+    Запас COOKING_INDEX_SYNC_OVERLAP секунд покрывает транзакции, которые
+    присвоили updated_at раньше, а закоммитились позже прошлого чтения.
+    """
+    since -= datetime.timedelta(seconds=getattr(settings, 'COOKING_INDEX_SYNC_OVERLAP', 60))
+    dish_ids = set(Dish.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+    dish_ids.update(DeletedDish.objects.filter(deleted_at__gte=since).values_list('dish_id', flat=True))
+    return dish_ids
+
+
+def response_cache_key(request, state):
+    params = sorted(request.query_params.lists())
+    version, modified = state
+    raw = f'{request.get_host()}|{request.path}|{params}|{version}|{modified}'
+    return 'cooking:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+class CachedListMixin:
+    """
+    Кэширует ответ list() целиком и выставляет ETag/Last-Modified.
+    Подмешивается к ListAPIView только для чтения.
+    """
+
+    def list(self, request, *args, **kwargs):
+        state = catalog_version()
+        modified = state[1]
+        key = response_cache_key(request, state)
+        etag = f'"{key.rsplit(":", 1)[1]}"'
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, getattr(settings, 'COOKING_CACHE_TIMEOUT', 300))
+
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return response
@@ -0,0 +1,135 @@
+"""
+Выгрузка всего каталога одним потоком NDJSON (GET /dishes/export/).
+
+Строка на блюдо, поля как у DishSerializer плюс updated_at. Блюда читаются
+курсором .iterator(chunk_size=COOKING_EXPORT_CHUNK_SIZE) по id, состав
+каждой пачки — одним запросом кортежами, поэтому память не растет с
+размером каталога. Вместо тысяч запросов страниц по 20 блюд — один.
+
+Согласованность: на SQLite открытый курсор держит одну транзакцию чтения,
+и запросы состава видят тот же снимок базы; на Postgres выгрузка идет в
+транзакции REPEATABLE READ.
+
+?since=<ISO 8601> выгружает только блюда с updated_at не раньше since и
+затем строки удаленных с тех пор блюд: {"id": ..., "deleted": true,
+"deleted_at": ...} (таблица DeletedDish). Последняя строка —
+{"next_since": ...}: наибольшее прочитанное время изменения минус
+COOKING_EXPORT_OVERLAP секунд. updated_at присваивается до коммита, и
+блюдо, сохраненное раньше, а закоммиченное позже чтения, попадет в
+следующую выгрузку за счет этого запаса. Поэтому выгрузки перекрываются:
+потребитель обновляет блюда по id, повтор строки безвреден.
+
+При Accept-Encoding: gzip поток сжимается на лету.
+"""
+import datetime
+import re
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.text import compress_sequence
+from rest_framework.exceptions import ValidationError
+
+from .fast_serializers import FastDishSerializer, query_ingredient_rows
+from .loaders import load_related
+from .models import DeletedDish, Dish
+from .renderers import FastJSONRenderer
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_OVERLAP = 60
+
+accepts_gzip = re.compile(r'\bgzip\b').search
+
+
+def export_chunk_size():
+    return getattr(settings, 'COOKING_EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def export_overlap():
+    return datetime.timedelta(seconds=getattr(settings, 'COOKING_EXPORT_OVERLAP', DEFAULT_OVERLAP))
+
+
+def format_datetime(value):
+    # В UTC с Z, как DateTimeField в DRF: «+» в ?since= без кодирования стал бы пробелом
+    return value.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def parse_since(value):
+    """Значение ?since=; наивное время считается в часовом поясе проекта"""
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ValidationError({'since': ['Expected an ISO 8601 datetime.']})
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+@contextmanager
+def consistent_reads():
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            yield
+    else:
+        yield
+
+
+def export_lines(since=None, chunk_size=None, request=None):
+    """Пачки строк NDJSON (bytes) по chunk_size блюд, затем удаления и next_since"""
+    chunk_size = chunk_size or export_chunk_size()
+    dishes = Dish.objects.order_by('id')
+    if since is not None:
+        dishes = dishes.filter(updated_at__gte=since)
+    renderer = FastJSONRenderer()
+    latest = None
+    with consistent_reads():
+        iterator = dishes.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(iterator, chunk_size)):
+            # Категории и типы — общими объектами на пачку, а не JOIN с копией на каждое блюдо
+            load_related(chunk, ingredients=False)
+            rows = query_ingredient_rows([dish.id for dish in chunk])
+            serializer = FastDishSerializer(chunk, context={'request': request, 'ingredient_rows': rows})
+            lines = []
+            for dish, row in zip(chunk, serializer.data):
+                row['updated_at'] = dish.updated_at
+                lines.append(renderer.render(row))
+                lines.append(b'\n')
+                latest = dish.updated_at if latest is None else max(latest, dish.updated_at)
+            yield b''.join(lines)
+
+        if since is not None:
+            lines = []
+            deleted = DeletedDish.objects.filter(deleted_at__gte=since).order_by('dish_id')
+            for dish_id, deleted_at in deleted.values_list('dish_id', 'deleted_at').iterator(chunk_size=chunk_size):
+                lines.append(renderer.render({'id': dish_id, 'deleted': True, 'deleted_at': deleted_at}))
+                lines.append(b'\n')
+                latest = deleted_at if latest is None else max(latest, deleted_at)
+            yield b''.join(lines)
+
+    # Без новых изменений следующая выгрузка начинается с того же since
+    next_since = latest - export_overlap() if latest is not None else since
+    if next_since is not None and since is not None:
+        next_since = max(next_since, since)
+    yield renderer.render({'next_since': format_datetime(next_since) if next_since else None}) + b'\n'
+
+
+def export_response(request):
+    since = request.query_params.get('since')
+    since = parse_since(since) if since else None
+    lines = export_lines(since, request=request)
+    if accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = StreamingHttpResponse(compress_sequence(lines), content_type='application/x-ndjson')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,248 @@
+"""
+Счетчики фасетов для фильтров: сколько блюд текущей выдачи в каждой
+категории, кухне (type) и интервале времени приготовления.
+
+Возвращаются в поле facets ответов /dishes/all/ и /dishes/possible/ по
+запросу ?facets=true. Считаются по уже отфильтрованной выдаче:
+
+  - для QuerySet — один GROUP BY по (category, type, интервал cooktime)
+    над id подобранных блюд, три фасета складываются из его строк;
+  - для результатов индекса в памяти — одним проходом по DishMatch;
+  - для всего каталога без фильтров — из счетчиков catalog_facets,
+    которые сигналы поддерживают по одному блюду (см. signals.py).
+
+Интервалы совпадают с фильтром времени на фронтенде; блюда без cooktime
+ни в один интервал не попадают.
+"""
+import threading
+from collections import Counter
+
+from django.db.models import Case, CharField, Count, Value, When
+from django.utils import timezone
+
+from .cache import catalog_version, changed_dish_ids
+from .instrumentation import timed
+from .models import Category, Dish, Type
+
+# (название, cooktime_min, cooktime_max) — границы включительно, как у фильтров
+COOKTIME_BUCKETS = (
+    ('quick', None, 30),
+    ('medium', 31, 60),
+    ('long', 61, None),
+)
+
+
+def wants_facets(request):
+    # GET есть и у HttpRequest, и у DRF Request
+    return request.GET.get('facets', '').lower() in ('1', 'true', 'yes')
+
+
+def cooktime_bucket(cooktime):
+    if cooktime is None:
+        return None
+    for name, low, high in COOKTIME_BUCKETS:
+        if (low is None or cooktime >= low) and (high is None or cooktime <= high):
+            return name
+    return None
+
+
+def bucket_expression():
+    """cooktime_bucket() в SQL"""
+    whens = []
+    for name, low, high in COOKTIME_BUCKETS:
+        lookups = {}
+        if low is not None:
+            lookups['cooktime__gte'] = low
+        if high is not None:
+            lookups['cooktime__lte'] = high
+        whens.append(When(**lookups, then=Value(name)))
+    return Case(*whens, default=Value(None), output_field=CharField())
+
+
+class FacetCounts:
+    def __init__(self):
+        self.categories = Counter()
+        self.types = Counter()
+        self.buckets = Counter()
+
+    def add(self, category_id, type_id, bucket, count=1):
+        if category_id is not None:
+            self.categories[category_id] += count
+        if type_id is not None:
+            self.types[type_id] += count
+        if bucket is not None:
+            self.buckets[bucket] += count
+
+    def as_data(self, category_names, type_names):
+        def options(counts, names):
+            rows = [
+                {'id': option_id, 'name': names.get(option_id), 'count': count}
+                for option_id, count in counts.items() if count > 0
+            ]
+            rows.sort(key=lambda row: (-row['count'], row['name'] or ''))
+            return rows
+
+        return {
+            'category': options(self.categories, category_names),
+            'type': options(self.types, type_names),
+            'cooktime': [
+                {'bucket': name, 'cooktime_min': low, 'cooktime_max': high, 'count': self.buckets[name]}
+                for name, low, high in COOKTIME_BUCKETS
+            ],
+        }
+
+
+def queryset_facets(queryset):
+    """Фасеты блюд из queryset одним запросом с GROUP BY"""
+    rows = (
+        Dish.objects.filter(pk__in=queryset.order_by().values('pk'))
+        .annotate(bucket=bucket_expression())
+        .values('category_id', 'category__name', 'type_id', 'type__name', 'bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    counts = FacetCounts()
+    category_names, type_names = {}, {}
+    for row in rows:
+        counts.add(row['category_id'], row['type_id'], row['bucket'], row['count'])
+        category_names[row['category_id']] = row['category__name']
+        type_names[row['type_id']] = row['type__name']
+    return counts.as_data(category_names, type_names)
+
+
+def match_facets(matches, index):
+    """Фасеты результатов индекса в памяти (список DishMatch)"""
+    counts = FacetCounts()
+    category_entries, type_entries = {}, {}
+    for match in matches:
+        entry = match.entry
+        counts.add(entry.category_id, entry.type_id, cooktime_bucket(entry.cooktime))
+        category_entries.setdefault(entry.category_id, entry)
+        type_entries.setdefault(entry.type_id, entry)
+    return counts.as_data(
+        {category_id: index.category_name(entry) for category_id, entry in category_entries.items()},
+        {type_id: index.type_name(entry) for type_id, entry in type_entries.items()},
+    )
+
+
+class CatalogFacets:
+    """
+    Фасеты всего каталога. Строятся лениво одним запросом и дальше
+    обновляются по одному блюду; изменения других воркеров подхватываются по
+    версии каталога, как в ingredient_index. Массовые операции без сигналов
+    требуют rebuild().
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dishes = {}  # id -> (category_id, type_id, интервал)
+        self._counts = FacetCounts()
+        self._category_names = {}
+        self._type_names = {}
+        self._version = None  # версия каталога, до которой счетчики догнали базу
+        self._synced_at = None
+        self._built = False
+
+    @property
+    def built(self):
+        return self._built
+
+    def rebuild(self):
+        version, started = catalog_version()[0], timezone.now()
+        dishes = {
+            dish_id: (category_id, type_id, cooktime_bucket(cooktime))
+            for dish_id, category_id, type_id, cooktime
+            in Dish.objects.values_list('id', 'category_id', 'type_id', 'cooktime').iterator(chunk_size=5000)
+        }
+        counts = FacetCounts()
+        for key in dishes.values():
+            counts.add(*key)
+        with self._lock:
+            self._dishes = dishes
+            self._counts = counts
+            self._category_names = dict(Category.objects.values_list('id', 'name'))
+            self._type_names = dict(Type.objects.values_list('id', 'name'))
+            self._version, self._synced_at = version, started
+            self._built = True
+
+    def ensure_built(self):
+        version = catalog_version()[0]
+        if self._built and self._version == version:
+            return
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+            elif self._version != version:
+                self.sync()
+
+    def sync(self):
+        """Перечитывает блюда, измененные или удаленные после прошлой синхронизации"""
+        with self._lock:
+            version, started = catalog_version()[0], timezone.now()
+            self.refresh_dishes(changed_dish_ids(self._synced_at))
+            self._category_names = dict(Category.objects.values_list('id', 'name'))
+            self._type_names = dict(Type.objects.values_list('id', 'name'))
+            self._version, self._synced_at = version, started
+
+    def _replace(self, dish_id, key):
+        old = self._dishes.pop(dish_id, None)
+        if old is not None:
+            self._counts.add(*old, count=-1)
+        if key is not None:
+            self._dishes[dish_id] = key
+            self._counts.add(*key)
+
+    def refresh_dish(self, dish_id):
+        self.refresh_dishes([dish_id])
+
+    def refresh_dishes(self, dish_ids):
+        if not self._built or not dish_ids:
+            return
+        rows = Dish.objects.filter(id__in=dish_ids).values_list('id', 'category_id', 'type_id', 'cooktime')
+        keys = {dish_id: (category_id, type_id, cooktime_bucket(cooktime)) for dish_id, category_id, type_id, cooktime in rows}
+        with self._lock:
+            for dish_id in dish_ids:
+                self._replace(dish_id, keys.get(dish_id))
+
+    def remove_dish(self, dish_id):
+        if self._built:
+            with self._lock:
+                self._replace(dish_id, None)
+
+    def invalidate(self):
+        """Перестроить при следующем чтении (удаление категории обнуляет связь через UPDATE)"""
+        self._built = False
+
+    def set_category_name(self, category_id, name):
+        if self._built:
+            with self._lock:
+                self._category_names[category_id] = name
+
+    def set_type_name(self, type_id, name):
+        if self._built:
+            with self._lock:
+                self._type_names[type_id] = name
+
+    def data(self):
+        self.ensure_built()
+        with self._lock:
+            return self._counts.as_data(self._category_names, self._type_names)
+
+
+catalog_facets = CatalogFacets()
+
+
+class FacetsMixin:
+    """Добавляет facets в ответ list() по ?facets=true; ставится после CachedListMixin"""
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if wants_facets(request) and isinstance(response.data, dict):
+            queryset = self.filter_queryset(self.get_queryset())
+            with timed('facets'):
+                # Без условий WHERE выдача — весь каталог
+                if queryset.query.where:
+                    response.data['facets'] = queryset_facets(queryset)
+                else:
+                    response.data['facets'] = catalog_facets.data()
+        return response
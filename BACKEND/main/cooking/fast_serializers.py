@@ -0,0 +1,171 @@
+"""
+Быстрая сериализация страниц списков блюд.
+
+DishSerializer и ElasticDishSerializer проходят каждое поле через
+механизм полей DRF и SerializerMethodField; для страницы в 20 блюд это
+дороже самих SQL-запросов. Здесь строки собираются напрямую:
+
+  - поля блюда читаются атрибутами (category и type — через select_related);
+  - состав блюд страницы берется одним запросом .values_list() кортежами,
+    без создания объектов DishIngredient и Ingredient;
+  - ответ кодирует orjson (renderers.FastJSONRenderer), если он установлен.
+
+Результат байт в байт совпадает с DRF-сериализаторами и JSONRenderer,
+включая пропуск category_name/type_name при пустой связи.
+Включается настройкой COOKING_FAST_SERIALIZERS.
+"""
+from django.conf import settings
+
+from .images import variant_urls
+from .instrumentation import record_rows, timed
+from .models import DishIngredient
+from .substitutions import substitution_row
+
+
+def fast_serializers_enabled():
+    return getattr(settings, 'COOKING_FAST_SERIALIZERS', False)
+
+
+def ingredient_rows(dishes):
+    """
+    Состав блюд: dish_id -> [(ingredient_id, name, quantity)] в порядке id строк.
+    Уже предзагруженный dishingredient_set используется без запроса.
+    """
+    rows = {}
+    pending = []
+    for dish in dishes:
+        prefetched = getattr(dish, '_prefetched_objects_cache', {}).get('dishingredient_set')
+        if prefetched is None:
+            pending.append(dish.id)
+        else:
+            rows[dish.id] = [(di.ingredient_id, di.ingredient.name, di.quantity) for di in prefetched]
+    if pending:
+        rows.update(query_ingredient_rows(pending))
+    return rows
+
+
+def ingredient_rows_queryset(dish_ids):
+    return DishIngredient.objects.filter(dish_id__in=dish_ids).order_by('id').values_list(
+        'dish_id', 'ingredient_id', 'ingredient__name', 'quantity'
+    )
+
+
+def query_ingredient_rows(dish_ids):
+    rows = {dish_id: [] for dish_id in dish_ids}
+    for dish_id, *row in ingredient_rows_queryset(dish_ids):
+        rows[dish_id].append(tuple(row))
+    return rows
+
+
+async def aquery_ingredient_rows(dish_ids):
+    rows = {dish_id: [] for dish_id in dish_ids}
+    async for dish_id, *row in ingredient_rows_queryset(dish_ids):
+        rows[dish_id].append(tuple(row))
+    return rows
+
+
+def photo_url(photo, request):
+    # Как FileField.to_representation в DRF
+    if not photo:
+        return None
+    url = photo.url
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def dish_fields(dish, request):
+    row = {
+        'id': dish.id,
+        'title': dish.title,
+        'description': dish.description,
+        'instructions': dish.instructions,
+        'cooktime': dish.cooktime,
+        'starred': dish.starred,
+        'photo': photo_url(dish.photo, request),
+        'photo_variants': variant_urls(dish, request),
+        'video': dish.video,
+    }
+    # DRF пропускает поле с source='category.name', если связи нет
+    if dish.category is not None:
+        row['category_name'] = dish.category.name
+    if dish.type is not None:
+        row['type_name'] = dish.type.name
+    return row
+
+
+class FastListSerializer:
+    """
+    Замена ModelSerializer(many=True) только для чтения: тот же конструктор
+    и свойство data. В context можно передать готовые ingredient_rows.
+    """
+
+    def __init__(self, instance=None, many=True, context=None, **kwargs):
+        self.instance = instance
+        self.context = context or {}
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            dishes = list(self.instance or [])
+            rows = self.context.get('ingredient_rows')
+            if rows is None:
+                rows = ingredient_rows(dishes)
+            request = self.context.get('request')
+            data = [self.to_representation(dish, rows.get(dish.id, ()), request) for dish in dishes]
+        record_rows(len(data))
+        return data
+
+
+class FastDishSerializer(FastListSerializer):
+    """Аналог DishSerializer"""
+
+    def to_representation(self, dish, ingredients, request):
+        row = dish_fields(dish, request)
+        row['ingredients'] = [f'{name.strip()} {quantity.strip()}' for _, name, quantity in ingredients]
+        return row
+
+
+class FastElasticDishSerializer(FastListSerializer):
+    """Аналог ElasticDishSerializer"""
+
+    def to_representation(self, dish, ingredients, request):
+        row = dish_fields(dish, request)
+        total = getattr(dish, 'total_ingredients_count', 0)
+        row['match_percentage'] = round(dish.matching_ingredients_count / total * 100, 1) if total > 0 else 0
+        row['missing_ingredients'] = [
+            name for ingredient_id, name, _ in ingredients if ingredient_id not in self.user_ingredients
+        ]
+        if self.substitutions is not None:
+            row['substitutions'] = [
+                substitution_row(ingredient_id, name, self.substitutions)
+                for ingredient_id, name, _ in ingredients if ingredient_id in self.substitutions
+            ]
+        return row
+
+    @property
+    def data(self):
+        user_ingredients = self.context.get('user_ingredients', [])
+        try:
+            self.user_ingredients = set(user_ingredients)
+        except TypeError:
+            self.user_ingredients = user_ingredients
+        self.substitutions = self.context.get('substitutions')
+        return super().data
+
+
+class FastSerializerMixin:
+    """Подменяет сериализатор ListAPIView на быстрый при COOKING_FAST_SERIALIZERS"""
+
+    fast_serializer_class = None
+
+    def get_serializer_class(self):
+        # Генератору схемы Swagger (drf_yasg) нужен сериализатор DRF с полями
+        if fast_serializers_enabled() and not getattr(self, 'swagger_fake_view', False):
+            return self.fast_serializer_class
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if fast_serializers_enabled():
+            # Состав страницы сериализатор читает сам, одним запросом кортежами
+            queryset = queryset.prefetch_related(None)
+        return queryset
@@ -0,0 +1,183 @@
+"""
+Уменьшенные варианты фотографий блюд.
+
+Для каждого размера из COOKING_PHOTO_SIZES (имя -> максимальная ширина)
+создаются WebP и JPEG. Пути строятся от sha256 содержимого оригинала:
+
+    dishes/ab/abcdef....jpg                    — оригинал (upload_to)
+    dishes/variants/ab/abcdef.../card.webp     — варианты
+
+поэтому одинаковые файлы не дублируются, а URL можно кэшировать навсегда.
+Список готовых вариантов хранится в Dish.photo_variants и отдается
+сериализаторами как URL по размерам.
+
+После загрузки фото варианты строит пул потоков (см. signals.py), для
+уже загруженных фото — manage.py generate_photo_variants пулом процессов.
+Модуль не импортирует модели на верхнем уровне: его функции выполняются
+в дочерних процессах.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import ImageField, Q
+from django.db.models.fields.files import ImageFieldFile
+from django.utils import timezone
+
+DEFAULT_SIZES = {'thumb': 160, 'card': 480, 'large': 1200}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'progressive': True, 'optimize': True}),
+}
+
+_executor = None
+
+
+def photo_sizes():
+    return getattr(settings, 'COOKING_PHOTO_SIZES', DEFAULT_SIZES)
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def dish_photo_path(instance, filename):
+    """upload_to для Dish.photo: путь по хешу содержимого"""
+    digest = content_hash(instance.photo.file)
+    ext = os.path.splitext(filename)[1].lower() or '.jpg'
+    return f'dishes/{digest[:2]}/{digest}{ext}'
+
+
+class HashedImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        path = self.field.generate_filename(self.instance, name)
+        if not self.storage.exists(path):
+            return super().save(name, content, save)
+        # Путь — хеш содержимого: такой файл уже есть, второй раз не сохраняем
+        self.name = path
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+
+
+class HashedImageField(ImageField):
+    """ImageField, который не дублирует файлы с одинаковым содержимым"""
+
+    attr_class = HashedImageFieldFile
+
+
+def variant_name(digest, size, fmt):
+    return f'dishes/variants/{digest[:2]}/{digest}/{size}.{fmt}'
+
+
+def render_variants(data, sizes):
+    """Байты оригинала -> {размер: (ширина, высота, {формат: байты})}"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'L'):
+            # Прозрачность кладем на белый фон: JPEG ее не поддерживает
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        image = image.convert('RGB')
+
+        rendered = {}
+        for size, width in sizes.items():
+            variant = image.copy()
+            # Только уменьшаем; высота пропорционально ширине
+            variant.thumbnail((width, max(1, round(width * image.height / image.width))), Image.LANCZOS)
+            encoded = {}
+            for fmt, (pil_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                variant.save(buffer, pil_format, **options)
+                encoded[fmt] = buffer.getvalue()
+            rendered[size] = (variant.width, variant.height, encoded)
+        return rendered
+
+
+def build_variants(photo_name, sizes=None):
+    """
+    Строит и сохраняет варианты фото photo_name, возвращает значение для
+    Dish.photo_variants. Уже существующие файлы не перезаписываются.
+    """
+    sizes = sizes or photo_sizes()
+    with default_storage.open(photo_name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    variants = {}
+    for size, (width, height, encoded) in render_variants(data, sizes).items():
+        variants[size] = {'width': width, 'height': height}
+        for fmt, content in encoded.items():
+            name = variant_name(digest, size, fmt)
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(content))
+            variants[size][fmt] = name
+    return {'source': photo_name, 'digest': digest, 'sizes': variants}
+
+
+def needs_variants(dish):
+    name = dish.photo.name if dish.photo else ''
+    return (dish.photo_variants or {}).get('source', '') != name
+
+
+def update_variants(dish_id):
+    """Строит варианты для текущего фото блюда и записывает их в базу"""
+    from .cache import bump_catalog_version
+    from .models import Dish
+
+    dish = Dish.objects.filter(pk=dish_id).only('photo', 'photo_variants').first()
+    if dish is None or not needs_variants(dish):
+        return
+    variants = build_variants(dish.photo.name) if dish.photo else {}
+    # Фото могли заменить, пока строились варианты: пишем, только если оно то же
+    same_photo = Q(photo=dish.photo.name) if dish.photo else Q(photo='') | Q(photo__isnull=True)
+    Dish.objects.filter(same_photo, pk=dish_id).update(photo_variants=variants, updated_at=timezone.now())
+    bump_catalog_version()
+
+
+def _update_in_thread(dish_id):
+    try:
+        update_variants(dish_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(dish_id):
+    """Строит варианты в пуле потоков или сразу, если COOKING_PHOTO_ASYNC = False"""
+    global _executor
+    if not getattr(settings, 'COOKING_PHOTO_ASYNC', True):
+        update_variants(dish_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'COOKING_PHOTO_WORKERS', 2), thread_name_prefix='dish-photos',
+        )
+    _executor.submit(_update_in_thread, dish_id)
+
+
+def variant_urls(dish, request=None):
+    """URL вариантов по размерам для сериализаторов; None, если их еще нет"""
+    variants = (dish.photo_variants or {}).get('sizes')
+    if not variants or needs_variants(dish):
+        return None
+    result = {}
+    for size, variant in variants.items():
+        result[size] = {'width': variant['width'], 'height': variant['height']}
+        for fmt in FORMATS:
+            url = default_storage.url(variant[fmt])
+            result[size][fmt] = request.build_absolute_uri(url) if request is not None else url
+    return result
@@ -0,0 +1,279 @@
+"""
+Инструментирование запросов: число и время SQL, время этапов обработки
+(подбор, фильтры, пагинация, сериализация) и число отданных строк.
+
+RequestMetricsMiddleware собирает метрики каждого запроса и
+  - отдает их в заголовке Server-Timing (видно во вкладке Network браузера);
+  - копит суммы по маршрутам для /metrics/ в текстовом формате Prometheus;
+  - пишет в лог cooking.slow запросы дольше COOKING_SLOW_REQUEST_MS вместе с их SQL.
+
+Этапы размечаются в коде через `with timed('filter'):`, строки — record_rows().
+Метрики текущего запроса лежат в contextvar, поэтому собираются и в
+асинхронных представлениях, и в потоках sync_to_async. SQL перехватывает
+execute_wrapper, который ставится на каждое новое соединение с базой.
+
+Счетчики /metrics/ ведутся на процесс: при нескольких воркерах каждый
+отдает свои, суммирует их Prometheus. Эндпоинт закрыт: его видят сотрудники
+(is_staff) и сборщик с заголовком Authorization: Bearer <COOKING_METRICS_TOKEN>.
+
+В лог медленных запросов попадает SQL с плейсхолдерами; значения параметров
+(в них бывают данные пользователей) — только при COOKING_SLOW_LOG_PARAMS.
+"""
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('cooking.slow')
+
+_current = contextvars.ContextVar('cooking_request_metrics', default=None)
+
+# Сколько SQL одного запроса хранить для лога медленных запросов
+MAX_STATEMENTS = 200
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'sql_ms', 'phases', 'rows', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.phases = {}
+        self.rows = 0
+        self.statements = []
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(phase):
+    """Добавляет время блока к этапу phase текущего запроса"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] = metrics.phases.get(phase, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def record_rows(count):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.rows += count
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        metrics.queries += 1
+        metrics.sql_ms += elapsed
+        if len(metrics.statements) < MAX_STATEMENTS:
+            metrics.statements.append((elapsed, sql, params))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created: перехват SQL на новом соединении"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsRegistry:
+    """Накопленные по маршрутам счетчики процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}   # (route, method, status) -> число
+        self.routes = {}     # (route, method) -> суммы
+
+    def observe(self, route, method, status, metrics, total_ms, slow):
+        seconds = total_ms / 1000
+        with self.lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            stats = self.routes.get((route, method))
+            if stats is None:
+                stats = self.routes[(route, method)] = {
+                    'buckets': [0] * len(DURATION_BUCKETS), 'count': 0, 'seconds': 0.0,
+                    'queries': 0, 'sql_seconds': 0.0, 'rows': 0, 'slow': 0, 'phases': {},
+                }
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['queries'] += metrics.queries
+            stats['sql_seconds'] += metrics.sql_ms / 1000
+            stats['rows'] += metrics.rows
+            stats['slow'] += int(slow)
+            for phase, ms in metrics.phases.items():
+                stats['phases'][phase] = stats['phases'].get(phase, 0.0) + ms / 1000
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        with self.lock:
+            requests = dict(self.requests)
+            routes = {key: dict(stats, buckets=list(stats['buckets']), phases=dict(stats['phases']))
+                      for key, stats in self.routes.items()}
+
+        lines = [
+            '# HELP cooking_requests_total HTTP requests by route, method and status.',
+            '# TYPE cooking_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'cooking_requests_total{{{labels(route=route, method=method, status=status)}}} {count}')
+
+        lines += [
+            '# HELP cooking_request_duration_seconds Request processing time.',
+            '# TYPE cooking_request_duration_seconds histogram',
+        ]
+        for (route, method), stats in sorted(routes.items()):
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append(
+                    f'cooking_request_duration_seconds_bucket{{{labels(route=route, method=method, le=bound)}}} {count}'
+                )
+            base = labels(route=route, method=method)
+            lines.append(f'cooking_request_duration_seconds_bucket{{{labels(route=route, method=method, le="+Inf")}}} {stats["count"]}')
+            lines.append(f'cooking_request_duration_seconds_sum{{{base}}} {stats["seconds"]:.6f}')
+            lines.append(f'cooking_request_duration_seconds_count{{{base}}} {stats["count"]}')
+
+        counters = [
+            ('cooking_sql_queries_total', 'SQL queries executed.', 'queries', '{}'),
+            ('cooking_sql_duration_seconds_total', 'Time spent in SQL.', 'sql_seconds', '{:.6f}'),
+            ('cooking_rows_returned_total', 'Rows serialized into responses.', 'rows', '{}'),
+            ('cooking_slow_requests_total', 'Requests above COOKING_SLOW_REQUEST_MS.', 'slow', '{}'),
+        ]
+        for name, help_text, field, fmt in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (route, method), stats in sorted(routes.items()):
+                lines.append(f'{name}{{{labels(route=route, method=method)}}} {fmt.format(stats[field])}')
+
+        lines += [
+            '# HELP cooking_phase_duration_seconds_total Time spent per processing phase.',
+            '# TYPE cooking_phase_duration_seconds_total counter',
+        ]
+        for (route, method), stats in sorted(routes.items()):
+            for phase, seconds in sorted(stats['phases'].items()):
+                lines.append(
+                    f'cooking_phase_duration_seconds_total{{{labels(route=route, method=method, phase=phase)}}} '
+                    f'{seconds:.6f}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def labels(**values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in values.items())
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(metrics, total_ms):
+    parts = [f'total;dur={total_ms:.1f}', f'db;dur={metrics.sql_ms:.1f};desc="{metrics.queries} queries"']
+    parts += [f'{phase};dur={ms:.1f}' for phase, ms in metrics.phases.items()]
+    if metrics.rows:
+        parts.append(f'rows;desc="{metrics.rows} rows"')
+    return ', '.join(parts)
+
+
+def log_slow_request(request, response, metrics, total_ms):
+    log_params = getattr(settings, 'COOKING_SLOW_LOG_PARAMS', False)
+    statements = '\n'.join(
+        f'  {elapsed:8.1f} ms  {sql}' + (f'  {params!r}' if log_params else '')
+        for elapsed, sql, params in metrics.statements
+    )
+    phases = ', '.join(f'{phase} {ms:.1f} ms' for phase, ms in metrics.phases.items()) or '-'
+    logger.warning(
+        'Slow request %s %s -> %s: %.1f ms, %d queries (%.1f ms SQL), %d rows, phases: %s\n%s',
+        request.method, request.get_full_path(), response.status_code, total_ms,
+        metrics.queries, metrics.sql_ms, metrics.rows, phases, statements,
+    )
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса; ставится первым в MIDDLEWARE"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = metrics.total_ms
+        threshold = getattr(settings, 'COOKING_SLOW_REQUEST_MS', None)
+        slow = threshold is not None and total_ms >= threshold
+        if slow:
+            log_slow_request(request, response, metrics, total_ms)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        registry.observe(route, request.method, response.status_code, metrics, total_ms, slow)
+
+        response['Server-Timing'] = server_timing(metrics, total_ms)
+        return response
+
+
+def metrics_allowed(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = getattr(settings, 'COOKING_METRICS_TOKEN', None)
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
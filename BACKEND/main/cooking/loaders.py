@@ -0,0 +1,36 @@
+"""
+Пакетная загрузка связанных данных для страниц блюд.
+
+Сериализаторы обращаются к category, type и dishingredient_set каждого
+блюда; без предзагрузки это 2–3 запроса на строку. Здесь все связи
+страницы подтягиваются фиксированным числом запросов независимо от ее
+размера.
+"""
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import DishIngredient
+
+
+def dish_ingredients_prefetch():
+    return Prefetch(
+        'dishingredient_set',
+        queryset=DishIngredient.objects.select_related('ingredient').order_by('id'),
+    )
+
+
+def with_related(queryset):
+    """Queryset блюд, который загружает связи вместе со страницей"""
+    return queryset.select_related('category', 'type').prefetch_related(dish_ingredients_prefetch())
+
+
+def load_related(dishes, ingredients=True):
+    """
+    Догружает связи для уже полученного списка блюд (например, страницы).
+    ingredients=False — только category и type: быстрые сериализаторы
+    читают состав сами, кортежами.
+    """
+    if ingredients:
+        prefetch_related_objects(dishes, 'category', 'type', dish_ingredients_prefetch())
+    else:
+        prefetch_related_objects(dishes, 'category', 'type')
+    return dishes
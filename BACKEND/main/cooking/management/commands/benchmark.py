@@ -0,0 +1,128 @@
+import json
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cooking.benchmarking import (
+    compare_reports, default_scenarios, load_test, run_scenario, running_server, server_command, summarize,
+)
+from cooking.models import Dish, DishIngredient, Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        "Regression benchmark of the REST API: p50/p95/p99 latency, throughput and query "
+        "counts per endpoint through the test client, optionally under concurrent HTTP load. "
+        "Run it on a scratch database (COOKING_SQLITE_PATH) and compare with --compare baseline.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dishes', type=int, default=20_000, help="Catalog size to seed into an empty database")
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--pantry-sizes', default='5,15', help="Comma separated pantry sizes for /dishes/possible/")
+        parser.add_argument('--repeat', type=int, default=30, help="Timed requests per scenario")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--load', action='store_true', help="Also run a concurrent HTTP load test under gunicorn")
+        parser.add_argument('--concurrency', type=int, default=32, help="Open connections for --load")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load for --load")
+        parser.add_argument('--workers', type=int, default=2, help="Server processes for --load")
+        parser.add_argument('--write-ratio', type=float, default=0.0,
+                            help="Share of StarredUpdateView PATCHes in the --load mix")
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="Baseline JSON report; exit with an error on regressions")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed relative slowdown before a metric counts as a regression")
+
+    def handle(self, *args, **options):
+        try:
+            pantry_sizes = tuple(int(size) for size in options['pantry_sizes'].split(','))
+        except ValueError:
+            raise CommandError("--pantry-sizes must be comma separated integers")
+
+        if not Dish.objects.exists():
+            self.stdout.write(f"Seeding {options['dishes']} dishes...")
+            call_command(
+                'seed_catalog', dishes=options['dishes'], ingredients=options['ingredients'],
+                seed=options['seed'], stdout=self.stdout,
+            )
+
+        report = {
+            'vendor': connection.vendor,
+            'db_profile': getattr(settings, 'COOKING_DB_PROFILE', 'sqlite'),
+            'engine': getattr(settings, 'COOKING_MATCHING_ENGINE', 'orm'),
+            'catalog': {
+                'dishes': Dish.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'dish_ingredients': DishIngredient.objects.count(),
+            },
+            'repeat': options['repeat'],
+            'scenarios': {},
+        }
+
+        scenarios = default_scenarios(seed=options['seed'], pantry_sizes=pantry_sizes)
+        for name, method, url, data in scenarios:
+            latencies, queries = run_scenario(method, url, data, repeat=options['repeat'])
+            summary = summarize(latencies, queries)
+            # Последовательная пропускная способность одного процесса
+            summary['throughput_rps'] = round(len(latencies) / (sum(latencies) / 1000), 1)
+            report['scenarios'][name] = summary
+            self.stdout.write(
+                f"  {name:<28} p50 {summary['p50_ms']:>9.2f} ms   p95 {summary['p95_ms']:>9.2f} ms   "
+                f"p99 {summary['p99_ms']:>9.2f} ms   {summary['queries_per_request']} queries"
+            )
+
+        if options['load']:
+            requests, weights = self.load_mix(scenarios, options['write_ratio'])
+            host, port = '127.0.0.1', options['port']
+            with running_server(server_command('wsgi', host, port, options['workers']), host, port):
+                report['load'] = load_test(
+                    host, port, requests, concurrency=options['concurrency'],
+                    duration=options['duration'], seed=options['seed'], weights=weights,
+                )
+            report['load']['write_ratio'] = options['write_ratio']
+            load = report['load']
+            self.stdout.write(
+                f"  load: {load['throughput_rps']:>8.1f} req/s   p50 {load['p50_ms']:>8.2f} ms   "
+                f"p99 {load['p99_ms']:>8.2f} ms   errors {load['errors']}"
+            )
+
+        regressions = []
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fh:
+                baseline = json.load(fh)
+            regressions = compare_reports(baseline, report, threshold=options['threshold'])
+            if 'load' in baseline and 'load' in report:
+                regressions += compare_reports(
+                    {'scenarios': {'load': baseline['load']}}, {'scenarios': {'load': report['load']}},
+                    threshold=options['threshold'],
+                )
+            report['regressions'] = regressions
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if regressions:
+            for item in regressions:
+                change = f" ({item['change_pct']:+}%)" if item['change_pct'] is not None else ''
+                self.stderr.write(
+                    f"  {item['scenario']}: {item['metric']} {item['baseline']} -> {item['current']}{change}"
+                )
+            raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+        if options['compare']:
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def load_mix(self, scenarios, write_ratio):
+        """Запросы для нагрузки и их веса: PATCH занимают долю write_ratio"""
+        if not 0 <= write_ratio < 1:
+            raise CommandError("--write-ratio must be in [0, 1)")
+        reads = [(method, url, data) for _, method, url, data in scenarios if method != 'patch']
+        writes = [(method, url, data) for _, method, url, data in scenarios if method == 'patch']
+        if not write_ratio or not writes:
+            return reads, None
+        weights = [(1 - write_ratio) / len(reads)] * len(reads) + [write_ratio / len(writes)] * len(writes)
+        return reads + writes, weights
@@ -0,0 +1,103 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cooking.benchmarking import default_scenarios, explain_scenario, run_scenario, summarize
+from cooking.models import Category, Dish, DishIngredient, Type
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the dish endpoints with and without the catalog indexes: "
+        "records EXPLAIN QUERY PLAN and p50/p99 latency for each endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dishes', type=int, default=100_000, help="Catalog size to seed into an empty database")
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=30, help="Timed requests per endpoint")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--skip-before', action='store_true', help="Only benchmark with indexes in place")
+
+    def handle(self, *args, **options):
+        if not options['skip_before'] and connection.vendor != 'sqlite':
+            raise CommandError("Index comparison drops and recreates indexes; run it on a SQLite copy")
+
+        if not Dish.objects.exists():
+            # 5–15 ингредиентов на блюдо, в среднем 10: 100k блюд дают ~1M строк состава
+            self.stdout.write(f"Seeding {options['dishes']} dishes...")
+            call_command(
+                'seed_catalog', dishes=options['dishes'], ingredients=options['ingredients'],
+                seed=options['seed'], stdout=self.stdout,
+            )
+
+        scenarios = default_scenarios(seed=options['seed'])
+        report = {
+            'vendor': connection.vendor,
+            'catalog': {
+                'dishes': Dish.objects.count(),
+                'dish_ingredients': DishIngredient.objects.count(),
+            },
+            'phases': {},
+        }
+
+        if not options['skip_before']:
+            with without_catalog_indexes():
+                report['phases']['before'] = self.run_phase('before', scenarios, options['repeat'])
+        report['phases']['after'] = self.run_phase('after', scenarios, options['repeat'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def run_phase(self, label, scenarios, repeat):
+        analyze()
+        results = {}
+        self.stdout.write(f"\n[{label}]")
+        for name, method, url, data in scenarios:
+            latencies, queries = run_scenario(method, url, data, repeat=repeat)
+            summary = summarize(latencies, queries)
+            summary['plans'] = explain_scenario(method, url, data)
+            results[name] = summary
+            self.stdout.write(
+                f"  {name:<28} p50 {summary['p50_ms']:>9.2f} ms   p99 {summary['p99_ms']:>9.2f} ms   "
+                f"{summary['queries_per_request']} queries"
+            )
+        return results
+
+
+class without_catalog_indexes:
+    """
+    Временно удаляет индексы из миграции 0004 (SQLite), сохраняя их DDL для
+    восстановления. Уникальность (dish, ingredient) в SQLite — часть таблицы
+    и не удаляется; ее автоиндекс по (dish_id, ...) эквивалентен исходному
+    индексу внешнего ключа dish_id, так что фаза «до» остается честной.
+    """
+
+    def __enter__(self):
+        names = [index.name for model in (Dish, DishIngredient) for index in model._meta.indexes]
+        tables = [Category._meta.db_table, Type._meta.db_table]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                f"AND (name IN ({', '.join(['%s'] * len(names))}) OR tbl_name IN (%s, %s))",
+                names + tables,
+            )
+            self.dropped = cursor.fetchall()
+            for name, _ in self.dropped:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+    def __exit__(self, *exc_info):
+        with connection.cursor() as cursor:
+            for _, sql in self.dropped:
+                cursor.execute(sql)
+
+
+def analyze():
+    """Обновляет статистику планировщика после изменения индексов"""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from cooking.fast_serializers import FastDishSerializer, FastElasticDishSerializer
+from cooking.loaders import with_related
+from cooking.models import Dish
+from cooking.renderers import FastJSONRenderer
+from cooking.serializers import DishSerializer, ElasticDishSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark: rows per second of the DRF serializers + JSONRenderer "
+        "against the fast serializers + orjson on pages of existing dishes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--pages', type=int, default=50, help="Distinct pages to serialize")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        size = options['page_size']
+        ids = list(Dish.objects.order_by('id').values_list('id', flat=True)[:size * options['pages']])
+        if not ids:
+            raise CommandError("No dishes; run seed_catalog first")
+        pages = [ids[start:start + size] for start in range(0, len(ids), size)]
+        request = RequestFactory().get('/dishes/all/')
+        some_ingredients = list(range(1, 30))
+
+        def load(page_ids, related=True):
+            queryset = Dish.objects.filter(id__in=page_ids).order_by('id')
+            queryset = with_related(queryset) if related else queryset.select_related('category', 'type')
+            dishes = list(queryset)
+            for dish in dishes:
+                dish.matching_ingredients_count, dish.total_ingredients_count = 3, 10
+            return dishes
+
+        cases = [
+            ('DishSerializer + JSONRenderer', DishSerializer, JSONRenderer, True, {'request': request}),
+            ('FastDishSerializer + orjson', FastDishSerializer, FastJSONRenderer, False, {'request': request}),
+            ('ElasticDishSerializer + JSONRenderer', ElasticDishSerializer, JSONRenderer, True,
+             {'user_ingredients': some_ingredients}),
+            ('FastElasticDishSerializer + orjson', FastElasticDishSerializer, FastJSONRenderer, False,
+             {'user_ingredients': some_ingredients}),
+        ]
+        for name, serializer_class, renderer_class, related, context in cases:
+            # В замер входит загрузка страницы: быстрый путь читает состав кортежами
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                rows = 0
+                for page_ids in pages:
+                    data = serializer_class(load(page_ids, related), many=True, context=dict(context)).data
+                    renderer_class().render(data)
+                    rows += len(data)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"  {name:<40} {rows / best:>10.0f} rows/s")
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cooking.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the catalog into a read-only snapshot file that workers memory-map "
+        "(COOKING_SNAPSHOT_PATH). The file is replaced atomically, running workers pick it up"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Snapshot path (default: COOKING_SNAPSHOT_PATH)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'COOKING_SNAPSHOT_PATH', None)
+        if not path:
+            raise CommandError("Pass --output or set COOKING_SNAPSHOT_PATH")
+        started = time.perf_counter()
+        stats = build_snapshot(path, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['dishes']} dishes ({stats['bytes'] / 1024 / 1024:.1f} MB) to {path} in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cooking.similar import compute_similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the top similar dishes for every dish (SimilarDish) from ingredient sets "
+        "with MinHash/LSH candidates and exact Jaccard scores"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bands', type=int, default=30, help="LSH bands")
+        parser.add_argument('--rows', type=int, default=2, help="MinHash values per band")
+        parser.add_argument('--max-bucket', type=int, default=200,
+                            help="Skip LSH buckets larger than this (dominated by common ingredients)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done):
+            self.stdout.write(f"  {done} dishes")
+
+        created = compute_similar(
+            bands=options['bands'],
+            rows=options['rows'],
+            seed=options['seed'],
+            max_bucket=options['max_bucket'],
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Stored {created} similar dish pairs in {elapsed:.1f}s"))
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cooking.cache import bump_catalog_version
+from cooking.images import build_variants, needs_variants, photo_sizes
+from cooking.models import Dish
+
+
+class Command(BaseCommand):
+    help = (
+        "Build resized WebP/JPEG variants for dish photos uploaded before the image "
+        "pipeline existed (or all photos with --force), in parallel worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+        parser.add_argument('--force', action='store_true', help="Rebuild variants even if they are up to date")
+
+    def handle(self, *args, **options):
+        dishes = [
+            dish for dish in Dish.objects.exclude(photo='').exclude(photo__isnull=True).only('photo', 'photo_variants')
+            if options['force'] or needs_variants(dish)
+        ]
+        if not dishes:
+            self.stdout.write("All photos already have variants")
+            return
+
+        started = time.perf_counter()
+        sizes = photo_sizes()
+        done = failed = 0
+        original_bytes = card_bytes = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = {pool.submit(build_variants, dish.photo.name, sizes): dish for dish in dishes}
+            for future in as_completed(futures):
+                dish = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as exc:  # битый файл не должен останавливать остальные
+                    failed += 1
+                    self.stderr.write(f"  dish {dish.pk} ({dish.photo.name}): {exc}")
+                    continue
+                Dish.objects.filter(pk=dish.pk, photo=dish.photo.name).update(
+                    photo_variants=variants, updated_at=timezone.now()
+                )
+                done += 1
+                original_bytes += default_storage.size(dish.photo.name)
+                card = variants['sizes'].get('card') or next(iter(variants['sizes'].values()))
+                card_bytes += default_storage.size(card['webp'])
+
+        # .update() не шлет сигналы: сбрасываем кэш ответов вручную
+        bump_catalog_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Built variants for {done} photos in {elapsed:.1f}s ({failed} failed)"
+        ))
+        if card_bytes:
+            self.stdout.write(
+                f"  originals {original_bytes / 1024:.0f} KiB, card WebP {card_bytes / 1024:.0f} KiB "
+                f"({original_bytes / card_bytes:.1f}x smaller)"
+            )
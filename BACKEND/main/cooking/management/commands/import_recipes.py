@@ -0,0 +1,252 @@
+import csv
+import gzip
+import io
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cooking.cache import bump_catalog_version
+from cooking.facets import catalog_facets
+from cooking.matching import ingredient_index
+from cooking.postings import rebuild_postings
+from cooking.suggest import INGREDIENTS, suggest_index
+from cooking.models import Category, Dish, DishIngredient, Ingredient, Type
+from cooking.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream recipes from a JSON Lines or CSV file (optionally .gz) into the catalog "
+        "with batched bulk inserts. Progress is checkpointed so a failed import can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Recipes per transaction")
+        parser.add_argument('--resume', action='store_true', help="Skip recipes committed by a previous run")
+        parser.add_argument(
+            '--checkpoint', help="Progress file (default: <path>.progress)",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or detect_format(path)
+        checkpoint = options['checkpoint'] or f'{path}.progress'
+        batch_size = options['batch_size']
+
+        skip = read_checkpoint(checkpoint) if options['resume'] else 0
+        if skip:
+            self.stdout.write(f"Resuming after {skip} already imported recipes")
+
+        importer = RecipeImporter()
+        started = time.perf_counter()
+        done = skip
+        imported = 0
+        batch = []
+        for number, recipe in enumerate(read_recipes(path, fmt), start=1):
+            if number <= skip:
+                continue
+            try:
+                batch.append(normalize_recipe(recipe))
+            except (KeyError, TypeError, ValueError) as exc:
+                raise CommandError(f"Record {number}: {exc}. Fix it and rerun with --resume")
+            if len(batch) >= batch_size:
+                imported += importer.write(batch)
+                done += len(batch)
+                write_checkpoint(checkpoint, done)
+                batch = []
+                self.report(imported, started)
+        if batch:
+            imported += importer.write(batch)
+            done += len(batch)
+            write_checkpoint(checkpoint, done)
+
+        # bulk_create не шлет сигналы: сбрасываем кэш ответов, списки блюд по ингредиентам
+        # и индексы в памяти вручную
+        bump_catalog_version()
+        bump_catalog_version(INGREDIENTS)
+        rebuild_postings()
+        if ingredient_index.built:
+            ingredient_index.rebuild()
+        if suggest_index.built:
+            suggest_index.rebuild()
+        if catalog_facets.built:
+            catalog_facets.rebuild()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed else imported
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} recipes ({importer.rows} dish ingredients, "
+            f"{importer.new_ingredients} new ingredients) in {elapsed:.1f}s, {rate:.0f} recipes/s"
+        ))
+
+    def report(self, imported, started):
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed else imported
+        self.stdout.write(f"  {imported} recipes, {rate:.0f} recipes/s")
+
+
+class RecipeImporter:
+    """Пишет пачки рецептов через bulk_create, сводя названия к id через словари в памяти"""
+
+    def __init__(self):
+        self.ingredients = name_map(Ingredient)
+        self.categories = name_map(Category)
+        self.types = name_map(Type)
+        self.rows = 0
+        self.new_ingredients = 0
+
+    def resolve(self, model, names, cache):
+        missing = {name_key(n): n for n in names if n and name_key(n) not in cache}
+        if missing:
+            created = model.objects.bulk_create(model(name=name) for name in missing.values())
+            for obj in created:
+                cache[name_key(obj.name)] = obj.id
+            if model is Ingredient:
+                self.new_ingredients += len(created)
+        return cache
+
+    @transaction.atomic
+    def write(self, recipes):
+        self.resolve(Ingredient, {name for r in recipes for name, _ in r['ingredients']}, self.ingredients)
+        self.resolve(Category, {r['category'] for r in recipes}, self.categories)
+        self.resolve(Type, {r['type'] for r in recipes}, self.types)
+
+        dishes = []
+        compositions = []
+        for recipe in recipes:
+            # Повтор ингредиента в рецепте сливаем в одну строку (уникальность dish+ingredient)
+            composition = {}
+            for name, quantity in recipe['ingredients']:
+                ingredient_id = self.ingredients[name_key(name)]
+                if ingredient_id in composition and quantity:
+                    quantity = f'{composition[ingredient_id]} + {quantity}'[:100]
+                composition[ingredient_id] = quantity
+            compositions.append(composition)
+            dishes.append(Dish(
+                title=recipe['title'],
+                description=recipe['description'],
+                instructions=recipe['instructions'],
+                cooktime=recipe['cooktime'],
+                category_id=self.categories.get(name_key(recipe['category'])) if recipe['category'] else None,
+                type_id=self.types.get(name_key(recipe['type'])) if recipe['type'] else None,
+                starred=recipe['starred'],
+                video=recipe['video'],
+                ingredients_count=len(composition),
+            ))
+
+        Dish.objects.bulk_create(dishes)
+        rows = [
+            DishIngredient(dish_id=dish.id, ingredient_id=ingredient_id, quantity=quantity).parse_quantity()
+            for dish, composition in zip(dishes, compositions)
+            for ingredient_id, quantity in composition.items()
+        ]
+        DishIngredient.objects.bulk_create(rows, batch_size=5000)
+        get_search_backend(indexing=True).index_dishes([dish.id for dish in dishes])
+        self.rows += len(rows)
+        return len(dishes)
+
+
+def name_key(name):
+    return name.strip().casefold()
+
+
+def name_map(model):
+    names = {}
+    for pk, name in model.objects.order_by('id').values_list('id', 'name').iterator():
+        names.setdefault(name_key(name), pk)
+    return names
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise CommandError("Cannot detect file format, pass --format")
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_recipes(path, fmt):
+    """Читает записи по одной, не загружая файл в память"""
+    with open_text(path) as fh:
+        if fmt == 'csv':
+            yield from csv.DictReader(fh)
+        else:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_ingredients(value):
+    """
+    Список ингредиентов в одном из видов:
+    [{"name": ..., "quantity": ...}], {"name": "quantity"} или строка CSV
+    "Лук: 1 шт; Соль: по вкусу".
+    """
+    if isinstance(value, dict):
+        return [(name, str(quantity or '')) for name, quantity in value.items()]
+    if isinstance(value, list):
+        return [(item['name'], str(item.get('quantity') or '')) for item in value]
+    items = []
+    for part in (value or '').split(';'):
+        if part.strip():
+            name, _, quantity = part.partition(':')
+            items.append((name, quantity.strip()))
+    return items
+
+
+def normalize_recipe(recipe):
+    title = (recipe.get('title') or '').strip()
+    if not title:
+        raise ValueError("title is required")
+    cooktime = recipe.get('cooktime')
+    starred = recipe.get('starred')
+    if isinstance(starred, str):
+        starred = starred.strip().lower() in ('1', 'true', 'yes')
+    ingredients = [
+        (name.strip(), quantity.strip()[:100])
+        for name, quantity in parse_ingredients(recipe.get('ingredients'))
+        if name.strip()
+    ]
+    return {
+        'title': title[:200],
+        'description': recipe.get('description') or '',
+        'instructions': recipe.get('instructions') or '',
+        'cooktime': int(cooktime) if cooktime not in (None, '') else None,
+        'category': (recipe.get('category') or '').strip(),
+        'type': (recipe.get('type') or '').strip(),
+        'starred': bool(starred),
+        'video': recipe.get('video') or None,
+        'ingredients': ingredients,
+    }
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as fh:
+            return int(fh.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, done):
+    # Запись через временный файл, чтобы обрыв не оставил обрезанный счетчик
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        fh.write(str(done))
+    os.replace(tmp, path)
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from cooking.benchmarking import default_scenarios, load_test, running_server, server_command
+from cooking.models import Dish
+
+# Эндпоинты, у которых есть асинхронная версия под /async/ (см. async_views.py)
+ASYNC_PATHS = ('/dishes/all/', '/dishes/possible/', '/starred/')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the async views under uvicorn (main.asgi) "
+        "with the sync views under gunicorn (main.wsgi) on the same database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dishes', type=int, default=20_000, help="Catalog size to seed into an empty database")
+        parser.add_argument('--concurrency', type=int, default=64, help="Open connections")
+        parser.add_argument('--duration', type=float, default=15.0, help="Seconds per deployment")
+        parser.add_argument('--workers', type=int, default=2, help="Server processes for both deployments")
+        parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--deployment', choices=['asgi', 'wsgi'], action='append',
+                            help="Run only this deployment (repeatable)")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if not Dish.objects.exists():
+            self.stdout.write(f"Seeding {options['dishes']} dishes...")
+            call_command('seed_catalog', dishes=options['dishes'], ingredients=2000, stdout=self.stdout)
+
+        # Глубокая страница — последняя, чтобы на малом каталоге не получить 404
+        last_page = max(1, -(-Dish.objects.count() // 20))
+        requests = [
+            (method, path.replace('page=500', f'page={min(500, last_page)}'), data)
+            for _, method, path, data in default_scenarios()
+            if path.split('?')[0] in ASYNC_PATHS and 'cursor' not in path
+        ]
+        host, port = '127.0.0.1', options['port']
+
+        report = {'concurrency': options['concurrency'], 'workers': options['workers'], 'deployments': {}}
+        for name in options['deployment'] or ['wsgi', 'asgi']:
+            prefix = '/async' if name == 'asgi' else ''
+            command = server_command(name, host, port, options['workers'], options['threads'])
+            with running_server(command, host, port):
+                summary = load_test(
+                    host, port, [(m, prefix + p, d) for m, p, d in requests],
+                    concurrency=options['concurrency'], duration=options['duration'],
+                )
+            report['deployments'][name] = summary
+            self.stdout.write(
+                f"  {name}: {summary['throughput_rps']:>8.1f} req/s   p50 {summary['p50_ms']:>8.2f} ms   "
+                f"p99 {summary['p99_ms']:>8.2f} ms   errors {summary['errors']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from cooking.models import DishIngredient
+from cooking.quantities import parse_quantity
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair DishIngredient.amount and DishIngredient.unit from the free-form quantity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help="Only report rows that need parsing")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        stale = []
+        checked = unparsed = 0
+        rows = DishIngredient.objects.values_list('id', 'quantity', 'amount', 'unit').order_by('id')
+        for row_id, quantity, amount, unit in rows.iterator(chunk_size=batch_size):
+            checked += 1
+            # parse_quantity кэширует строки: повторяющиеся "100 г" разбираются один раз
+            parsed_amount, parsed_unit = parse_quantity(quantity)
+            if parsed_amount is None and quantity.strip():
+                unparsed += 1
+            if amount != parsed_amount or unit != parsed_unit:
+                stale.append((parsed_amount, parsed_unit, row_id))
+
+        if not options['dry_run']:
+            self.write_rows(stale, batch_size)
+
+        action = "would be updated" if options['dry_run'] else "updated"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} rows, {len(stale)} {action}"))
+        if unparsed:
+            self.stdout.write(f"  {unparsed} rows have no numeric amount (e.g. 'по вкусу')")
+
+    def write_rows(self, stale, batch_size):
+        """
+        Один параметризованный UPDATE через executemany: bulk_update строит
+        CASE WHEN на каждую строку, и на сотнях тысяч строк это в десятки раз дольше.
+        """
+        meta = DishIngredient._meta
+        amount_field = meta.get_field('amount')
+        quote = connection.ops.quote_name
+        sql = (
+            f'UPDATE {quote(meta.db_table)} SET {quote(amount_field.column)} = %s, '
+            f'{quote(meta.get_field("unit").column)} = %s WHERE {quote(meta.pk.column)} = %s'
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(stale), batch_size):
+                cursor.executemany(sql, [
+                    (amount_field.get_db_prep_save(amount, connection), unit, row_id)
+                    for amount, unit, row_id in stale[start:start + batch_size]
+                ])
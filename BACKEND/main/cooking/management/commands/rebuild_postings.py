@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cooking.postings import rebuild_postings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ingredient -> dishes posting lists (IngredientPostingList) from DishIngredient"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = rebuild_postings(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} posting lists in {elapsed:.1f}s"))
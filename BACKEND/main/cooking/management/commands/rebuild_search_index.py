@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cooking.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for all dishes"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(indexing=True)
+        started = time.perf_counter()
+        with transaction.atomic():
+            backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt '{backend.name}' search index in {elapsed:.1f}s"))
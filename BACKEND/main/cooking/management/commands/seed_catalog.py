@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cooking.cache import bump_catalog_version
+from cooking.facets import catalog_facets
+from cooking.matching import ingredient_index
+from cooking.postings import rebuild_postings
+from cooking.search import get_search_backend
+from cooking.suggest import INGREDIENTS, suggest_index
+from cooking.synthetic import seed_catalog
+
+
+class Command(BaseCommand):
+    help = "Seed the database with a synthetic catalog for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dishes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--min-per-dish', type=int, default=5)
+        parser.add_argument('--max-per-dish', type=int, default=15)
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--types', type=int, default=10)
+        parser.add_argument('--starred-ratio', type=float, default=0.05)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(dishes, rows):
+            self.stdout.write(f"  {dishes} dishes, {rows} dish ingredients")
+
+        created = seed_catalog(
+            dishes=options['dishes'],
+            ingredients=options['ingredients'],
+            min_per_dish=options['min_per_dish'],
+            max_per_dish=options['max_per_dish'],
+            categories=options['categories'],
+            types=options['types'],
+            starred_ratio=options['starred_ratio'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        # bulk_create не шлет сигналы: сбрасываем кэш ответов и индексы вручную
+        bump_catalog_version()
+        bump_catalog_version(INGREDIENTS)
+        rebuild_postings()
+        get_search_backend(indexing=True).rebuild()
+        if ingredient_index.built:
+            ingredient_index.rebuild()
+        if suggest_index.built:
+            suggest_index.rebuild()
+        if catalog_facets.built:
+            catalog_facets.rebuild()
+
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{count} {name}" for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s"))
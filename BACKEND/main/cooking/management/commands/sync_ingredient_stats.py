@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cooking.models import Dish, DishIngredient
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair Dish.ingredients_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only report out-of-sync dishes")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        ingredients = {}
+        pairs = DishIngredient.objects.values_list('dish_id', 'ingredient_id')
+        for dish_id, ingredient_id in pairs.iterator(chunk_size=5000):
+            ingredients.setdefault(dish_id, set()).add(ingredient_id)
+
+        stale = []
+        checked = 0
+        dishes = Dish.objects.only('id', 'ingredients_count').order_by('id')
+        for dish in dishes.iterator(chunk_size=batch_size):
+            checked += 1
+            ingredient_ids = ingredients.get(dish.id, ())
+            count = len(ingredient_ids)
+            if dish.ingredients_count != count:
+                dish.ingredients_count = count
+                stale.append(dish)
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                Dish.objects.bulk_update(stale, ['ingredients_count'], batch_size=batch_size)
+
+        action = "would be repaired" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} dishes, {len(stale)} {action}"))
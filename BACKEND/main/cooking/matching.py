@@ -0,0 +1,405 @@
+"""
+Оперативный (in-memory) индекс ингредиентов для подбора блюд.
+
+Каждое блюдо хранится как битовая маска своих ингредиентов (Python int),
+поэтому подсчет совпадений с набором пользователя — это одно побитовое И
+и popcount на блюдо, без JOIN и GROUP BY по DishIngredient. В ORM уходит
+только финальная страница id блюд.
+
+Индекс живет в памяти процесса, строится лениво при первом обращении и
+поддерживается сигналами (см. signals.py). Изменения, сделанные другими
+воркерами, видны по версии каталога: при ее смене индекс перечитывает
+блюда с updated_at после прошлой синхронизации и удаленные (DeletedDish).
+Массовые операции, которые не шлют сигналы (bulk_create, QuerySet.update),
+требуют вызова rebuild().
+"""
+import copy
+import heapq
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.filters import OrderingFilter
+
+from .cache import catalog_version, changed_dish_ids
+from .models import Category, Dish, DishIngredient, Type
+from .search import FIELDS, get_search_backend, search_terms
+
+
+def memory_engine_enabled():
+    return getattr(settings, 'COOKING_MATCHING_ENGINE', 'orm') == 'memory'
+
+
+ENTRY_FIELDS = ('id', 'title', 'cooktime', 'category_id', 'type_id', 'starred')
+
+
+class DishEntry:
+    """Сведения о блюде, нужные для подбора, фильтрации и сортировки"""
+
+    __slots__ = ('id', 'title', 'cooktime', 'category_id', 'type_id', 'starred', 'mask', 'total')
+
+    def __init__(self, id, title, cooktime, category_id, type_id, starred, mask=0, total=0):
+        self.id = id
+        self.title = title
+        self.cooktime = cooktime
+        self.category_id = category_id
+        self.type_id = type_id
+        self.starred = starred
+        self.mask = mask
+        self.total = total
+
+
+class DishMatch:
+    """Результат подбора: блюдо и число совпавших ингредиентов"""
+
+    __slots__ = ('entry', 'matching_ingredients_count')
+
+    def __init__(self, entry, matching_ingredients_count):
+        self.entry = entry
+        self.matching_ingredients_count = matching_ingredients_count
+
+    @property
+    def id(self):
+        return self.entry.id
+
+    @property
+    def title(self):
+        return self.entry.title
+
+    @property
+    def cooktime(self):
+        return self.entry.cooktime
+
+    @property
+    def total_ingredients_count(self):
+        return self.entry.total
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (ingredient_id -> номер бита, id -> DishEntry) одним атрибутом: читатель
+        # всегда видит маски и нумерацию бит из одной сборки
+        self._state = ({}, {})
+        self._category_names = {}
+        self._type_names = {}
+        self._groups = None  # (словарь блюд, из которого построены группы, группы)
+        self._version = None  # версия каталога, до которой индекс догнал базу
+        self._synced_at = None
+        self._built = False
+
+    @property
+    def built(self):
+        return self._built
+
+    @staticmethod
+    def _make_mask(ingredient_ids, bits):
+        """Маска ингредиентов; новым ингредиентам выдаются следующие номера бит в bits"""
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            bit = bits.get(ingredient_id)
+            if bit is None:
+                bit = bits[ingredient_id] = len(bits)
+            mask |= 1 << bit
+        return mask
+
+    def rebuild(self):
+        """Полностью перестраивает индекс из базы"""
+        with self._lock:
+            version, started = catalog_version()[0], timezone.now()
+            bits = {}
+            entries = {
+                row[0]: DishEntry(*row)
+                for row in Dish.objects.order_by('id').values_list(*ENTRY_FIELDS).iterator(chunk_size=2000)
+            }
+            ingredients = {}
+            pairs = DishIngredient.objects.values_list('dish_id', 'ingredient_id')
+            for dish_id, ingredient_id in pairs.iterator(chunk_size=5000):
+                ingredients.setdefault(dish_id, set()).add(ingredient_id)
+            for dish_id, ingredient_ids in ingredients.items():
+                entry = entries.get(dish_id)
+                if entry is not None:
+                    entry.mask = self._make_mask(ingredient_ids, bits)
+                    entry.total = len(ingredient_ids)
+
+            self._state = (bits, entries)
+            self._category_names = dict(Category.objects.values_list('id', 'name'))
+            self._type_names = dict(Type.objects.values_list('id', 'name'))
+            self._version, self._synced_at = version, started
+            self._built = True
+
+    def ensure_built(self):
+        """
+        Строит индекс при первом обращении, а при смене версии каталога
+        (изменения из любого процесса, см. cache.py) перечитывает измененные блюда.
+        """
+        version = catalog_version()[0]
+        if self._built and self._version == version:
+            return
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+            elif self._version != version:
+                self.sync()
+
+    def sync(self):
+        """Догоняет базу: блюда, измененные или удаленные после прошлой синхронизации"""
+        with self._lock:
+            version, started = catalog_version()[0], timezone.now()
+            dish_ids = changed_dish_ids(self._synced_at)
+            if len(dish_ids) > len(self._state[1]) // 2:
+                self.rebuild()
+                return
+            self.refresh_dishes(dish_ids)
+            self._category_names = dict(Category.objects.values_list('id', 'name'))
+            self._type_names = dict(Type.objects.values_list('id', 'name'))
+            self._version, self._synced_at = version, started
+
+    def refresh_dishes(self, dish_ids):
+        """Перечитывает блюда и их ингредиенты из базы; отсутствующие удаляются"""
+        if not self._built or not dish_ids:
+            return
+        dish_ids = set(dish_ids)
+        rows = list(Dish.objects.filter(id__in=dish_ids).values_list(*ENTRY_FIELDS))
+        ingredients = {}
+        pairs = DishIngredient.objects.filter(dish_id__in=dish_ids).values_list('dish_id', 'ingredient_id')
+        for dish_id, ingredient_id in pairs:
+            ingredients.setdefault(dish_id, set()).add(ingredient_id)
+        with self._lock:
+            # Копии словарей: читатели в других потоках обходят старую версию
+            bits, entries = dict(self._state[0]), dict(self._state[1])
+            for dish_id in dish_ids:
+                entries.pop(dish_id, None)
+            last_id = next(reversed(entries), None)
+            unordered = False
+            for row in rows:
+                entry = DishEntry(*row)
+                ingredient_ids = ingredients.get(entry.id, ())
+                entry.mask = self._make_mask(ingredient_ids, bits)
+                entry.total = len(ingredient_ids)
+                entries[entry.id] = entry
+                unordered = unordered or (last_id is not None and entry.id < last_id)
+                last_id = entry.id
+            if unordered:
+                entries = dict(sorted(entries.items()))
+            self._state = (bits, entries)
+
+    def remove_dish(self, dish_id):
+        if not self._built:
+            return
+        with self._lock:
+            bits, entries = self._state
+            entries = dict(entries)
+            entries.pop(dish_id, None)
+            self._state = (bits, entries)
+
+    def set_category_name(self, category_id, name):
+        if self._built:
+            with self._lock:
+                self._category_names = {**self._category_names, category_id: name}
+
+    def set_type_name(self, type_id, name):
+        if self._built:
+            with self._lock:
+                self._type_names = {**self._type_names, type_id: name}
+
+    def pantry_mask(self, ingredient_ids, bits=None):
+        """Маска набора пользователя; неизвестные ингредиенты не влияют на результат"""
+        if bits is None:
+            bits = self._state[0]
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            try:
+                bit = bits.get(int(ingredient_id))
+            except (TypeError, ValueError):
+                continue
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def match(self, ingredient_ids, willing_to_buy):
+        """
+        Возвращает список DishMatch с той же семантикой, что и ORM-запрос
+        в PossibleDishesListView: при willing_to_buy — блюда хотя бы с одним
+        совпадением, иначе — блюда, все ингредиенты которых есть у пользователя.
+        """
+        return self.match_many([(ingredient_ids, willing_to_buy)])[0]
+
+    def match_many(self, pantries):
+        """
+        Подбор для нескольких наборов [(ingredient_ids, willing_to_buy), ...]
+        за один проход по блюдам; возвращает списки DishMatch в том же порядке.
+        """
+        self.ensure_built()
+        bits, entries = self._state
+        masks = [(self.pantry_mask(ids, bits), willing) for ids, willing in pantries]
+        results = [[] for _ in masks]
+        for entry in entries.values():
+            mask = entry.mask
+            for pantry, (pantry_mask, willing) in zip(results, masks):
+                if willing:
+                    count = (mask & pantry_mask).bit_count()
+                    if count:
+                        pantry.append(DishMatch(entry, count))
+                elif mask & pantry_mask == mask:
+                    pantry.append(DishMatch(entry, entry.total))
+        return results
+
+    def groups_by_total(self, entries=None):
+        """
+        Блюда, сгруппированные по числу ингредиентов, по возрастанию. Строится
+        лениво и переиспользуется, пока словарь блюд не заменят при изменении.
+        """
+        if entries is None:
+            entries = self._state[1]
+        groups = self._groups
+        if groups is None or groups[0] is not entries:
+            by_total = {}
+            for entry in entries.values():
+                by_total.setdefault(entry.total, []).append(entry)
+            groups = self._groups = (entries, sorted(by_total.items()))
+        return groups[1]
+
+    def top_k(self, ingredient_ids, limit, min_ratio=0.0, tie_break='cooktime', predicate=None):
+        """
+        Лучшие limit блюд по доле имеющихся ингредиентов (matching / total).
+
+        Блюда просматриваются группами по возрастанию total: доля в группе не
+        больше min(p, total) / total, где p — размер набора, и эта граница
+        не растет. Как только граница группы ниже min_ratio или худшего
+        элемента в куче из limit лучших, просмотр заканчивается — остальной
+        каталог не читается и не сортируется.
+        """
+        self.ensure_built()
+        bits, dishes = self._state
+        pantry = self.pantry_mask(ingredient_ids, bits)
+        pantry_size = pantry.bit_count()
+        heap = []
+        for total, entries in self.groups_by_total(dishes):
+            if not total:
+                continue
+            bound = min(pantry_size, total) / total
+            if bound < min_ratio or (len(heap) == limit and bound < heap[0][0][0]):
+                break
+            for entry in entries:
+                count = (entry.mask & pantry).bit_count()
+                if not count:
+                    continue
+                ratio = count / total
+                if ratio < min_ratio or (predicate is not None and not predicate(entry)):
+                    continue
+                # Больше — лучше: доля, затем признак для равных долей, затем меньший id
+                if tie_break == 'starred':
+                    tie = 1 if entry.starred else 0
+                else:
+                    tie = -entry.cooktime if entry.cooktime is not None else float('-inf')
+                item = ((ratio, tie, -entry.id), DishMatch(entry, count))
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item[0] > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+        return [match for _, match in sorted(heap, key=lambda item: item[0], reverse=True)]
+
+    def category_name(self, entry):
+        return self._category_names.get(entry.category_id)
+
+    def type_name(self, entry):
+        return self._type_names.get(entry.type_id)
+
+
+ingredient_index = IngredientIndex()
+
+
+def _sort_key(field, index):
+    if field == 'title':
+        return lambda match: match.entry.title
+    if field == 'cooktime':
+        # NULL в SQLite при сортировке по возрастанию идет первым
+        return lambda match: (match.entry.cooktime is not None, match.entry.cooktime or 0)
+    if field == 'matching_ingredients_count':
+        return lambda match: match.matching_ingredients_count
+    if field == 'category__name':
+        return lambda match: index.category_name(match.entry) or ''
+    if field == 'type__name':
+        return lambda match: index.type_name(match.entry) or ''
+    return lambda match: match.entry.id
+
+
+def build_predicate(params, index=ingredient_index):
+    """
+    Условие на DishEntry по фильтрам PossibleDishesListView.apply_filters:
+    category/type/cooktime, category__name, type__name, а также title и search
+    через тот же поисковый бэкенд, что и для ORM. None — если фильтров нет.
+    """
+    checks = []
+
+    category = params.get('category') or params.get('category__name')
+    if category:
+        checks.append(lambda entry: index.category_name(entry) == category)
+
+    dish_type = params.get('type') or params.get('type__name')
+    if dish_type:
+        checks.append(lambda entry: index.type_name(entry) == dish_type)
+
+    # Query-параметры приходят строками, фильтры пакетного запроса — числами (в том числе 0)
+    cooktime_min = params.get('cooktime_min')
+    if cooktime_min not in (None, ''):
+        cooktime_min = int(cooktime_min)
+        checks.append(lambda entry: entry.cooktime is not None and entry.cooktime >= cooktime_min)
+
+    cooktime_max = params.get('cooktime_max')
+    if cooktime_max not in (None, ''):
+        cooktime_max = int(cooktime_max)
+        checks.append(lambda entry: entry.cooktime is not None and entry.cooktime <= cooktime_max)
+
+    for param, fields in (('title', ('title',)), ('search', FIELDS)):
+        query = str(params.get(param) or '')
+        if search_terms(query):
+            found = get_search_backend().matching_ids(query, fields)
+            checks.append(lambda entry, found=found: entry.id in found)
+
+    if not checks:
+        return None
+    return lambda entry: all(check(entry) for check in checks)
+
+
+def filter_matches(matches, params, ordering, index=ingredient_index):
+    """
+    Повторяет PossibleDishesListView.apply_filters для результатов в памяти:
+    фильтры из params (см. build_predicate) и сортировка ordering. Сортировки
+    по релевантности поиска здесь нет.
+    """
+    predicate = build_predicate(params, index)
+    if predicate is not None:
+        matches = [m for m in matches if predicate(m.entry)]
+
+    for field in reversed(ordering):
+        descending = field.startswith('-')
+        matches.sort(key=_sort_key(field.lstrip('-'), index), reverse=descending)
+
+    return matches
+
+
+def request_ordering(request, view):
+    """Сортировка запроса так же, как ее выбрал бы OrderingFilter для ORM"""
+    return OrderingFilter().get_ordering(request, Dish.objects.none(), view) or []
+
+
+def load_dishes(matches, dishes=None):
+    """
+    Загружает из базы только блюда страницы, сохраняя порядок и счетчики.
+    dishes — уже загруженный словарь id -> Dish (например, общий для пакета);
+    блюда копируются, чтобы одно блюдо могло нести разные счетчики.
+    """
+    if dishes is None:
+        dishes = Dish.objects.in_bulk([match.id for match in matches])
+    page = []
+    for match in matches:
+        dish = dishes.get(match.id)
+        if dish is None:
+            continue
+        dish = copy.copy(dish)
+        dish.matching_ingredients_count = match.matching_ingredients_count
+        dish.total_ingredients_count = match.total_ingredients_count
+        page.append(dish)
+    return page
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+def backfill_ingredient_stats(apps, schema_editor):
+    Dish = apps.get_model('cooking', 'Dish')
+    DishIngredient = apps.get_model('cooking', 'DishIngredient')
+
+    ingredients = {}
+    for dish_id, ingredient_id in DishIngredient.objects.values_list('dish_id', 'ingredient_id').iterator():
+        ingredients.setdefault(dish_id, set()).add(ingredient_id)
+
+    dishes = []
+    for dish in Dish.objects.only('id').iterator():
+        ingredient_ids = ingredients.get(dish.id, ())
+        dish.ingredients_count = len(ingredient_ids)
+        dish.ingredients_signature = 0
+        for ingredient_id in ingredient_ids:
+            dish.ingredients_signature |= 1 << (ingredient_id % 63)
+        dishes.append(dish)
+    Dish.objects.bulk_update(dishes, ['ingredients_count', 'ingredients_signature'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0002_type_dish_photo_dish_video_dish_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of distinct ingredients'),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='ingredients_signature',
+            field=models.BigIntegerField(default=0, help_text='Bloom signature of ingredient ids'),
+        ),
+        migrations.RunPython(backfill_ingredient_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+def merge_duplicate_dish_ingredients(apps, schema_editor):
+    """Перед уникальным ограничением сливаем повторы ингредиента в блюде в одну строку"""
+    DishIngredient = apps.get_model('cooking', 'DishIngredient')
+
+    seen = {}
+    merged = {}
+    duplicates = []
+    for row in DishIngredient.objects.order_by('id').iterator():
+        first = seen.setdefault((row.dish_id, row.ingredient_id), row)
+        if first is not row:
+            first.quantity = f'{first.quantity} + {row.quantity}'[:100]
+            merged[first.id] = first
+            duplicates.append(row.id)
+
+    DishIngredient.objects.bulk_update(merged.values(), ['quantity'], batch_size=500)
+    for start in range(0, len(duplicates), 500):
+        DishIngredient.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0003_dish_ingredient_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='type',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['title', 'id'], name='dish_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['cooktime', 'id'], name='dish_cooktime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(condition=models.Q(('starred', True)), fields=['title', 'id'], name='dish_starred_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dishingredient',
+            index=models.Index(fields=['ingredient', 'dish'], name='ingredient_dish_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_dish_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dishingredient',
+            constraint=models.UniqueConstraint(fields=('dish', 'ingredient'), name='dish_ingredient_unique'),
+        ),
+    ]
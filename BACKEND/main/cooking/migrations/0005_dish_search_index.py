@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:20
+
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Без FTS5 поиск работает через LIKE (см. cooking/search.py)
+                return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE cooking_dish_fts USING fts5("
+            "title, description, instructions, ingredients, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO cooking_dish_fts (rowid, title, description, instructions, ingredients) "
+            "SELECT d.id, d.title, d.description, d.instructions, "
+            "COALESCE((SELECT group_concat(i.name, ' ') FROM cooking_dishingredient di "
+            "JOIN cooking_ingredient i ON i.id = di.ingredient_id WHERE di.dish_id = d.id), '') "
+            "FROM cooking_dish d"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE cooking_dish_search ("
+            "dish_id bigint PRIMARY KEY REFERENCES cooking_dish (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX cooking_dish_search_document_idx ON cooking_dish_search USING GIN (document)"
+        )
+        # Тот же документ, что у PostgresSearchBackend.document_sql; словарь — из настроек
+        config = getattr(settings, 'COOKING_SEARCH_CONFIG', 'russian')
+        schema_editor.execute(
+            "INSERT INTO cooking_dish_search (dish_id, document) "
+            "SELECT d.id, "
+            "setweight(to_tsvector(%s::regconfig, d.title), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE((SELECT string_agg(i.name, ' ') "
+            "FROM cooking_dishingredient di JOIN cooking_ingredient i ON i.id = di.ingredient_id "
+            "WHERE di.dish_id = d.id), '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, d.description), 'C') || "
+            "setweight(to_tsvector(%s::regconfig, d.instructions), 'D') "
+            "FROM cooking_dish d",
+            [config] * 4,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS cooking_dish_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS cooking_dish_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
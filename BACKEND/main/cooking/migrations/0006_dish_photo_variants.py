@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:19
+
+import cooking.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0005_dish_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='photo',
+            field=cooking.images.HashedImageField(null=True, upload_to=cooking.images.dish_photo_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0006_dish_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dishingredient',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='dishingredient',
+            name='unit',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:30
+
+import sys
+from array import array
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def pack(dish_ids):
+    # Копия cooking.postings.pack на момент миграции: отсортированные int64 little-endian
+    values = array('q', sorted(dish_ids))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def build_posting_lists(apps, schema_editor):
+    DishIngredient = apps.get_model('cooking', 'DishIngredient')
+    IngredientPostingList = apps.get_model('cooking', 'IngredientPostingList')
+
+    dishes = {}
+    for ingredient_id, dish_id in DishIngredient.objects.values_list('ingredient_id', 'dish_id').iterator():
+        dishes.setdefault(ingredient_id, []).append(dish_id)
+    IngredientPostingList.objects.bulk_create(
+        [
+            IngredientPostingList(
+                ingredient_id=ingredient_id, dish_ids=pack(dish_ids), dish_count=len(dish_ids),
+            )
+            for ingredient_id, dish_ids in dishes.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0007_dishingredient_amount_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientPostingList',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='postings', serialize=False, to='cooking.ingredient')),
+                ('dish_ids', models.BinaryField()),
+                ('dish_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_posting_lists, migrations.RunPython.noop),
+    ]
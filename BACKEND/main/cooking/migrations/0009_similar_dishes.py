@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0008_ingredient_posting_lists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarDish',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_dishes', to='cooking.dish')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cooking.dish')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dish', 'rank'), name='similar_dish_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0009_similar_dishes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientSubstitution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost', models.PositiveSmallIntegerField(default=1)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitutions', to='cooking.ingredient')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cooking.ingredient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('ingredient', 'substitute'), name='ingredient_substitution_unique')],
+            },
+        ),
+    ]
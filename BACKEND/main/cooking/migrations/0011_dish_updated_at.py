@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0010_ingredient_substitutions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['updated_at'], name='dish_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_catalog_version(apps, schema_editor):
+    # Строка нужна заранее: первое увеличение версии — атомарный UPDATE
+    apps.get_model('cooking', 'CatalogVersion').objects.get_or_create(scope='catalog')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0011_dish_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('scope', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=1)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0012_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedDish',
+            fields=[
+                ('dish_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0013_deleted_dishes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dish',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of distinct ingredients'),
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='ingredients_signature',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Bloom signature of ingredient ids'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cooking', '0014_dish_stats_not_editable'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dish',
+            name='ingredients_signature',
+        ),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+from django.utils import timezone
+
+from .images import HashedImageField, dish_photo_path
+from .quantities import AMOUNT_MAX_DIGITS, parse_quantity
 
 class Dish(models.Model):
     title = models.CharField(max_length=200)
@@ -8,12 +12,56 @@ class Dish(models.Model):
     category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, blank=True)
     type = models.ForeignKey('Type', on_delete=models.SET_NULL, null=True, blank=True)
     starred = models.BooleanField(default=False)
-    photo = models.ImageField(null=True)
+    photo = HashedImageField(null=True, upload_to=dish_photo_path)
+    # Уменьшенные WebP/JPEG варианты фото, заполняются cooking/images.py
+    photo_variants = models.JSONField(default=dict, blank=True)
     video = models.CharField(max_length=300,null=True)
+    # Денормализованные данные о составе, поддерживаются сигналами DishIngredient
+    # и refresh_ingredient_stats(); обычный save() их не перезаписывает
+    ingredients_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of distinct ingredients"
+    )
+    # Время последнего изменения блюда в выгрузке (export.py): состав, фото,
+    # названия категории, типа и ингредиентов тоже обновляют его
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Сортировка и keyset-пагинация по title/cooktime с id для уникальной позиции
+            models.Index(fields=['title', 'id'], name='dish_title_idx'),
+            models.Index(fields=['cooktime', 'id'], name='dish_cooktime_idx'),
+            # Избранных мало, поэтому частичный индекс компактнее полного по starred
+            models.Index(fields=['title', 'id'], condition=models.Q(starred=True), name='dish_starred_title_idx'),
+            # Инкрементальная выгрузка ?since=
+            models.Index(fields=['updated_at'], name='dish_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.title 
 
+    # Пишутся только при создании блюда, refresh_ingredient_stats() и явным update_fields
+    stats_fields = frozenset({'ingredients_count'})
+
+    def save(self, *args, **kwargs):
+        # Экземпляр, загруженный до изменения состава, не должен затереть
+        # пересчитанные сигналами значения устаревшими
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name not in self.stats_fields
+            ]
+        super().save(*args, **kwargs)
+
+    def refresh_ingredient_stats(self):
+        """Пересчитывает ingredients_count по DishIngredient"""
+        ingredient_ids = set(self.dishingredient_set.values_list('ingredient_id', flat=True))
+        self.ingredients_count = len(ingredient_ids)
+        Dish.objects.filter(pk=self.pk).update(
+            ingredients_count=self.ingredients_count,
+            updated_at=timezone.now(),
+        )
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=100)
 
@@ -24,18 +72,102 @@ class DishIngredient(models.Model):
     dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     quantity = models.CharField(max_length=100)
+    # Разобранное quantity в базовой единице (г, мл, шт или слово); None — без числа ("по вкусу")
+    amount = models.DecimalField(max_digits=AMOUNT_MAX_DIGITS, decimal_places=3, null=True, blank=True)
+    unit = models.CharField(max_length=20, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dish', 'ingredient'], name='dish_ingredient_unique'),
+        ]
+        indexes = [
+            # Поиск блюд по ингредиентам пользователя идет со стороны ингредиента
+            models.Index(fields=['ingredient', 'dish'], name='ingredient_dish_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity} of {self.ingredient.name} for {self.dish.title}"
 
+    def parse_quantity(self):
+        """Заполняет amount и unit по quantity; для bulk_create вызывается вручную"""
+        self.amount, self.unit = parse_quantity(self.quantity)
+        return self
+
+    def save(self, *args, **kwargs):
+        self.parse_quantity()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'amount', 'unit'}
+        super().save(*args, **kwargs)
+
+class IngredientSubstitution(models.Model):
+    """ingredient из рецепта можно заменить на substitute; cost — цена замены (меньше — лучше)"""
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='substitutions')
+    substitute = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='+')
+    cost = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ingredient', 'substitute'], name='ingredient_substitution_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient_id} -> {self.substitute_id} ({self.cost})"
+
+class CatalogVersion(models.Model):
+    """
+    Версия данных: 'catalog' — для кэша ответов и индексов в памяти (см. cache.py),
+    'substitutions' — для графа замен (substitutions.py), 'ingredients' — для
+    автодополнения ингредиентов (suggest.py)
+    """
+    scope = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=1)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version} ({self.modified})"
+
+class IngredientPostingList(models.Model):
+    """Отсортированные id блюд с ингредиентом, упакованные в blob (см. postings.py)"""
+    ingredient = models.OneToOneField(Ingredient, on_delete=models.CASCADE, primary_key=True, related_name='postings')
+    dish_ids = models.BinaryField()
+    dish_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.ingredient_id}: {self.dish_count} dishes"
+
+class DeletedDish(models.Model):
+    """Удаленное блюдо для инкрементальной выгрузки ?since= (см. export.py)"""
+    dish_id = models.BigIntegerField(primary_key=True)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.dish_id} deleted at {self.deleted_at}"
+
+class SimilarDish(models.Model):
+    """Сосед блюда по составу: мера Жаккара наборов ингредиентов (см. similar.py)"""
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='similar_dishes')
+    similar = models.ForeignKey(Dish, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # Индекс уникальности отдает соседей блюда по порядку одним проходом
+            models.UniqueConstraint(fields=['dish', 'rank'], name='similar_dish_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.dish_id} ~ {self.similar_id}: {self.score:.2f}"
+
 class Type(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
 
     def __str__(self):
         return self.name
         
 class Category(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
 
     def __str__(self):
         return self.name
@@ -0,0 +1,229 @@
+"""
+Keyset (cursor) пагинация для списков блюд.
+
+В отличие от PageNumberPagination не делает COUNT(*) и не сканирует OFFSET:
+курсор хранит значения полей сортировки последней строки страницы, и
+следующая страница выбирается условием «строго после этой позиции».
+Время ответа поэтому не зависит от глубины листания.
+
+Включается параметром ?pagination=cursor (или просто наличием ?cursor=).
+Общее количество считается только по запросу ?count=true.
+Работает и с QuerySet, и со списками результатов движка в памяти.
+"""
+import base64
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .matching import request_ordering
+
+
+def get_paginator(request, default_class):
+    """Пагинатор для запроса: keyset, если клиент его запросил, иначе default_class"""
+    params = request.query_params
+    if params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in params:
+        return KeysetPagination()
+    return default_class()
+
+
+class CursorPaginationMixin:
+    """Подменяет пагинатор ListAPIView на KeysetPagination по запросу клиента"""
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = get_paginator(self.request, self.pagination_class)
+        return self._paginator
+
+
+def _row_value(row, field):
+    value = row
+    for part in field.split('__'):
+        value = getattr(value, part, None)
+        if value is None:
+            break
+    return value
+
+
+def _compare(a, b):
+    """Сравнение с NULL в начале (как при сортировке по возрастанию)"""
+    if a is None or b is None:
+        return (a is not None) - (b is not None)
+    return (a > b) - (a < b)
+
+
+class KeysetPagination(BasePagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 20
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(queryset, view)
+        position, self.reverse = self.decode_cursor(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = len(queryset) if isinstance(queryset, list) else queryset.count()
+
+        if isinstance(queryset, list):
+            rows = self.slice_list(queryset, position)
+        else:
+            rows = self.slice_queryset(queryset, position)
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, position is not None
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.first = self.position(rows[0]) if rows else position
+        self.last = self.position(rows[-1]) if rows else position
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset, view):
+        """Поля сортировки с id в конце, чтобы позиция была уникальной"""
+        if isinstance(queryset, list):
+            # Список уже отсортирован движком в памяти тем же OrderingFilter
+            ordering = request_ordering(self.request, view)
+        else:
+            ordering = [f for f in queryset.query.order_by if isinstance(f, str)]
+            if not ordering:
+                ordering = list(getattr(view, 'ordering', None) or [])
+        ordering = [f.replace('pk', 'id') if f.lstrip('-') == 'pk' else f for f in ordering]
+        if not any(f.lstrip('-') == 'id' for f in ordering):
+            ordering.append('id')
+        return ordering
+
+    def position(self, row):
+        return [_row_value(row, f.lstrip('-')) for f in self.fields]
+
+    def slice_queryset(self, queryset, position):
+        order = []
+        for field in self.fields:
+            descending = field.startswith('-') != self.reverse
+            name = field.lstrip('-')
+            if _nullable(queryset.model, name):
+                # NULL явно в начале при возрастании, чтобы порядок не зависел от СУБД
+                order.append(F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True))
+            else:
+                # Без NULLS FIRST/LAST SQLite может идти по индексу (title, id) без сортировки
+                order.append(F(name).desc() if descending else F(name).asc())
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            queryset = queryset.filter(self.after_condition(position))
+        return list(queryset[:self.page_size + 1])
+
+    def after_condition(self, position):
+        """Лексикографическое условие «строка идет после position»"""
+        branches = []
+        equal = []
+        for field, value in zip(self.fields, position):
+            name = field.lstrip('-')
+            after = _after(name, value, field.startswith('-') != self.reverse)
+            if after is not None:
+                branches.append(reduce(and_, equal + [after]))
+            equal.append(Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value}))
+        return reduce(or_, branches) if branches else Q(pk__in=[])
+
+    def slice_list(self, rows, position):
+        if self.reverse:
+            rows = rows[::-1]
+        if position is not None:
+            rows = [row for row in rows if self.is_after(self.position(row), position)]
+        return rows[:self.page_size + 1]
+
+    def is_after(self, values, position):
+        for field, value, reference in zip(self.fields, values, position):
+            result = _compare(value, reference)
+            if field.startswith('-') != self.reverse:
+                result = -result
+            if result:
+                return result > 0
+        return False
+
+    def encode_cursor(self, position, reverse):
+        raw = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            data = json.loads(raw)
+            position, reverse = data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound('Invalid cursor')
+        return position, reverse
+
+    def get_link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        url = replace_query_param(url, 'pagination', 'cursor')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.get_link(self.last, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.get_link(self.first, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+
+def _nullable(model, name):
+    """Может ли поле сортировки быть NULL (аннотации и связи считаем NOT NULL)"""
+    try:
+        return model._meta.get_field(name).null
+    except FieldDoesNotExist:
+        return False
+
+
+def _after(name, value, descending):
+    """Условие «поле строго после value»; NULL идет первым по возрастанию и последним по убыванию"""
+    if descending:
+        if value is None:
+            return None
+        return Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+    if value is None:
+        return Q(**{f'{name}__isnull': False})
+    return Q(**{f'{name}__gt': value})
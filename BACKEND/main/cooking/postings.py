@@ -0,0 +1,173 @@
+"""
+Материализованный инвертированный индекс ингредиент -> блюда.
+
+IngredientPostingList хранит для каждого ингредиента отсортированные id
+блюд, упакованные в blob (массив 64-битных целых little-endian). Кандидаты
+для /dishes/possible/ (COOKING_MATCHING_ENGINE = 'postings') получаются
+слиянием списков ингредиентов пользователя: число списков, в которых
+встретилось блюдо, и есть число совпавших ингредиентов. Объем работы
+зависит от длины этих нескольких списков, а не от размера каталога.
+
+Списки пересчитываются после коммита изменения DishIngredient, каждый
+затронутый транзакцией — один раз (см. signals.py); после массовой
+загрузки в обход сигналов нужен manage.py rebuild_postings.
+"""
+import json
+import sys
+from array import array
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.lookups import In, Lookup
+
+from .models import Dish, DishIngredient, IngredientPostingList
+
+# При большем числе кандидатов слияние в Python не быстрее обычного запроса
+DEFAULT_MAX_CANDIDATES = 50000
+
+
+def postings_engine_enabled():
+    return getattr(settings, 'COOKING_MATCHING_ENGINE', 'orm') == 'postings'
+
+
+def max_candidates():
+    return getattr(settings, 'COOKING_POSTINGS_MAX_CANDIDATES', DEFAULT_MAX_CANDIDATES)
+
+
+def pack(dish_ids):
+    values = array('q', sorted(dish_ids))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack(blob):
+    values = array('q')
+    values.frombytes(bytes(blob))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class InIdList(Lookup):
+    """
+    id IN (список) одним параметром: json_each на SQLite, = ANY(array) на Postgres.
+    Тысячи отдельных параметров IN долго собираются в Django и упираются
+    в лимит переменных SQLite.
+    """
+
+    lookup_name = 'in_id_list'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return In(self.lhs, self.rhs).as_sql(compiler, connection)
+        lhs, params = self.process_lhs(compiler, connection)
+        if connection.vendor == 'sqlite':
+            return f'{lhs} IN (SELECT value FROM json_each(%s))', [*params, json.dumps(list(self.rhs))]
+        return f'{lhs} = ANY(%s)', [*params, list(self.rhs)]
+
+
+def refresh_postings(ingredient_ids):
+    """Пересчитывает списки указанных ингредиентов по DishIngredient"""
+    ingredient_ids = set(ingredient_ids)
+    dishes = {ingredient_id: [] for ingredient_id in ingredient_ids}
+    rows = DishIngredient.objects.filter(ingredient_id__in=ingredient_ids).values_list('ingredient_id', 'dish_id')
+    for ingredient_id, dish_id in rows:
+        dishes[ingredient_id].append(dish_id)
+
+    empty = [ingredient_id for ingredient_id, dish_ids in dishes.items() if not dish_ids]
+    with transaction.atomic():
+        # Пустой список не храним: ингредиент мог быть только что удален
+        IngredientPostingList.objects.filter(ingredient_id__in=empty).delete()
+        IngredientPostingList.objects.bulk_create(
+            [
+                IngredientPostingList(ingredient_id=ingredient_id, dish_ids=pack(dish_ids), dish_count=len(dish_ids))
+                for ingredient_id, dish_ids in dishes.items() if dish_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['ingredient'],
+            update_fields=['dish_ids', 'dish_count'],
+        )
+
+
+def rebuild_postings(batch_size=1000):
+    """Полностью перестраивает таблицу; возвращает число списков"""
+    rows = DishIngredient.objects.order_by('ingredient_id', 'dish_id').values_list('ingredient_id', 'dish_id')
+    created = 0
+    with transaction.atomic():
+        IngredientPostingList.objects.all().delete()
+        batch = []
+        current, dish_ids = None, []
+        for ingredient_id, dish_id in rows.iterator(chunk_size=5000):
+            if ingredient_id != current:
+                if dish_ids:
+                    batch.append(IngredientPostingList(
+                        ingredient_id=current, dish_ids=pack(dish_ids), dish_count=len(dish_ids),
+                    ))
+                current, dish_ids = ingredient_id, []
+            dish_ids.append(dish_id)
+            if len(batch) >= batch_size:
+                IngredientPostingList.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if dish_ids:
+            batch.append(IngredientPostingList(ingredient_id=current, dish_ids=pack(dish_ids), dish_count=len(dish_ids)))
+        IngredientPostingList.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+
+def matching_counts(ingredient_ids):
+    """
+    Слияние списков ингредиентов пользователя: {число совпавших ингредиентов: [id блюд]}.
+    None, если кандидатов больше COOKING_POSTINGS_MAX_CANDIDATES.
+    """
+    blobs = IngredientPostingList.objects.filter(ingredient_id__in=set(ingredient_ids)).values_list(
+        'dish_ids', flat=True
+    )
+    counts = Counter()
+    for blob in blobs:
+        counts.update(unpack(blob))
+    if len(counts) > max_candidates():
+        return None
+    groups = {}
+    for dish_id, count in counts.items():
+        groups.setdefault(count, []).append(dish_id)
+    return groups
+
+
+def postings_queryset(ingredient_ids, willing_to_buy):
+    """
+    Queryset подбора с теми же аннотациями и порядком, что у ORM-движка
+    в PossibleDishesListView, но по кандидатам из списков. None — если
+    кандидатов слишком много.
+    """
+    groups = matching_counts(ingredient_ids)
+    if groups is None:
+        return None
+    if willing_to_buy:
+        # Хотя бы одно совпадение: все кандидаты, число совпадений — из слияния
+        candidates = [dish_id for dish_ids in groups.values() for dish_id in dish_ids]
+        matching = Case(
+            *(When(InIdList(F('id'), dish_ids), then=Value(count)) for count, dish_ids in groups.items()),
+            default=Value(0), output_field=IntegerField(),
+        )
+        return Dish.objects.filter(InIdList(F('id'), candidates)).annotate(
+            matching_ingredients_count=matching,
+            total_ingredients_count=F('ingredients_count'),
+        ).order_by('-matching_ingredients_count', 'title')
+
+    # Приготовить полностью: совпали все ингредиенты блюда; блюда без ингредиентов — всегда
+    condition = reduce(
+        or_, (Q(InIdList(F('id'), dish_ids), ingredients_count=count) for count, dish_ids in sorted(groups.items())),
+        Q(ingredients_count=0),
+    )
+    return Dish.objects.filter(condition).annotate(
+        matching_ingredients_count=F('ingredients_count'),
+        total_ingredients_count=F('ingredients_count'),
+    ).order_by('title')
@@ -0,0 +1,120 @@
+"""
+Разбор свободного текста DishIngredient.quantity в число и единицу.
+
+Количество приводится к базовой единице своей величины, чтобы его можно
+было суммировать в SQL:
+
+    'г'   — масса (кг, мг переводятся в граммы);
+    'мл'  — объем (л, ст. л. = 15 мл, ч. л. = 5 мл, стакан = 250 мл);
+    'шт'  — штуки, а также число без единицы ('2');
+    прочие слова ('зубчик', 'щепотка') остаются своей единицей.
+
+Понимает целые и дробные числа ('1,5', '1/2', '1 1/2', '½'), диапазоны
+('2-3' — берется верхняя граница, для списка покупок) и суммы частей
+через '+' с одной единицей. Текст без числа ('по вкусу') дает amount=None.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+AMOUNT_PLACES = Decimal('0.001')
+# Разрядность DishIngredient.amount; большее число считается неразобранным
+AMOUNT_MAX_DIGITS = 12
+AMOUNT_LIMIT = Decimal(10) ** (AMOUNT_MAX_DIGITS - 3)
+
+# Синонимы (в нижнем регистре, без точек) -> (базовая единица, множитель)
+UNITS = {}
+for base, factor, names in (
+    ('г', '1', ['г', 'гр', 'грамм', 'грамма', 'граммов', 'g']),
+    ('г', '1000', ['кг', 'килограмм', 'килограмма', 'килограммов', 'kg']),
+    ('г', '0.001', ['мг', 'mg']),
+    ('мл', '1', ['мл', 'миллилитр', 'миллилитра', 'миллилитров', 'ml']),
+    ('мл', '1000', ['л', 'литр', 'литра', 'литров', 'l']),
+    ('мл', '15', ['ст л', 'ст ложка', 'ст ложки', 'ст ложек', 'столовая ложка', 'столовые ложки',
+                  'столовых ложек', 'tbsp']),
+    ('мл', '5', ['ч л', 'ч ложка', 'ч ложки', 'ч ложек', 'чайная ложка', 'чайные ложки',
+                 'чайных ложек', 'tsp']),
+    ('мл', '250', ['стакан', 'стакана', 'стаканов', 'cup']),
+    ('шт', '1', ['шт', 'штука', 'штуки', 'штук', 'pcs']),
+):
+    for name in names:
+        UNITS[name] = (base, Decimal(factor))
+# Сначала длинные названия: 'ст л' не должно разобраться как 'с...'
+UNIT_NAMES = sorted(UNITS, key=len, reverse=True)
+
+FRACTIONS = {'½': '1/2', '¼': '1/4', '¾': '3/4', '⅓': '1/3', '⅔': '2/3', '⅛': '1/8'}
+NUMBER = r'\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?(?:\s+\d+\s*/\s*\d+)?'
+AMOUNT_RE = re.compile(rf'^\s*(?P<low>{NUMBER})(?:\s*[-–—]\s*(?P<high>{NUMBER}))?\s*(?P<rest>.*)$')
+
+
+def _number(text):
+    """'1', '1,5', '1/2', '1 1/2' -> Decimal"""
+    total = Decimal(0)
+    for part in text.replace(',', '.').split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += Decimal(numerator) / Decimal(denominator)
+        else:
+            total += Decimal(part)
+    return total
+
+
+def _unit(rest):
+    """Единица в начале остатка строки: (базовая единица, множитель)"""
+    words = re.sub(r'[.\s]+', ' ', rest.lower()).strip()
+    if not words:
+        return 'шт', Decimal(1)
+    for name in UNIT_NAMES:
+        if words == name or words.startswith(name + ' ') or words.startswith(name + '('):
+            return UNITS[name]
+    # Неизвестная единица: первое слово как есть ('зубчик', 'щепотка')
+    word = re.match(r'[^\W\d_]+', words)
+    return (word.group(0)[:20] if word else ''), Decimal(1)
+
+
+def _parse_part(text):
+    for symbol, fraction in FRACTIONS.items():
+        # '1½' -> '1 1/2'
+        text = re.sub(rf'(\d)\s*{symbol}', rf'\1 {fraction}', text).replace(symbol, fraction)
+    match = AMOUNT_RE.match(text)
+    if not match:
+        return None, ''
+    try:
+        amount = _number(match.group('high') or match.group('low'))
+    except (InvalidOperation, ZeroDivisionError):
+        return None, ''
+    unit, factor = _unit(match.group('rest'))
+    return amount * factor, unit
+
+
+@lru_cache(maxsize=4096)
+def parse_quantity(text):
+    """Текст количества -> (Decimal | None, единица). Одинаковые строки разбираются один раз."""
+    amount, unit = None, ''
+    for part in (text or '').split('+'):
+        part_amount, part_unit = _parse_part(part)
+        if part_amount is None:
+            continue
+        if amount is None:
+            amount, unit = part_amount, part_unit
+        elif part_unit == unit:
+            amount += part_amount
+        else:
+            # Части в разных единицах не складываются: оставляем первую
+            break
+    if amount is None or amount >= AMOUNT_LIMIT:
+        return None, ''
+    return amount.quantize(AMOUNT_PLACES), unit
+
+
+def format_quantity(amount, unit):
+    """Число и базовая единица -> читаемая строка ('1.5 кг', '750 мл')"""
+    if amount is None:
+        return ''
+    amount = Decimal(amount)
+    if unit == 'г' and amount >= 1000:
+        amount, unit = amount / 1000, 'кг'
+    elif unit == 'мл' and amount >= 1000:
+        amount, unit = amount / 1000, 'л'
+    text = f'{amount.quantize(AMOUNT_PLACES).normalize():f}'
+    return f'{text} {unit}'.strip()
@@ -0,0 +1,36 @@
+"""
+Рендерер JSON на orjson. Подключается через renderer_classes только к
+представлениям с большими ответами (списки и подбор блюд, подсказки,
+похожие блюда, выгрузка); остальные используют рендереры DRF по умолчанию.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # без orjson кодирует стандартный JSONRenderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer с кодированием через orjson. Включается только для
+    компактного вывода с ensure_ascii=False (настройки DRF по умолчанию),
+    где результат совпадает с json.dumps побайтно.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None
+            or not api_settings.UNICODE_JSON or not api_settings.COMPACT_JSON or api_settings.STRICT_JSON is False
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # datetime, Decimal и ленивые строки кодирует энкодер DRF, как в JSONRenderer
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer экранирует разделители строк, недопустимые в JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
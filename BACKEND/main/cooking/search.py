@@ -0,0 +1,309 @@
+"""
+Полнотекстовый поиск по блюдам: title, description, instructions и
+названия ингредиентов.
+
+Бэкенд выбирается настройкой COOKING_SEARCH_BACKEND:
+  'auto'     — FTS5 на SQLite, tsvector на Postgres, иначе 'like';
+  'fts5'     — виртуальная таблица SQLite FTS5 cooking_dish_fts;
+  'postgres' — таблица cooking_dish_search с tsvector и GIN-индексом;
+  'like'     — icontains по полям, как раньше (без внешних сервисов и таблиц).
+
+Таблицы создает и заполняет миграция 0005, а поддерживают сигналы (см.
+signals.py) в той же транзакции, что и изменение каталога. После массовой
+загрузки в обход сигналов нужен manage.py rebuild_search_index. Пока
+таблица пуста при непустом каталоге, поиск идет через 'like'.
+
+Запрос пользователя разбивается на слова, каждое ищется как префикс,
+все слова обязательны. Релевантность — bm25 / ts_rank с большим весом
+заголовка.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Dish
+
+FTS_TABLE = 'cooking_dish_fts'
+PG_TABLE = 'cooking_dish_search'
+FIELDS = ('title', 'description', 'instructions', 'ingredients')
+BATCH = 500
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH):
+        yield ids[start:start + BATCH]
+
+
+class LikeSearchBackend:
+    """Поиск подстрокой без индекса; запасной вариант для любой СУБД"""
+
+    name = 'like'
+
+    def available(self):
+        return True
+
+    def ready(self):
+        return True
+
+    def index_dishes(self, dish_ids):
+        pass
+
+    def remove_dishes(self, dish_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def filter(self, queryset, query, fields=FIELDS, rank=False):
+        lookups = {
+            'title': 'title__icontains',
+            'description': 'description__icontains',
+            'instructions': 'instructions__icontains',
+            'ingredients': 'dishingredient__ingredient__name__icontains',
+        }
+        for term in search_terms(query):
+            condition = reduce(or_, (Q(**{lookups[field]: term}) for field in fields))
+            if 'ingredients' in fields:
+                # JOIN по ингредиентам размножил бы строки, поэтому фильтруем подзапросом
+                queryset = queryset.filter(pk__in=Dish.objects.filter(condition).values('pk'))
+            else:
+                queryset = queryset.filter(condition)
+        if rank:
+            queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return queryset
+
+    def matching_ids(self, query, fields=FIELDS):
+        return set(self.filter(Dish.objects.all(), query, fields).values_list('id', flat=True))
+
+
+class SqliteFTS5Backend(LikeSearchBackend):
+    name = 'fts5'
+    table = FTS_TABLE
+    _available = {}
+    _filled = set()
+    # Веса bm25 для title, description, instructions, ingredients
+    weights = (10.0, 1.0, 0.5, 4.0)
+
+    document_sql = f'''
+        INSERT INTO {FTS_TABLE} (rowid, title, description, instructions, ingredients)
+        SELECT d.id, d.title, d.description, d.instructions,
+               COALESCE((SELECT group_concat(i.name, ' ')
+                         FROM cooking_dishingredient di
+                         JOIN cooking_ingredient i ON i.id = di.ingredient_id
+                         WHERE di.dish_id = d.id), '')
+        FROM cooking_dish d
+    '''
+
+    def available(self):
+        # Результат кэшируется на имя базы: тестовая база отличается от рабочей
+        key = (connection.settings_dict['NAME'], self.table)
+        if key not in self._available:
+            self._available[key] = self.table in connection.introspection.table_names()
+        return self._available[key]
+
+    def ready(self):
+        # Пустой индекс при непустом каталоге (не выполнен rebuild_search_index)
+        # ничего бы не находил. Заполненность кэшируется, как только подтвердится
+        key = (connection.settings_dict['NAME'], self.table)
+        if key not in self._filled:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT EXISTS (SELECT 1 FROM {self.table}) OR NOT EXISTS (SELECT 1 FROM {Dish._meta.db_table})'
+                )
+                if not cursor.fetchone()[0]:
+                    return False
+            self._filled.add(key)
+        return True
+
+    def index_dishes(self, dish_ids):
+        # Без транзакции два параллельных сохранения одного блюда успевают
+        # оба удалить строку и оба вставить ее заново — нарушение rowid
+        with transaction.atomic(), connection.cursor() as cursor:
+            for chunk in _chunks(dish_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(f'{self.document_sql} WHERE d.id IN ({placeholders})', chunk)
+
+    def remove_dishes(self, dish_ids):
+        with connection.cursor() as cursor:
+            for chunk in _chunks(dish_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(self.document_sql)
+
+    def match_expression(self, query, fields):
+        terms = ' AND '.join(f'"{term}"*' for term in search_terms(query))
+        if not terms:
+            return None
+        if tuple(fields) == FIELDS:
+            return terms
+        return f'{{{" ".join(fields)}}} : ({terms})'
+
+    def filter(self, queryset, query, fields=FIELDS, rank=False):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return queryset
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        )
+        if rank:
+            weights = ', '.join(str(w) for w in self.weights)
+            table = queryset.model._meta.db_table
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+                [expression], output_field=FloatField(),
+            ))
+        return queryset
+
+    def matching_ids(self, query, fields=FIELDS):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+            return {row[0] for row in cursor.fetchall()}
+
+
+class PostgresSearchBackend(SqliteFTS5Backend):
+    name = 'postgres'
+    table = PG_TABLE
+    # Вес A — заголовок, B — ингредиенты, C — описание, D — инструкции
+    field_weights = {'title': 'A', 'ingredients': 'B', 'description': 'C', 'instructions': 'D'}
+
+    @property
+    def config(self):
+        return getattr(settings, 'COOKING_SEARCH_CONFIG', 'russian')
+
+    @property
+    def document_sql(self):
+        cfg = self.config
+        return f'''
+            INSERT INTO {PG_TABLE} (dish_id, document)
+            SELECT d.id,
+                   setweight(to_tsvector('{cfg}', d.title), 'A') ||
+                   setweight(to_tsvector('{cfg}', COALESCE((
+                       SELECT string_agg(i.name, ' ')
+                       FROM cooking_dishingredient di
+                       JOIN cooking_ingredient i ON i.id = di.ingredient_id
+                       WHERE di.dish_id = d.id), '')), 'B') ||
+                   setweight(to_tsvector('{cfg}', d.description), 'C') ||
+                   setweight(to_tsvector('{cfg}', d.instructions), 'D')
+            FROM cooking_dish d
+        '''
+
+    def index_dishes(self, dish_ids):
+        # В READ COMMITTED параллельная вставка того же блюда не видна DELETE,
+        # поэтому документ перезаписывается через ON CONFLICT
+        with connection.cursor() as cursor:
+            for chunk in _chunks(dish_ids):
+                cursor.execute(
+                    f'{self.document_sql} WHERE d.id = ANY(%s) '
+                    'ON CONFLICT (dish_id) DO UPDATE SET document = EXCLUDED.document',
+                    [chunk],
+                )
+
+    def remove_dishes(self, dish_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {PG_TABLE} WHERE dish_id = ANY(%s)', [list(dish_ids)])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {PG_TABLE}')
+            cursor.execute(self.document_sql)
+
+    def match_expression(self, query, fields):
+        weights = ''.join(sorted(self.field_weights[field] for field in fields))
+        if tuple(fields) == FIELDS:
+            weights = ''
+        terms = ' & '.join(f'{term}:*{weights}' for term in search_terms(query))
+        return terms or None
+
+    def filter(self, queryset, query, fields=FIELDS, rank=False):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return queryset
+        match = f"document @@ to_tsquery('{self.config}', %s)"
+        queryset = queryset.filter(id__in=RawSQL(f'SELECT dish_id FROM {PG_TABLE} WHERE {match}', [expression]))
+        if rank:
+            table = queryset.model._meta.db_table
+            # ts_rank: больше — лучше; инвертируем, чтобы сортировка по возрастанию совпадала с bm25
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f"SELECT -ts_rank(document, to_tsquery('{self.config}', %s)) FROM {PG_TABLE} "
+                f'WHERE dish_id = "{table}"."id"',
+                [expression], output_field=FloatField(),
+            ))
+        return queryset
+
+    def matching_ids(self, query, fields=FIELDS):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT dish_id FROM {PG_TABLE} WHERE document @@ to_tsquery('{self.config}', %s)",
+                [expression],
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (LikeSearchBackend(), SqliteFTS5Backend(), PostgresSearchBackend())
+}
+
+
+def get_search_backend(indexing=False):
+    """
+    Бэкенд из настроек. Для поиска пустой индекс при непустом каталоге
+    заменяется на 'like'; indexing=True — для записи в индекс, пока он заполняется.
+    """
+    name = getattr(settings, 'COOKING_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = {'sqlite': 'fts5', 'postgresql': 'postgres'}.get(connection.vendor, 'like')
+    backend = BACKENDS[name]
+    # Таблица индекса может отсутствовать (нет FTS5 в сборке SQLite, миграция не применена)
+    if not backend.available() or not (indexing or backend.ready()):
+        return BACKENDS['like']
+    return backend
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    ?search= ищет по всем полям индекса, ?title= — только по заголовку.
+    Без явного ?ordering= результаты поиска сортируются по релевантности.
+    """
+
+    search_param = 'search'
+    title_param = 'title'
+
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, '')
+        title = request.query_params.get(self.title_param, '')
+        if not search_terms(search) and not search_terms(title):
+            return queryset
+
+        backend = get_search_backend()
+        ranked = 'ordering' not in request.query_params
+        if search_terms(title):
+            queryset = backend.filter(queryset, title, fields=('title',), rank=ranked and not search_terms(search))
+        if search_terms(search):
+            queryset = backend.filter(queryset, search, rank=ranked)
+        if ranked:
+            queryset = queryset.order_by('search_rank', *queryset.query.order_by)
+        return queryset
@@ -1,5 +1,18 @@
 from rest_framework import serializers
+from .images import variant_urls
+from .instrumentation import record_rows, timed
 from .models import Dish, Ingredient, DishIngredient, Category, Type
+from .substitutions import substitution_row
+
+
+class InstrumentedListSerializer(serializers.ListSerializer):
+    """Учитывает время сериализации и число строк в метриках запроса"""
+
+    def to_representation(self, data):
+        with timed('serialize'):
+            ret = super().to_representation(data)
+        record_rows(len(ret))
+        return ret
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,21 +39,34 @@ class DishIngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DishIngredient
-        fields = ['id', 'ingredient', 'quantity']
+        fields = ['id', 'ingredient', 'quantity', 'amount', 'unit']
 
 class ElasticDishSerializer(serializers.ModelSerializer):
     match_percentage = serializers.SerializerMethodField()
     missing_ingredients = serializers.SerializerMethodField()
     category_name = serializers.CharField(source='category.name', read_only=True)
     type_name = serializers.CharField(source='type.name', read_only=True)
+    photo_variants = serializers.SerializerMethodField()
+    substitutions = serializers.SerializerMethodField()
     
     class Meta:
         model = Dish
         fields = [
             'id', 'title', 'description', 'instructions', 'cooktime', 
-            'starred', 'photo', 'video','category_name', 'type_name',
-            'match_percentage','missing_ingredients'
+            'starred', 'photo', 'photo_variants', 'video','category_name', 'type_name',
+            'match_percentage','missing_ingredients', 'substitutions'
         ]
+        list_serializer_class = InstrumentedListSerializer
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # Замены показываются только при подборе с substitutions: true
+        if 'substitutions' not in self.context:
+            fields.pop('substitutions')
+        return fields
+    
+    def get_photo_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
     
     def get_match_percentage(self, obj):
         # ПРАВИЛЬНЫЙ расчет процента совпадения
@@ -50,8 +76,8 @@ class ElasticDishSerializer(serializers.ModelSerializer):
     
     def get_missing_ingredients(self, obj):
         user_ingredients = self.context.get('user_ingredients', [])
-        # Получаем все ингредиенты блюда
-        dish_ingredients = obj.dishingredient_set.select_related('ingredient').all()
+        # Получаем все ингредиенты блюда (предзагружены в loaders.py)
+        dish_ingredients = obj.dishingredient_set.all()
         
         missing = []
         for dish_ingredient in dish_ingredients:
@@ -60,21 +86,36 @@ class ElasticDishSerializer(serializers.ModelSerializer):
         
         return missing
     
+    def get_substitutions(self, obj):
+        substitutions = self.context['substitutions']
+        return [
+            substitution_row(dish_ingredient.ingredient_id, dish_ingredient.ingredient.name, substitutions)
+            for dish_ingredient in obj.dishingredient_set.all()
+            if dish_ingredient.ingredient_id in substitutions
+        ]
+    
 class DishSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     type_name = serializers.CharField(source='type.name', read_only=True)
     ingredients = serializers.SerializerMethodField()
+    photo_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Dish
         fields = [
             'id', 'title', 'description', 'instructions', 'cooktime', 
-            'starred', 'photo', 'video','category_name', 'type_name',
+            'starred', 'photo', 'photo_variants', 'video','category_name', 'type_name',
             'ingredients'
         ]
+        list_serializer_class = InstrumentedListSerializer
+
+    def get_photo_variants(self, obj):
+        # Уменьшенные WebP/JPEG по размерам (cooking/images.py)
+        return variant_urls(obj, self.context.get('request'))
 
     def get_ingredients(self, obj):
-        dish_ingredients = obj.dishingredient_set.select_related('ingredient').all()
+        # Ингредиенты предзагружены в loaders.py, .all() не делает запрос на строку
+        dish_ingredients = obj.dishingredient_set.all()
         
         ingredients = []
         for dish_ingredient in dish_ingredients:
@@ -86,3 +127,64 @@ class DishSerializer(serializers.ModelSerializer):
             ingredients.append(ingredient_with_quantity)
         
         return ingredients
+
+
+class PantryFiltersSerializer(serializers.Serializer):
+    """Фильтры набора: те же, что и query-параметры /dishes/possible/"""
+    category = serializers.CharField(required=False, allow_blank=True)
+    type = serializers.CharField(required=False, allow_blank=True)
+    category__name = serializers.CharField(required=False, allow_blank=True)
+    type__name = serializers.CharField(required=False, allow_blank=True)
+    cooktime_min = serializers.IntegerField(required=False, min_value=0)
+    cooktime_max = serializers.IntegerField(required=False, min_value=0)
+    title = serializers.CharField(required=False, allow_blank=True)
+    search = serializers.CharField(required=False, allow_blank=True)
+    ordering = serializers.CharField(required=False, allow_blank=True)
+
+    def to_internal_value(self, data):
+        # Опечатка в названии фильтра не должна молча возвращать весь список
+        if isinstance(data, dict):
+            unknown = sorted(set(data) - set(self.fields))
+            if unknown:
+                raise serializers.ValidationError({key: ['Unknown filter.'] for key in unknown})
+        return super().to_internal_value(data)
+
+
+class PantrySerializer(serializers.Serializer):
+    """Один набор ингредиентов в пакетном запросе /dishes/possible/batch/"""
+    ingredients = serializers.ListField(child=serializers.IntegerField())
+    willing_to_buy = serializers.BooleanField(default=False)
+    filters = PantryFiltersSerializer(default=dict)
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=20, default=20)
+
+
+class PantryBatchSerializer(serializers.Serializer):
+    pantries = PantrySerializer(many=True, allow_empty=False, max_length=50)
+
+
+class MatchModeSerializer(serializers.Serializer):
+    """Режимы /dishes/possible/; строки "false" и "0" — ложь, как и у остальных флагов"""
+    ranked = serializers.BooleanField(default=False)
+    substitutions = serializers.BooleanField(default=False)
+
+
+class RankedMatchSerializer(serializers.Serializer):
+    """Параметры режима ranked у /dishes/possible/: лучшие limit блюд по доле совпадения"""
+    ingredients = serializers.ListField(child=serializers.IntegerField())
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    # Минимальная доля имеющихся ингредиентов, в процентах
+    min_match = serializers.IntegerField(min_value=0, max_value=100, default=0)
+    tie_break = serializers.ChoiceField(choices=['cooktime', 'starred'], default='cooktime')
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Блюда для списка покупок и ингредиенты, которые уже есть (в список не попадут)"""
+    dishes = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=200)
+    ingredients = serializers.ListField(child=serializers.IntegerField(), default=list)
+
+
+class SuggestQuerySerializer(serializers.Serializer):
+    """Query-параметры /ingredients/suggest/"""
+    q = serializers.CharField(allow_blank=True, max_length=100, default='')
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
@@ -0,0 +1,280 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .facets import catalog_facets
+from .images import needs_variants, schedule_variants
+from .matching import ingredient_index
+from .models import Category, DeletedDish, Dish, DishIngredient, Ingredient, IngredientSubstitution, SimilarDish, Type
+from .postings import refresh_postings
+from .search import get_search_backend
+from .similar import recompute_similar, refresh_similar
+from .substitutions import SUBSTITUTIONS, substitution_graph
+from .suggest import INGREDIENTS, suggest_index
+
+
+class _CommitBatch:
+    def __init__(self, func):
+        self.func, self.items, self.done = func, set(), False
+
+    def flush(self):
+        self.done = True
+        self.func(self.items)
+
+
+def on_commit_batch(func, items):
+    """
+    Копит items до коммита текущей транзакции и вызывает func(set) один раз,
+    а не по разу на каждую строку (например, при каскадном удалении).
+    Вне транзакции func вызывается сразу.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        func(set(items))
+        return
+    batches = connection.__dict__.setdefault('cooking_commit_batches', {})
+    batch = batches.get(func)
+    # Откат транзакции или точки сохранения снимает колбэк: начинаем новую пачку
+    if batch is None or batch.done or not any(entry[1] == batch.flush for entry in connection.run_on_commit):
+        batch = batches[func] = _CommitBatch(func)
+        transaction.on_commit(batch.flush)
+    batch.items.update(items)
+
+
+@receiver(post_save, sender=Dish)
+def dish_saved(sender, instance, **kwargs):
+    on_commit_batch(ingredient_index.refresh_dishes, {instance.pk})
+
+
+@receiver(post_delete, sender=Dish)
+def dish_deleted(sender, instance, **kwargs):
+    # После удаления Django обнуляет pk, поэтому запоминаем его заранее
+    dish_id = instance.pk
+    transaction.on_commit(lambda: ingredient_index.remove_dish(dish_id))
+
+
+@receiver(post_delete, sender=Dish)
+def dish_tombstone(sender, instance, **kwargs):
+    # Инкрементальная выгрузка сообщает об удалении; запись — в той же транзакции
+    DeletedDish.objects.update_or_create(dish_id=instance.pk, defaults={'deleted_at': timezone.now()})
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+def refresh_ingredient_stats(sender, instance, **kwargs):
+    # Денормализованный счетчик обновляем в той же транзакции, что и состав
+    Dish(pk=instance.dish_id).refresh_ingredient_stats()
+
+
+@receiver(pre_save, sender=DishIngredient)
+def remember_previous_ingredient(sender, instance, **kwargs):
+    # При замене ингредиента в строке прежний тоже теряет блюдо
+    instance._previous_ingredient_id = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_ingredient_id = (
+            DishIngredient.objects.filter(pk=instance.pk).values_list('ingredient_id', flat=True).first()
+        )
+
+
+def changed_ingredient_ids(instance):
+    previous = getattr(instance, '_previous_ingredient_id', None)
+    return {instance.ingredient_id} if previous is None else {instance.ingredient_id, previous}
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+def refresh_posting_list(sender, instance, **kwargs):
+    # Каждый затронутый список пересчитывается один раз после коммита
+    on_commit_batch(refresh_postings, changed_ingredient_ids(instance))
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+def dish_ingredient_changed(sender, instance, **kwargs):
+    # Индекс копируется при каждом обновлении: одно на транзакцию для всех
+    # затронутых блюд, а не по копии на каждую строку состава
+    on_commit_batch(ingredient_index.refresh_dishes, {instance.dish_id})
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+def dish_similarity_changed(sender, instance, **kwargs):
+    # Один пересчет на транзакцию для всех затронутых блюд. Пачка списков
+    # блюд ингредиентов поставлена раньше и выполнится первой
+    on_commit_batch(refresh_similar, {instance.dish_id})
+
+
+@receiver(pre_delete, sender=Dish)
+def similar_dish_deleted(sender, instance, **kwargs):
+    # Строки SimilarDish с этим блюдом удалит каскад: блюда, у которых оно
+    # было соседом, запоминаем до удаления и дополняем их списки после
+    dish_ids = list(SimilarDish.objects.filter(similar=instance).values_list('dish_id', flat=True))
+    if dish_ids:
+        transaction.on_commit(lambda: recompute_similar(dish_ids))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    category_id, name = instance.pk, instance.name
+    transaction.on_commit(lambda: ingredient_index.set_category_name(category_id, name))
+    transaction.on_commit(lambda: catalog_facets.set_category_name(category_id, name))
+
+
+@receiver(post_save, sender=Type)
+def type_saved(sender, instance, **kwargs):
+    type_id, name = instance.pk, instance.name
+    transaction.on_commit(lambda: ingredient_index.set_type_name(type_id, name))
+    transaction.on_commit(lambda: catalog_facets.set_type_name(type_id, name))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    category_id = instance.pk
+    transaction.on_commit(lambda: ingredient_index.set_category_name(category_id, None))
+
+
+@receiver(post_delete, sender=Type)
+def type_deleted(sender, instance, **kwargs):
+    type_id = instance.pk
+    transaction.on_commit(lambda: ingredient_index.set_type_name(type_id, None))
+
+
+@receiver(post_save, sender=Dish)
+def dish_facets_changed(sender, instance, **kwargs):
+    dish_id = instance.pk
+    transaction.on_commit(lambda: catalog_facets.refresh_dish(dish_id))
+
+
+@receiver(post_delete, sender=Dish)
+def dish_facets_removed(sender, instance, **kwargs):
+    dish_id = instance.pk
+    transaction.on_commit(lambda: catalog_facets.remove_dish(dish_id))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Type)
+def facet_option_deleted(sender, **kwargs):
+    # SET_NULL у блюд выполняется UPDATE без сигналов Dish: пересчитываем целиком
+    transaction.on_commit(catalog_facets.invalidate)
+
+
+def bump_catalog(_senders):
+    bump_catalog_version()
+
+
+def bump_substitutions(_senders):
+    bump_catalog_version(SUBSTITUTIONS)
+
+
+def bump_ingredients(_senders):
+    bump_catalog_version(INGREDIENTS)
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+def catalog_changed(sender, **kwargs):
+    # Новая версия делает недействительными все закэшированные ответы;
+    # одна на транзакцию, сколько бы строк она ни меняла
+    on_commit_batch(bump_catalog, {sender})
+
+
+@receiver(post_save, sender=Dish)
+def index_dish(sender, instance, **kwargs):
+    # Поисковый индекс лежит в той же базе и меняется в той же транзакции
+    get_search_backend(indexing=True).index_dishes([instance.pk])
+
+
+@receiver(post_delete, sender=Dish)
+def unindex_dish(sender, instance, **kwargs):
+    get_search_backend(indexing=True).remove_dishes([instance.pk])
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+def reindex_dish_ingredients(sender, instance, **kwargs):
+    get_search_backend(indexing=True).index_dishes([instance.dish_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_dishes(sender, instance, created, **kwargs):
+    if not created:
+        dish_ids = DishIngredient.objects.filter(ingredient=instance).values_list('dish_id', flat=True)
+        get_search_backend(indexing=True).index_dishes(set(dish_ids))
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+@receiver(post_save, sender=Ingredient)
+def ingredient_usage_changed(sender, instance, **kwargs):
+    # Число блюд и название для автодополнения
+    ingredient_ids = changed_ingredient_ids(instance) if sender is DishIngredient else {instance.pk}
+    for ingredient_id in ingredient_ids:
+        transaction.on_commit(lambda ingredient_id=ingredient_id: suggest_index.refresh_ingredient(ingredient_id))
+
+
+@receiver(post_save, sender=DishIngredient)
+@receiver(post_delete, sender=DishIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    # Своя версия для автодополнения: другие воркеры перестраивают его только
+    # при изменении ингредиентов и состава, а не при любой правке каталога
+    on_commit_batch(bump_ingredients, {sender})
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    ingredient_id = instance.pk
+    transaction.on_commit(lambda: suggest_index.remove_ingredient(ingredient_id))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Type)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Type)
+def touch_dishes(sender, instance, created=False, **kwargs):
+    # Названия входят в строки выгрузки (export.py), а UPDATE и SET_NULL
+    # не трогают Dish.updated_at: отмечаем затронутые блюда в той же транзакции
+    if created:
+        return
+    if sender is Ingredient:
+        dishes = Dish.objects.filter(dishingredient__ingredient=instance)
+    elif sender is Category:
+        dishes = Dish.objects.filter(category=instance)
+    else:
+        dishes = Dish.objects.filter(type=instance)
+    dishes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=IngredientSubstitution)
+@receiver(post_delete, sender=IngredientSubstitution)
+def substitutions_changed(sender, **kwargs):
+    # Новая версия замен: замыкание пересчитывается целиком при следующем
+    # подборе с заменами в каждом воркере
+    on_commit_batch(bump_substitutions, {sender})
+
+
+@receiver(post_save, sender=Ingredient)
+def substitute_renamed(sender, instance, created, **kwargs):
+    if not created:
+        ingredient_id, name = instance.pk, instance.name
+        transaction.on_commit(lambda: substitution_graph.set_name(ingredient_id, name))
+
+
+@receiver(post_save, sender=Dish)
+def dish_photo_changed(sender, instance, **kwargs):
+    # Варианты строятся после коммита в пуле потоков, ответ на загрузку их не ждет
+    if needs_variants(instance):
+        dish_id = instance.pk
+        transaction.on_commit(lambda: schedule_variants(dish_id))
@@ -0,0 +1,204 @@
+"""
+Похожие блюда по составу.
+
+Для каждого блюда хранится до COOKING_SIMILAR_TOP соседей (таблица
+SimilarDish) с мерой Жаккара |A ∩ B| / |A ∪ B| наборов ингредиентов не
+ниже COOKING_SIMILAR_MIN_SCORE; /dishes/<id>/similar/ читает их одним
+запросом по индексу (dish, rank).
+
+Полный пересчет (manage.py compute_similar_dishes) не сравнивает все пары:
+кандидаты ищутся через MinHash/LSH. Подпись блюда — минимумы bands * rows
+хэшей его ингредиентов; блюда с совпавшей полосой из rows минимумов попадают
+в одну корзину, и вероятность этого быстро растет с мерой Жаккара. Кандидаты
+из корзин проверяются точно. Корзины больше max_bucket (их дают самые
+частые ингредиенты) пропускаются — в них почти одни случайные совпадения.
+
+После изменения состава блюд (signals.py, один раз на транзакцию для всех
+затронутых блюд) соседи пересчитываются точно по спискам блюд ингредиентов
+из IngredientPostingList: для самих блюд и для блюд, в чьих списках они
+есть или должны появиться. После массовой загрузки в обход сигналов нужен
+полный пересчет.
+"""
+import heapq
+import random
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import Dish, DishIngredient, IngredientPostingList, SimilarDish
+from .postings import InIdList, unpack
+
+DEFAULT_TOP = 10
+DEFAULT_MIN_SCORE = 0.2
+
+
+def similar_top():
+    return getattr(settings, 'COOKING_SIMILAR_TOP', DEFAULT_TOP)
+
+
+def min_score():
+    return getattr(settings, 'COOKING_SIMILAR_MIN_SCORE', DEFAULT_MIN_SCORE)
+
+
+def jaccard(common, size_a, size_b):
+    return common / (size_a + size_b - common)
+
+
+def best(scores, top):
+    """Лучшие соседи [(score, similar_id)]: по убыванию меры, при равенстве — меньший id"""
+    return heapq.nsmallest(top, ((score, dish_id) for dish_id, score in scores.items()),
+                           key=lambda item: (-item[0], item[1]))
+
+
+def minhash_values(ingredient_ids, hashes, seed=0):
+    """Значения hashes хэш-функций для каждого ингредиента; воспроизводимы по seed"""
+    values = {}
+    for ingredient_id in ingredient_ids:
+        rng = random.Random(f'{seed}:{ingredient_id}')
+        values[ingredient_id] = [rng.getrandbits(32) for _ in range(hashes)]
+    return values
+
+
+def band_keys(ingredient_ids, values, bands, rows):
+    """Ключи корзин LSH блюда: (номер полосы, хэш rows минимумов)"""
+    columns = [values[ingredient_id] for ingredient_id in ingredient_ids]
+    signature = list(map(min, *columns)) if len(columns) > 1 else columns[0]
+    return [(band, hash(tuple(signature[band * rows:(band + 1) * rows]))) for band in range(bands)]
+
+
+def compute_similar(bands=30, rows=2, seed=0, max_bucket=200, batch_size=5000, progress=None):
+    """Полный пересчет SimilarDish через MinHash/LSH; возвращает число строк"""
+    sets = {}
+    pairs = DishIngredient.objects.order_by().values_list('dish_id', 'ingredient_id')
+    for dish_id, ingredient_id in pairs.iterator(chunk_size=10000):
+        sets.setdefault(dish_id, set()).add(ingredient_id)
+
+    values = minhash_values({i for ingredient_ids in sets.values() for i in ingredient_ids}, bands * rows, seed)
+    keys = {dish_id: band_keys(ingredient_ids, values, bands, rows) for dish_id, ingredient_ids in sets.items()}
+    buckets = {}
+    for dish_id, dish_keys in keys.items():
+        for key in dish_keys:
+            buckets.setdefault(key, []).append(dish_id)
+
+    top, threshold = similar_top(), min_score()
+    neighbors = {}
+    for done, (dish_id, dish_keys) in enumerate(keys.items(), 1):
+        candidates = set()
+        for key in dish_keys:
+            members = buckets[key]
+            if 1 < len(members) <= max_bucket:
+                candidates.update(members)
+        candidates.discard(dish_id)
+        ingredient_ids = sets[dish_id]
+        scores = {}
+        for other in candidates:
+            other_ids = sets[other]
+            score = jaccard(len(ingredient_ids & other_ids), len(ingredient_ids), len(other_ids))
+            if score >= threshold:
+                scores[other] = score
+        neighbors[dish_id] = best(scores, top)
+        if progress is not None and done % batch_size == 0:
+            progress(done)
+
+    with transaction.atomic():
+        SimilarDish.objects.all().delete()
+        return write_neighbors(neighbors, replace=False, batch_size=batch_size)
+
+
+def write_neighbors(neighbors, replace=True, batch_size=5000):
+    """
+    Записывает списки {dish_id: [(score, similar_id)]}. Строки вставляются
+    одним executemany: bulk_create на миллионе строк в разы медленнее.
+    """
+    meta = SimilarDish._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(meta.get_field(name).column) for name in ('dish', 'similar', 'score', 'rank'))
+    sql = f'INSERT INTO {quote(meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s)'
+    rows = [
+        (dish_id, similar_id, score, rank)
+        for dish_id, items in neighbors.items()
+        for rank, (score, similar_id) in enumerate(items, 1)
+    ]
+    with transaction.atomic():
+        if replace:
+            # Два пересчета одного блюда из разных транзакций иначе оба удалят
+            # старые строки и оба вставят новые — нарушение (dish, rank) на
+            # Postgres. Блокировка строк Dish (по id, без взаимных блокировок)
+            # ставит их в очередь, и второй DELETE видит строки первого.
+            list(Dish.objects.select_for_update().filter(InIdList(F('id'), list(neighbors)))
+                 .order_by('id').values_list('id', flat=True))
+            SimilarDish.objects.filter(InIdList(F('dish_id'), list(neighbors))).delete()
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def exact_scores(dish_id):
+    """
+    Точные меры блюда со всеми блюдами, где есть хотя бы один его ингредиент,
+    не ниже порога: {dish_id: score}. Совпадения считаются слиянием списков.
+    """
+    ingredient_ids = set(DishIngredient.objects.filter(dish_id=dish_id).values_list('ingredient_id', flat=True))
+    if not ingredient_ids:
+        return {}
+    common = {}
+    for blob in IngredientPostingList.objects.filter(ingredient_id__in=ingredient_ids).values_list('dish_ids', flat=True):
+        for other in unpack(blob):
+            common[other] = common.get(other, 0) + 1
+    common.pop(dish_id, None)
+
+    size, threshold = len(ingredient_ids), min_score()
+    # Мера не больше common / size: остальных не стоит и загружать
+    candidates = [other for other, count in common.items() if count >= threshold * size]
+    sizes = Dish.objects.filter(InIdList(F('id'), candidates)).values_list('id', 'ingredients_count')
+    scores = {}
+    for other, other_size in sizes:
+        score = jaccard(common[other], size, other_size)
+        if score >= threshold:
+            scores[other] = score
+    return scores
+
+
+def refresh_similar(dish_ids):
+    """Пересчитывает соседей блюд с измененным составом и блюд, которых это касается"""
+    changed = set(dish_ids)
+    top = similar_top()
+    neighbors, reverse = {}, {}
+    for dish_id in changed:
+        scores = exact_scores(dish_id)
+        neighbors[dish_id] = best(scores, top)
+        for other, score in scores.items():
+            reverse.setdefault(other, {})[dish_id] = score
+
+    pointing = SimilarDish.objects.filter(similar_id__in=changed).values_list('dish_id', flat=True)
+    affected = (set(reverse) | set(pointing)) - changed
+    current = {}
+    rows = SimilarDish.objects.filter(InIdList(F('dish_id'), list(affected))).values_list('dish_id', 'score', 'similar_id')
+    for dish_id, score, similar_id in rows:
+        current.setdefault(dish_id, []).append((score, similar_id))
+
+    for dish_id in affected:
+        old = sorted(current.get(dish_id, []), key=lambda item: (-item[0], item[1]))
+        scores = reverse.get(dish_id, {})
+        # Полный список, из которого измененное блюдо ушло или ослабло, мог
+        # вытеснить кого-то, кто теперь снова проходит: считаем его заново
+        if len(old) == top and any(
+            similar_id in changed and scores.get(similar_id, 0) < score for score, similar_id in old
+        ):
+            new = best(exact_scores(dish_id), top)
+        else:
+            merged = {similar_id: score for score, similar_id in old if similar_id not in changed}
+            merged.update(scores)
+            new = best(merged, top)
+        if new != old:
+            neighbors[dish_id] = new
+
+    write_neighbors(neighbors)
+
+
+def recompute_similar(dish_ids):
+    """Точный пересчет списков блюд целиком (например, когда сосед удален)"""
+    top = similar_top()
+    write_neighbors({dish_id: best(exact_scores(dish_id), top) for dish_id in dish_ids})
@@ -0,0 +1,448 @@
+"""
+Снимок каталога только для чтения, отображаемый в память.
+
+manage.py build_catalog_snapshot собирает в один файл все, что нужно
+спискам блюд: готовые JSON-строки FastDishSerializer, состав блюд,
+списки блюд по ингредиентам, порядки по title и cooktime.
+Если задан COOKING_SNAPSHOT_PATH, каждый воркер открывает файл через
+mmap: страницы общие для всех процессов на машине (кэш страниц ОС),
+массивы читаются через memoryview без копирования. AllDishListView и
+PossibleDishesListView собирают ответ из готовых строк; запросы с поиском,
+фасетами, курсором и прочими параметрами, которых снимок не знает, идут
+обычным путем.
+
+Снимок не следит за изменениями каталога: правки видны в нем после
+следующей сборки. Исключение — отметки избранного, которые пользователь
+ставит на лету (PATCH /starred/<id>/): флаг starred в строках страницы
+берется из базы одним запросом, а /starred/ снимок не обслуживает вовсе.
+Команда пишет новый файл
+рядом и переименовывает его поверх старого; воркеры замечают замену не
+позже чем через COOKING_SNAPSHOT_CHECK_INTERVAL секунд и переключаются,
+а уже открытый старый файл дочитывают до конца запроса.
+
+Формат: MAGIC, секции (байты строк и названий, массивы int64 в порядке
+байтов машины, собравшей снимок), оглавление в JSON, его длина (uint64)
+и снова MAGIC.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .cache import catalog_version
+from .fast_serializers import dish_fields, query_ingredient_rows
+from .images import FORMATS
+from .matching import request_ordering
+from .models import Category, Dish, Type
+from .renderers import FastJSONRenderer
+
+logger = logging.getLogger('cooking.snapshot')
+
+MAGIC = b'CKSNAP01'
+FOOTER = struct.Struct('<Q')
+NO_COOKTIME = -2 ** 63
+
+# Флаги блюда
+STARRED = 1
+HAS_PHOTO = 2
+
+# Сортировки AllDishListView, которые есть в снимке: поле -> (массив, обратный порядок)
+ORDERINGS = {
+    'title': ('order_title', False),
+    '-title': ('order_title', True),
+    'cooktime': ('order_cooktime', False),
+    '-cooktime': ('order_cooktime', True),
+}
+
+_renderer = FastJSONRenderer()
+
+
+def render(data):
+    # Тот же рендерер, что у ответов API: байты совпадают с обычным путем
+    return _renderer.render(data)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _SectionWriter:
+    def __init__(self, fh):
+        self.fh = fh
+        self.sections = {}
+
+    def start(self, name):
+        # Массивы выравниваются на 8 байт
+        pad = -self.fh.tell() % 8
+        self.fh.write(b'\0' * pad)
+        self.sections[name] = [self.fh.tell(), 0, 'B']
+
+    def write(self, name, data):
+        self.fh.write(data)
+        self.sections[name][1] += len(data)
+
+    def array(self, name, values):
+        self.start(name)
+        self.write(name, values.tobytes())
+        self.sections[name][2] = values.typecode
+
+
+def build_snapshot(path, chunk_size=2000):
+    """Собирает снимок во временный файл и атомарно ставит его на место path"""
+    tmp = f'{path}.{os.getpid()}.tmp'
+    ids, categories, types, cooktimes, totals = (array('q') for _ in range(5))
+    flags = bytearray()
+    row_offsets, prefix_lengths, title_offsets = array('q', [0]), array('q'), array('q', [0])
+    ingredient_offsets, dish_ingredients = array('q', [0]), array('q')
+    titles, postings, names = [], {}, {}
+
+    with open(tmp, 'wb') as fh:
+        fh.write(MAGIC)
+        writer = _SectionWriter(fh)
+        writer.start('rows')
+        title_blob = bytearray()
+
+        dishes = Dish.objects.select_related('category', 'type').order_by('id')
+        chunk = []
+
+        def flush():
+            rows = query_ingredient_rows([dish.id for dish in chunk])
+            for dish in chunk:
+                index = len(ids)
+                fields = dish_fields(dish, None)
+                prefix = render(fields)[:-1]
+                ingredients = rows[dish.id]
+                row = prefix + b',"ingredients":' + render(
+                    [f'{name.strip()} {quantity.strip()}' for _, name, quantity in ingredients]
+                ) + b'}'
+                writer.write('rows', row)
+                row_offsets.append(row_offsets[-1] + len(row))
+                prefix_lengths.append(len(prefix))
+
+                ids.append(dish.id)
+                categories.append(dish.category_id or 0)
+                types.append(dish.type_id or 0)
+                cooktimes.append(NO_COOKTIME if dish.cooktime is None else dish.cooktime)
+                flags.append(
+                    (STARRED if dish.starred else 0)
+                    | (HAS_PHOTO if fields['photo'] or fields['photo_variants'] else 0)
+                )
+                titles.append(dish.title)
+                title_blob.extend(dish.title.encode())
+                title_offsets.append(len(title_blob))
+
+                ingredient_ids = []
+                for ingredient_id, name, _ in ingredients:
+                    names[ingredient_id] = name
+                    ingredient_ids.append(ingredient_id)
+                    postings.setdefault(ingredient_id, []).append(index)
+                dish_ingredients.extend(ingredient_ids)
+                ingredient_offsets.append(len(dish_ingredients))
+                totals.append(len(set(ingredient_ids)))
+            chunk.clear()
+
+        for dish in dishes.iterator(chunk_size=chunk_size):
+            chunk.append(dish)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+
+        writer.start('titles')
+        writer.write('titles', bytes(title_blob))
+        writer.start('flags')
+        writer.write('flags', bytes(flags))
+
+        by_title = sorted(range(len(ids)), key=lambda i: (titles[i], ids[i]))
+        # NULL cooktime первым, как ORDER BY cooktime в SQLite
+        by_cooktime = sorted(range(len(ids)), key=lambda i: (cooktimes[i], ids[i]))
+        posting_ids = array('q', sorted(postings))
+        posting_offsets, posting_dishes = array('q', [0]), array('q')
+        for ingredient_id in posting_ids:
+            posting_dishes.extend(postings[ingredient_id])
+            posting_offsets.append(len(posting_dishes))
+
+        for name, values in (
+            ('ids', ids), ('categories', categories), ('types', types), ('cooktimes', cooktimes),
+            ('totals', totals), ('row_offsets', row_offsets), ('prefix_lengths', prefix_lengths),
+            ('title_offsets', title_offsets), ('ingredient_offsets', ingredient_offsets),
+            ('dish_ingredients', dish_ingredients),
+            ('order_title', array('q', by_title)), ('order_cooktime', array('q', by_cooktime)),
+            ('posting_ids', posting_ids), ('posting_offsets', posting_offsets),
+            ('posting_dishes', posting_dishes),
+        ):
+            writer.array(name, values)
+
+        footer = json.dumps({
+            'created': timezone.now().isoformat(),
+            'catalog_version': catalog_version()[0],
+            'byteorder': sys.byteorder,
+            'dishes': len(ids),
+            'sections': writer.sections,
+            'categories': dict(Category.objects.values_list('id', 'name')),
+            'types': dict(Type.objects.values_list('id', 'name')),
+            'ingredients': names,
+        }, ensure_ascii=False).encode()
+        fh.write(footer)
+        fh.write(FOOTER.pack(len(footer)))
+        fh.write(MAGIC)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    os.replace(tmp, path)
+    return {'dishes': len(ids), 'bytes': os.path.getsize(path)}
+
+
+class SnapshotEntry:
+    """Блюдо снимка с полями DishEntry, нужными matching.filter_matches"""
+
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def id(self):
+        return self.snapshot.ids[self.index]
+
+    @property
+    def title(self):
+        return self.snapshot.title(self.index)
+
+    @property
+    def cooktime(self):
+        cooktime = self.snapshot.cooktimes[self.index]
+        return None if cooktime == NO_COOKTIME else cooktime
+
+    @property
+    def category_id(self):
+        return self.snapshot.categories[self.index] or None
+
+    @property
+    def type_id(self):
+        return self.snapshot.types[self.index] or None
+
+    @property
+    def starred(self):
+        return bool(self.snapshot.flags[self.index] & STARRED)
+
+    @property
+    def total(self):
+        return self.snapshot.totals[self.index]
+
+
+class CatalogSnapshot:
+    """Открытый файл снимка; массивы — memoryview поверх mmap"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        if len(mm) < 2 * len(MAGIC) + FOOTER.size or mm[:8] != MAGIC or mm[-8:] != MAGIC:
+            raise SnapshotError(f'{path} is not a catalog snapshot')
+        (length,) = FOOTER.unpack(mm[-16:-8])
+        self.meta = json.loads(mm[-16 - length:-16])
+        if self.meta['byteorder'] != sys.byteorder:
+            raise SnapshotError(f'{path} was built on a {self.meta["byteorder"]}-endian machine')
+
+        view = memoryview(mm)
+        for name, (offset, size, typecode) in self.meta['sections'].items():
+            section = view[offset:offset + size]
+            setattr(self, name, section.cast(typecode) if typecode != 'B' else section)
+        self._category_names = {int(k): v for k, v in self.meta['categories'].items()}
+        self._type_names = {int(k): v for k, v in self.meta['types'].items()}
+        self._ingredient_names = {int(k): v for k, v in self.meta['ingredients'].items()}
+        # Блюда без ингредиентов: их можно приготовить из любого набора
+        self._empty = [index for index, total in enumerate(self.totals) if total == 0]
+
+    def __len__(self):
+        return self.meta['dishes']
+
+    def title(self, index):
+        return bytes(self.titles[self.title_offsets[index]:self.title_offsets[index + 1]]).decode()
+
+    def row(self, index, request=None, starred=None):
+        """JSON строки FastDishSerializer; starred — текущий флаг из базы"""
+        start = self.row_offsets[index]
+        split = start + self.prefix_lengths[index]
+        prefix = self._prefix(index, request, starred)
+        return prefix + bytes(self.rows[split:self.row_offsets[index + 1]])
+
+    def match_row(self, index, matching, user_ingredients, request=None, starred=None):
+        """JSON строки FastElasticDishSerializer"""
+        prefix = self._prefix(index, request, starred)
+        total = self.totals[index]
+        missing = [
+            self._ingredient_names[ingredient_id]
+            for ingredient_id in self.dish_ingredients[self.ingredient_offsets[index]:self.ingredient_offsets[index + 1]]
+            if ingredient_id not in user_ingredients
+        ]
+        return (
+            prefix + b',"match_percentage":' + render(round(matching / total * 100, 1) if total > 0 else 0)
+            + b',"missing_ingredients":' + render(missing) + b'}'
+        )
+
+    def _prefix(self, index, request, starred):
+        # Поля блюда без ingredients; текст внутри строк JSON экранирован,
+        # поэтому "starred": встречается в префиксе только как ключ
+        start = self.row_offsets[index]
+        prefix = bytes(self.rows[start:start + self.prefix_lengths[index]])
+        if request is not None and self.flags[index] & HAS_PHOTO:
+            prefix = self._absolute_urls(prefix, request)
+        if starred is not None and starred != bool(self.flags[index] & STARRED):
+            old, new = (b'"starred":false', b'"starred":true') if starred else (b'"starred":true', b'"starred":false')
+            prefix = prefix.replace(old, new, 1)
+        return prefix
+
+    def starred_ids(self, indexes):
+        """id избранных блюд среди indexes по базе — один запрос на страницу"""
+        ids = [self.ids[index] for index in indexes]
+        if not ids:
+            return set()
+        return set(Dish.objects.filter(id__in=ids, starred=True).values_list('id', flat=True))
+
+    def _absolute_urls(self, prefix, request):
+        # Ссылки на фото в снимке относительные: хост берется из запроса, как в dish_fields
+        fields = json.loads(prefix + b'}')
+        if fields['photo']:
+            fields['photo'] = request.build_absolute_uri(fields['photo'])
+        for variant in (fields['photo_variants'] or {}).values():
+            for fmt in FORMATS:
+                variant[fmt] = request.build_absolute_uri(variant[fmt])
+        return render(fields)[:-1]
+
+    def category_name(self, entry):
+        return self._category_names.get(entry.category_id)
+
+    def type_name(self, entry):
+        return self._type_names.get(entry.type_id)
+
+    def ordered(self, ordering):
+        """Индексы блюд в порядке сортировки AllDishListView; None, если ее нет в снимке"""
+        if ordering not in ORDERINGS:
+            return None
+        name, reverse = ORDERINGS[ordering]
+        return IndexList(getattr(self, name), reverse)
+
+    def matches(self, ingredient_ids, willing_to_buy):
+        """
+        Подбор слиянием списков блюд по ингредиентам пользователя, как у движка
+        postings: [(индекс блюда, число совпавших ингредиентов)].
+        """
+        counts = Counter()
+        for ingredient_id in set(ingredient_ids):
+            position = bisect_left(self.posting_ids, ingredient_id)
+            if position < len(self.posting_ids) and self.posting_ids[position] == ingredient_id:
+                counts.update(self.posting_dishes[self.posting_offsets[position]:self.posting_offsets[position + 1]])
+        if willing_to_buy:
+            return list(counts.items())
+        return [(index, count) for index, count in counts.items() if count == self.totals[index]] + [
+            (index, 0) for index in self._empty
+        ]
+
+
+class IndexList:
+    """Последовательность индексов блюд для django Paginator (len и срезы)"""
+
+    def __init__(self, values, reverse=False):
+        self.values = values
+        self.reverse = reverse
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, item):
+        if self.reverse:
+            size = len(self.values)
+            start, stop, _ = item.indices(size)
+            return list(self.values[size - stop:size - start])[::-1]
+        return list(self.values[item])
+
+
+class SnapshotStore:
+    """
+    Текущий снимок процесса. Раз в COOKING_SNAPSHOT_CHECK_INTERVAL секунд
+    сверяет inode и время изменения файла и при замене открывает новый.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._key = None
+        self._checked = 0.0
+
+    def get(self):
+        path = getattr(settings, 'COOKING_SNAPSHOT_PATH', None)
+        if not path:
+            return None
+        interval = getattr(settings, 'COOKING_SNAPSHOT_CHECK_INTERVAL', 1.0)
+        if time.monotonic() - self._checked < interval and self._key and self._key[0] == path:
+            return self._snapshot
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._snapshot, self._key = None, None
+                return None
+            key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if key != self._key:
+                try:
+                    # Старый снимок закроется сборщиком мусора после текущих запросов
+                    self._snapshot = CatalogSnapshot(path)
+                except (OSError, ValueError, KeyError, SnapshotError):
+                    logger.exception('Cannot open catalog snapshot %s', path)
+                    self._snapshot = None
+                self._key = key
+            return self._snapshot
+
+
+catalog_snapshot = SnapshotStore()
+
+
+def json_response(request, snapshot, paginator, count, rows):
+    """Ответ пагинатора DRF, собранный из готовых JSON-строк"""
+    head = render({'count': count, 'next': paginator.get_next_link(), 'previous': paginator.get_previous_link()})
+    body = head[:-1] + b',"results":[' + b','.join(rows) + b']}'
+    response = HttpResponse(body, content_type='application/json')
+    response['X-Catalog-Snapshot'] = snapshot.meta['created']
+    return response
+
+
+def accepts_json(request):
+    # Браузерный API (text/html) рендерится обычным путем
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is not None and renderer.format == 'json'
+
+
+class SnapshotListMixin:
+    """
+    Отдает list() всего каталога из снимка, если он открыт и запрос ему по
+    силам. Ставится первым, до CachedListMixin: снимок дешевле кэша ответов.
+    """
+
+    snapshot_params = frozenset({'page', 'page_size', 'ordering', 'format'})
+
+    def list(self, request, *args, **kwargs):
+        snapshot = catalog_snapshot.get()
+        if snapshot is not None and accepts_json(request) and set(request.query_params) <= self.snapshot_params:
+            ordering = request_ordering(request, self)
+            indexes = snapshot.ordered(ordering[0]) if len(ordering) == 1 else None
+            if indexes is not None and self.paginator is not None:
+                paginator = self.paginator
+                page = paginator.paginate_queryset(indexes, request, view=self)
+                starred = snapshot.starred_ids(page)
+                rows = [snapshot.row(index, request, snapshot.ids[index] in starred) for index in page]
+                return json_response(request, snapshot, paginator, len(indexes), rows)
+        return super().list(request, *args, **kwargs)
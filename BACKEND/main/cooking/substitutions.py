@@ -0,0 +1,138 @@
+"""
+Замены ингредиентов для подбора блюд (/dishes/possible/ с substitutions: true).
+
+IngredientSubstitution — ребро «ингредиент рецепта -> чем его можно
+заменить» с ценой. Замены транзитивны: если маргарин заменяется сливочным
+маслом (1), а масло — топленым (1), то маргарин закрывается и топленым
+маслом (2). Замыкание с наименьшей ценой (Дейкстра от каждого ингредиента,
+не дороже COOKING_SUBSTITUTION_MAX_COST) считается один раз и хранится
+обратным словарем: ингредиент пользователя -> какие ингредиенты рецептов
+он закрывает и за какую цену.
+
+Запрос расширяет набор пользователя по этому словарю — несколько
+обращений к dict, без запросов к базе, — и дальше идет обычный подбор
+любым движком: закрытые заменой ингредиенты считаются совпавшими.
+Граф мал и меняется редко, поэтому после любой правки замен он просто
+перестраивается при следующем обращении. Правку видят все воркеры: граф
+помнит версии замен (своя область CatalogVersion, ее увеличивают сигналы
+IngredientSubstitution) и каталога (названия ингредиентов), см. cache.py.
+"""
+import heapq
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+from .cache import catalog_version
+from .models import Ingredient, IngredientSubstitution
+
+DEFAULT_MAX_COST = 3
+SUBSTITUTIONS = 'substitutions'
+
+# Чем закрыт ингредиент рецепта: ингредиент пользователя и цена замены
+Substitute = namedtuple('Substitute', 'id name cost')
+
+
+def max_cost():
+    return getattr(settings, 'COOKING_SUBSTITUTION_MAX_COST', DEFAULT_MAX_COST)
+
+
+def graph_version():
+    return catalog_version(SUBSTITUTIONS)[0], catalog_version()[0]
+
+
+class SubstitutionGraph:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._covers = {}  # id ингредиента пользователя -> ((id ингредиента рецепта, цена), ...)
+        self._names = {}
+        self._version = None  # (версия замен, версия каталога) при сборке
+        self._built = False
+
+    @property
+    def built(self):
+        return self._built
+
+    def rebuild(self):
+        version = graph_version()
+        edges = {}
+        for ingredient_id, substitute_id, cost in IngredientSubstitution.objects.values_list(
+            'ingredient_id', 'substitute_id', 'cost'
+        ):
+            edges.setdefault(ingredient_id, []).append((substitute_id, cost))
+
+        limit = max_cost()
+        covers = {}
+        for source in edges:
+            # Дешевейшие пути от ингредиента рецепта ко всем его заменам
+            costs = {source: 0}
+            heap = [(0, source)]
+            while heap:
+                cost, node = heapq.heappop(heap)
+                if cost > costs[node]:
+                    continue
+                for target, step in edges.get(node, ()):
+                    total = cost + step
+                    if total <= limit and total < costs.get(target, limit + 1):
+                        costs[target] = total
+                        heapq.heappush(heap, (total, target))
+            for target, cost in costs.items():
+                if target != source:
+                    covers.setdefault(target, []).append((source, cost))
+
+        names = dict(Ingredient.objects.filter(id__in=set(covers)).values_list('id', 'name'))
+        with self._lock:
+            self._covers = {target: tuple(sorted(items, key=lambda item: item[1])) for target, items in covers.items()}
+            self._names = names
+            self._version = version
+            self._built = True
+
+    def ensure_built(self):
+        version = graph_version()
+        if self._built and self._version == version:
+            return
+        with self._lock:
+            if not self._built or self._version != version:
+                self.rebuild()
+
+    def invalidate(self):
+        self._built = False
+
+    def set_name(self, ingredient_id, name):
+        if self._built and ingredient_id in self._names:
+            with self._lock:
+                self._names = {**self._names, ingredient_id: name}
+
+    def expand(self, ingredient_ids):
+        """
+        Набор пользователя с ингредиентами, закрытыми заменами, и сами замены:
+        (список id, {id ингредиента рецепта: Substitute}). Из нескольких замен
+        одного ингредиента берется самая дешевая, при равенстве — с меньшим id.
+        """
+        self.ensure_built()
+        covers, names = self._covers, self._names
+        pantry = set(ingredient_ids)
+        used = {}
+        for substitute_id in pantry:
+            for ingredient_id, cost in covers.get(substitute_id, ()):
+                if ingredient_id in pantry:
+                    continue
+                current = used.get(ingredient_id)
+                if current is None or (cost, substitute_id) < (current.cost, current.id):
+                    used[ingredient_id] = Substitute(substitute_id, names.get(substitute_id), cost)
+        return [*ingredient_ids, *used], used
+
+
+def substitution_row(ingredient_id, name, substitutions):
+    """Чем заменен ингредиент блюда — для ответа подбора"""
+    substitute = substitutions[ingredient_id]
+    return {
+        'ingredient_id': ingredient_id,
+        'ingredient': name,
+        'substitute_id': substitute.id,
+        'substitute': substitute.name,
+        'cost': substitute.cost,
+    }
+
+
+substitution_graph = SubstitutionGraph()
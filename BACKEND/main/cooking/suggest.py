@@ -0,0 +1,174 @@
+"""
+Индекс для автодополнения ингредиентов (/ingredients/suggest/?q=).
+
+Отсортированный массив ключей (нормализованное начало каждого слова
+названия, id) в памяти процесса: все названия с префиксом q лежат в нем
+подряд, диапазон находится двумя bisect. Из узкого диапазона берутся
+limit ингредиентов, которые встречаются в наибольшем числе блюд. Широкий
+диапазон (короткий префикс) не перебирается целиком: вместо этого список
+всех ингредиентов по убыванию популярности просматривается до первых
+limit подходящих.
+
+Число блюд на ингредиент и названия поддерживаются сигналами (см.
+signals.py); изменения других воркеров индекс видит по своей версии
+INGREDIENTS (ее увеличивают только изменения Ingredient и DishIngredient,
+см. cache.py) и тогда перестраивается. Правки блюд, не задевающие состав
+(например, отметка избранного), индекс не трогают. Как и ingredient_index, индекс
+строится лениво и после массовых операций без сигналов требует rebuild().
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left
+
+from django.db.models import Count
+
+from .cache import catalog_version
+from .models import Ingredient
+
+INGREDIENTS = 'ingredients'
+
+# Сколько готовых ответов держать для популярных коротких префиксов
+CACHE_SIZE = 1024
+# Диапазон ключей больше этого просматривается по списку популярности
+RANGE_SCAN_LIMIT = 256
+
+
+def rank_key(item):
+    ingredient_id, (name, dishes) = item
+    # Сначала самые используемые, при равенстве — по алфавиту
+    return -dishes, name.casefold(), ingredient_id
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', text.casefold().replace('ё', 'е')))
+
+
+def name_keys(name):
+    """Ключи для поиска по началу любого слова: 'зеленый лук' -> ['зеленый лук', 'лук']"""
+    words = normalize(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ingredients = {}  # id -> (название, число блюд)
+        self._keys = []  # отсортированные (ключ, id)
+        self._ranked = None  # id по убыванию популярности, строится по требованию
+        self._cache = {}
+        self._version = None  # версия INGREDIENTS, из которой построен индекс
+        self._built = False
+
+    @property
+    def built(self):
+        return self._built
+
+    def rebuild(self):
+        """Полностью перестраивает индекс из базы"""
+        version = catalog_version(INGREDIENTS)[0]
+        rows = Ingredient.objects.annotate(dishes=Count('dishingredient')).values_list('id', 'name', 'dishes')
+        ingredients = {}
+        keys = []
+        for ingredient_id, name, dishes in rows.iterator(chunk_size=5000):
+            ingredients[ingredient_id] = (name, dishes)
+            keys.extend((key, ingredient_id) for key in name_keys(name))
+        keys.sort()
+        with self._lock:
+            self._ingredients = ingredients
+            self._keys = keys
+            self._ranked = None
+            self._cache = {}
+            self._version = version
+            self._built = True
+
+    def ensure_built(self):
+        """
+        Строит индекс при первом обращении и перестраивает при смене версии
+        INGREDIENTS: счетчики блюд могли измениться в другом воркере. Это один
+        GROUP BY по ингредиентам, поэтому изменения не отслеживаются поштучно.
+        """
+        version = catalog_version(INGREDIENTS)[0]
+        if self._built and self._version == version:
+            return
+        with self._lock:
+            if not self._built or self._version != version:
+                self.rebuild()
+
+    def _remove_keys(self, ingredient_id, name):
+        for key in name_keys(name):
+            position = bisect_left(self._keys, (key, ingredient_id))
+            if position < len(self._keys) and self._keys[position] == (key, ingredient_id):
+                del self._keys[position]
+
+    def refresh_ingredient(self, ingredient_id):
+        """Перечитывает название и число блюд одного ингредиента"""
+        if not self._built:
+            return
+        row = (
+            Ingredient.objects.filter(id=ingredient_id)
+            .annotate(dishes=Count('dishingredient')).values_list('name', 'dishes').first()
+        )
+        with self._lock:
+            old = self._ingredients.pop(ingredient_id, None)
+            if old is not None:
+                self._remove_keys(ingredient_id, old[0])
+            if row is not None:
+                name, dishes = row
+                self._ingredients[ingredient_id] = (name, dishes)
+                for key in name_keys(name):
+                    position = bisect_left(self._keys, (key, ingredient_id))
+                    self._keys.insert(position, (key, ingredient_id))
+            self._ranked = None
+            self._cache = {}
+
+    def remove_ingredient(self, ingredient_id):
+        if not self._built:
+            return
+        with self._lock:
+            old = self._ingredients.pop(ingredient_id, None)
+            if old is not None:
+                self._remove_keys(ingredient_id, old[0])
+            self._ranked = None
+            self._cache = {}
+
+    def ranked(self):
+        if self._ranked is None:
+            self._ranked = [i for i, _ in sorted(self._ingredients.items(), key=rank_key)]
+        return self._ranked
+
+    def suggest(self, query, limit=10):
+        """До limit ингредиентов с префиксом query: [(id, название, число блюд)]"""
+        self.ensure_built()
+        prefix = normalize(query)
+        with self._lock:
+            cached = self._cache.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            keys = self._keys
+            start = bisect_left(keys, (prefix,))
+            end = bisect_left(keys, (prefix + '\U0010ffff',))
+            ingredients = self._ingredients
+            if end - start <= RANGE_SCAN_LIMIT:
+                ids = {ingredient_id for _, ingredient_id in keys[start:end]}
+                best = heapq.nsmallest(limit, ((i, ingredients[i]) for i in ids), key=rank_key)
+                best = [i for i, _ in best]
+            else:
+                # Подходящих много, поэтому первые limit найдутся в начале списка
+                best = []
+                for ingredient_id in self.ranked():
+                    name = ingredients[ingredient_id][0]
+                    if any(key.startswith(prefix) for key in name_keys(name)):
+                        best.append(ingredient_id)
+                        if len(best) == limit:
+                            break
+            result = [(i, *ingredients[i]) for i in best]
+
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache = {}
+            self._cache[(prefix, limit)] = result
+            return result
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,115 @@
+"""
+Генератор синтетического каталога для нагрузочных тестов и бенчмарков.
+
+Пишет Dish, Ingredient, DishIngredient, Category и Type через bulk_create
+с заранее назначенными id, поэтому миллион строк состава вставляется за
+десятки секунд. Сигналы при этом не срабатывают: денормализованные
+ingredients_count заполняется здесь же, а индекс
+в памяти нужно перестроить после сида. Последовательности id (Postgres)
+после вставки сдвигаются за наибольший id, чтобы обычные INSERT
+(админка, import_recipes) не получили дубликат ключа.
+"""
+import random
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import Category, Dish, DishIngredient, Ingredient, Type
+
+WORDS = [
+    'Борщ', 'Суп', 'Салат', 'Рагу', 'Пирог', 'Каша', 'Запеканка', 'Омлет', 'Плов', 'Паста',
+    'Гуляш', 'Котлеты', 'Блины', 'Оладьи', 'Жаркое', 'Щи', 'Солянка', 'Ризотто', 'Карри', 'Тушеное',
+]
+ADJECTIVES = [
+    'домашний', 'летний', 'быстрый', 'острый', 'овощной', 'сытный', 'легкий', 'праздничный',
+    'деревенский', 'пряный', 'сливочный', 'грибной', 'рыбный', 'мясной', 'постный',
+]
+UNITS = ['г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.', 'стакан', 'щепотка']
+
+
+def _next_id(model):
+    return (model.objects.aggregate(value=Max('id'))['value'] or 0) + 1
+
+
+def reset_sequences(models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def seed_catalog(dishes=1000, ingredients=500, min_per_dish=5, max_per_dish=15,
+                 categories=12, types=10, starred_ratio=0.05, seed=0, batch_size=5000,
+                 progress=None):
+    """
+    Создает каталог заданного размера и возвращает число созданных строк по моделям.
+    Популярность ингредиентов распределена по Ципфу, как в реальных рецептах:
+    соль и лук встречаются почти везде, экзотика — редко.
+    """
+    rng = random.Random(seed)
+    max_per_dish = min(max_per_dish, ingredients)
+    min_per_dish = min(min_per_dish, max_per_dish)
+
+    with transaction.atomic():
+        first_category = _next_id(Category)
+        Category.objects.bulk_create(
+            Category(id=first_category + i, name=f'Категория {i + 1}') for i in range(categories)
+        )
+        first_type = _next_id(Type)
+        Type.objects.bulk_create(Type(id=first_type + i, name=f'Кухня {i + 1}') for i in range(types))
+        first_ingredient = _next_id(Ingredient)
+        Ingredient.objects.bulk_create(
+            (Ingredient(id=first_ingredient + i, name=f'Ингредиент {i + 1}') for i in range(ingredients)),
+            batch_size=batch_size,
+        )
+
+    ingredient_ids = list(range(first_ingredient, first_ingredient + ingredients))
+    weights = [1 / (rank + 1) for rank in range(ingredients)]
+
+    next_dish = _next_id(Dish)
+    next_row = _next_id(DishIngredient)
+    created_rows = 0
+    for start in range(0, dishes, batch_size):
+        dish_batch = []
+        row_batch = []
+        for number in range(start, min(start + batch_size, dishes)):
+            size = rng.randint(min_per_dish, max_per_dish)
+            chosen = set()
+            while len(chosen) < size:
+                chosen.update(rng.choices(ingredient_ids, weights, k=size - len(chosen)))
+            dish_id = next_dish + number
+            dish_batch.append(Dish(
+                id=dish_id,
+                title=f'{rng.choice(WORDS)} {rng.choice(ADJECTIVES)} №{number + 1}',
+                description='Синтетическое блюдо для нагрузочного теста',
+                instructions='Смешать ингредиенты и готовить до готовности.',
+                cooktime=rng.choice([None] + list(range(5, 185, 5))),
+                category_id=first_category + rng.randrange(categories) if categories else None,
+                type_id=first_type + rng.randrange(types) if types else None,
+                starred=rng.random() < starred_ratio,
+                ingredients_count=len(chosen),
+            ))
+            for ingredient_id in sorted(chosen):
+                row_batch.append(DishIngredient(
+                    id=next_row, dish_id=dish_id, ingredient_id=ingredient_id,
+                    quantity=f'{rng.randint(1, 500)} {rng.choice(UNITS)}',
+                ).parse_quantity())
+                next_row += 1
+
+        with transaction.atomic():
+            Dish.objects.bulk_create(dish_batch)
+            DishIngredient.objects.bulk_create(row_batch, batch_size=batch_size)
+        created_rows += len(row_batch)
+        if progress:
+            progress(start + len(dish_batch), created_rows)
+
+    reset_sequences([Category, Type, Ingredient, Dish, DishIngredient])
+    return {
+        'categories': categories,
+        'types': types,
+        'ingredients': ingredients,
+        'dishes': dishes,
+        'dish_ingredients': created_rows,
+    }
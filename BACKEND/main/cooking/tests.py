@@ -1,3 +1,1219 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .benchmarking import compare_reports, default_scenarios
+from .cache import CATALOG, bump_catalog_version, catalog_version, version_key
+from .facets import catalog_facets
+from .instrumentation import registry
+from .loaders import load_related
+from .matching import ingredient_index
+from .models import Category, Dish, DishIngredient, Ingredient, IngredientPostingList, IngredientSubstitution, SimilarDish, Type
+from .postings import unpack
+from .quantities import parse_quantity
+from .renderers import FastJSONRenderer
+from .search import get_search_backend
+from .serializers import DishSerializer
+from .similar import best, exact_scores
+from .snapshot import build_snapshot
+from .substitutions import SUBSTITUTIONS, substitution_graph
+from .suggest import INGREDIENTS, suggest_index
+
+
+def create_catalog():
+    """Небольшой каталог: 3 ингредиента и 4 блюда с разными наборами"""
+    # Колбэки после коммита (списки блюд ингредиентов и др.) выполняются сразу:
+    # TestCase не коммитит, а пачка колбэков иначе копилась бы до конца теста
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        soup = Category.objects.create(name='Супы')
+        main = Category.objects.create(name='Горячее')
+        russian = Type.objects.create(name='Русская')
+        ingredients = [Ingredient.objects.create(name=name) for name in ('Картофель', 'Морковь', 'Лук')]
+        recipes = [
+            ('Борщ', 60, soup, russian, [0, 1, 2]),
+            ('Пюре', 20, main, None, [0]),
+            ('Рагу', 45, main, russian, [0, 1]),
+            ('Салат', None, None, None, [1, 2]),
+        ]
+        dishes = []
+        for title, cooktime, category, dish_type, items in recipes:
+            dish = Dish.objects.create(
+                title=title, description='', instructions='',
+                cooktime=cooktime, category=category, type=dish_type,
+            )
+            for i in items:
+                DishIngredient.objects.create(dish=dish, ingredient=ingredients[i], quantity='1 шт')
+            dishes.append(dish)
+        return dishes, ingredients
+
+
+def batch_flushes(callbacks):
+    """Функции пачек on_commit_batch среди колбэков captureOnCommitCallbacks"""
+    return [callback.__self__.func.__name__ for callback in callbacks if callback.__qualname__ == '_CommitBatch.flush']
+
+
+class PossibleDishesMemoryEngineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        ingredient_index.rebuild()
+
+    def possible(self, ingredients, willing_to_buy, query=''):
+        response = self.client.post(
+            '/dishes/possible/' + query,
+            {'ingredients': [i.id for i in ingredients], 'willing_to_buy': willing_to_buy},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assert_engines_agree(self, ingredients, willing_to_buy, query=''):
+        with override_settings(COOKING_MATCHING_ENGINE='orm'):
+            expected = self.possible(ingredients, willing_to_buy, query)
+        for engine in ('memory', 'postings'):
+            with override_settings(COOKING_MATCHING_ENGINE=engine):
+                actual = self.possible(ingredients, willing_to_buy, query)
+            self.assertEqual(actual, expected, engine)
+        return actual
+
+    def test_cook_completely_matches_orm(self):
+        data = self.assert_engines_agree(self.ingredients[:2], False)
+        self.assertEqual([d['title'] for d in data['results']], ['Пюре', 'Рагу'])
+
+    def test_willing_to_buy_matches_orm(self):
+        data = self.assert_engines_agree(self.ingredients[1:], True)
+        self.assertEqual(data['count'], 3)
+
+    def test_dish_without_ingredients_is_always_complete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(title='Вода', description='', instructions='')
+        data = self.assert_engines_agree(self.ingredients[:1], False)
+        self.assertEqual([d['title'] for d in data['results']], ['Вода', 'Пюре'])
+        # Совпадений нет, поэтому при willing_to_buy оно не показывается
+        data = self.assert_engines_agree(self.ingredients[:1], True)
+        self.assertNotIn('Вода', [d['title'] for d in data['results']])
+
+    def test_filters_and_ordering_match_orm(self):
+        self.assert_engines_agree(self.ingredients, True, '?category=Горячее&cooktime_max=50')
+        self.assert_engines_agree(self.ingredients, True, '?ordering=-cooktime')
+        self.assert_engines_agree(self.ingredients, False, '?search=раг&type__name=Русская')
+
+    def test_index_follows_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DishIngredient.objects.filter(dish=self.dishes[1]).delete()
+            DishIngredient.objects.create(dish=self.dishes[1], ingredient=self.ingredients[2], quantity='1')
+            self.dishes[3].delete()
+        self.assert_engines_agree(self.ingredients[2:], False)
+
+    def test_one_index_refresh_per_transaction(self):
+        salad = self.dishes[3]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            salad.title = 'Салат весенний'
+            salad.save()
+            for ingredient in self.ingredients[:1]:
+                DishIngredient.objects.create(dish=salad, ingredient=ingredient, quantity='1 шт')
+            DishIngredient.objects.filter(dish=self.dishes[0], ingredient=self.ingredients[0]).delete()
+        self.assertEqual(batch_flushes(callbacks).count('refresh_dishes'), 1)
+        self.assert_engines_agree(self.ingredients, False)
+
+    def test_index_follows_other_workers(self):
+        # Колбэки после коммита здесь не выполняются — как изменения другого воркера
+        DishIngredient.objects.create(dish=self.dishes[3], ingredient=self.ingredients[0], quantity='1')
+        self.dishes[1].delete()
+        bump_catalog_version()
+        expected = self.possible(self.ingredients[:1], True)
+        with override_settings(COOKING_MATCHING_ENGINE='memory'):
+            self.assertEqual(self.possible(self.ingredients[:1], True), expected)
+        self.assertEqual([d['title'] for d in expected['results']], ['Борщ', 'Рагу', 'Салат'])
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+@override_settings(COOKING_CATALOG_VERSION_TTL=60)
+class BatchedLoadingQueryCountTests(TestCase):
+    """Число запросов на страницу не должно зависеть от ее размера"""
+
+    def setUp(self):
+        self.client = APIClient()
+        # Версия каталога читается из базы раз в TTL, не в каждом запросе;
+        # копия от прошлого теста с коротким TTL могла бы истечь посреди теста
+        cache.clear()
+        catalog_version()
+        category = Category.objects.create(name='Супы')
+        dish_type = Type.objects.create(name='Русская')
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}') for i in range(3)]
+        for i in range(20):
+            dish = Dish.objects.create(
+                title=f'Блюдо {i:02}', description='', instructions='',
+                cooktime=10 + i, category=category, type=dish_type, starred=True,
+            )
+            for ingredient in ingredients:
+                DishIngredient.objects.create(dish=dish, ingredient=ingredient, quantity='100 г')
+        self.ingredient_ids = [i.id for i in ingredients]
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_constant(self, method, url, data=None):
+        sep = '&' if '?' in url else '?'
+        small = self.count_queries(method, f'{url}{sep}page_size=2', data)
+        large = self.count_queries(method, f'{url}{sep}page_size=20', data)
+        self.assertEqual(small, large)
+
+    def test_all_dishes(self):
+        self.assert_constant('get', '/dishes/all/')
+
+    def test_starred_dishes(self):
+        # У /starred/ размер страницы фиксирован, поэтому меняем число избранных
+        large = self.count_queries('get', '/starred/')
+        Dish.objects.exclude(title__in=['Блюдо 00', 'Блюдо 01']).update(starred=False)
+        self.assertEqual(self.count_queries('get', '/starred/'), large)
+
+    def test_possible_dishes(self):
+        data = {'ingredients': self.ingredient_ids, 'willing_to_buy': True}
+        self.assert_constant('post', '/dishes/possible/', data)
+
+    def test_possible_dishes_memory_engine(self):
+        ingredient_index.rebuild()
+        data = {'ingredients': self.ingredient_ids, 'willing_to_buy': False}
+        with override_settings(COOKING_MATCHING_ENGINE='memory'):
+            self.assert_constant('post', '/dishes/possible/', data)
+
+
+class IngredientStatsTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+
+    def test_stats_follow_dish_ingredient_writes(self):
+        borscht = Dish.objects.get(pk=self.dishes[0].pk)
+        self.assertEqual(borscht.ingredients_count, 3)
+
+        self.ingredients[2].delete()
+        borscht.refresh_from_db()
+        self.assertEqual(borscht.ingredients_count, 2)
+
+    def test_regular_save_keeps_stats(self):
+        # Экземпляр из create_catalog загружен до добавления состава: ingredients_count=0
+        stale = self.dishes[0]
+        stale.title = 'Борщ украинский'
+        stale.save()
+        borscht = Dish.objects.get(pk=stale.pk)
+        self.assertEqual((borscht.title, borscht.ingredients_count), ('Борщ украинский', 3))
+
+    def test_sync_command_repairs_columns(self):
+        Dish.objects.update(ingredients_count=0)
+        call_command('sync_ingredient_stats', stdout=StringIO())
+        counts = dict(Dish.objects.values_list('title', 'ingredients_count'))
+        self.assertEqual(counts, {'Борщ': 3, 'Пюре': 1, 'Рагу': 2, 'Салат': 2})
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get('/dishes/all/?page=1')
+        with self.assertNumQueries(0):
+            second = self.client.get('/dishes/all/?page=1')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_reference_lists_are_ordered_by_name(self):
+        Category.objects.create(name='Десерты')
+        names = [row['name'] for row in self.client.get('/categories/').json()['results']]
+        self.assertEqual(names, ['Горячее', 'Десерты', 'Супы'])
+
+    def test_conditional_request_gets_304(self):
+        etag = self.client.get('/categories/')['ETag']
+        response = self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_survives_cache_eviction(self):
+        first = self.client.get('/dishes/all/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(title='Щи', description='', instructions='')
+        self.assertEqual(self.client.get('/dishes/all/').json()['count'], 5)
+        cache.delete(version_key(CATALOG))
+        self.assertEqual(self.client.get('/dishes/all/').json()['count'], 5)
+        self.assertEqual(self.client.get('/dishes/all/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_bumps_never_repeat_a_version(self):
+        versions = set()
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                Dish.objects.create(title='Щи', description='', instructions='')
+                Dish.objects.create(title='Уха', description='', instructions='')
+            versions.add(catalog_version()[0])
+        self.assertEqual(len(versions), 3)
+
+    def test_starred_patch_invalidates_cache(self):
+        before = self.client.get('/starred/')
+        self.assertEqual(before.json()['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/starred/{self.dishes[0].pk}/', {'starred': True}, format='json')
+        after = self.client.get('/starred/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()['count'], 1)
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        ingredient_index.rebuild()
+
+    def walk(self, url, data=None):
+        """Проходит все страницы по ссылкам next и возвращает заголовки блюд"""
+        titles = []
+        while url:
+            if data is None:
+                page = self.client.get(url).json()
+            else:
+                page = self.client.post(url, data, format='json').json()
+            self.assertIsNone(page['count'])
+            titles += [d['title'] for d in page['results']]
+            url = page['next']
+        return titles
+
+    def test_all_dishes_cursor_matches_title_order(self):
+        titles = self.walk('/dishes/all/?pagination=cursor&page_size=1')
+        self.assertEqual(titles, ['Борщ', 'Пюре', 'Рагу', 'Салат'])
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get('/dishes/all/?pagination=cursor&page_size=2').json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_count_only_on_request(self):
+        page = self.client.get('/dishes/all/?pagination=cursor&count=true').json()
+        self.assertEqual(page['count'], 4)
+
+    def test_possible_dishes_orderings(self):
+        data = {'ingredients': [self.ingredients[1].id, self.ingredients[2].id], 'willing_to_buy': True}
+        expected = ['Борщ', 'Салат', 'Рагу']
+        for engine in ('orm', 'memory', 'postings'):
+            with override_settings(COOKING_MATCHING_ENGINE=engine):
+                titles = self.walk('/dishes/possible/?pagination=cursor&page_size=1', data)
+                self.assertEqual(titles, expected)
+                titles = self.walk('/dishes/possible/?pagination=cursor&page_size=1&ordering=cooktime', data)
+                self.assertEqual(titles, ['Салат', 'Рагу', 'Борщ'])
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+
+    def titles(self, query):
+        return [d['title'] for d in self.client.get('/dishes/all/' + query).json()['results']]
+
+    def test_search_covers_ingredient_names(self):
+        self.assertEqual(self.titles('?search=лук&ordering=title'), ['Борщ', 'Салат'])
+
+    def test_title_param_matches_word_prefix(self):
+        self.assertEqual(self.titles('?title=бор'), ['Борщ'])
+
+    def test_title_hits_rank_above_ingredient_hits(self):
+        Dish.objects.filter(title='Салат').update(title='Салат луковый')
+        get_search_backend().rebuild()
+        self.assertEqual(self.titles('?search=лук'), ['Салат луковый', 'Борщ'])
+
+    def test_index_follows_ingredient_rename(self):
+        self.ingredients[0].name = 'Батат'
+        self.ingredients[0].save()
+        self.assertEqual(self.titles('?search=батат&ordering=title'), ['Борщ', 'Пюре', 'Рагу'])
+
+    def test_empty_index_falls_back_to_like(self):
+        backend = get_search_backend()
+        if backend.name == 'like':
+            self.skipTest('SQLite без FTS5')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {backend.table}')
+        backend._filled.clear()
+        self.assertEqual(get_search_backend().name, 'like')
+        self.assertEqual(self.titles('?search=орков&ordering=title'), ['Борщ', 'Рагу', 'Салат'])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(get_search_backend().name, backend.name)
+
+    def test_like_backend_gives_same_matches(self):
+        # LIKE в SQLite не сворачивает регистр кириллицы, поэтому запрос с заглавной
+        with override_settings(COOKING_SEARCH_BACKEND='like'):
+            self.assertEqual(self.titles('?search=Лук&ordering=title'), ['Борщ', 'Салат'])
+
+
+class ImportRecipesTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        Ingredient.objects.create(name='Лук')
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        return path
+
+    def test_jsonl_import_dedupes_ingredients(self):
+        recipes = [
+            {'title': 'Суп', 'cooktime': 30, 'category': 'Супы',
+             'ingredients': [{'name': 'лук', 'quantity': '1 шт'}, {'name': 'Морковь', 'quantity': '2 шт'}]},
+            {'title': 'Жареный лук', 'category': 'Супы', 'ingredients': {'Лук ': '3 шт', 'ЛУК': '1 шт'}},
+        ]
+        path = self.write('recipes.jsonl', '\n'.join(json.dumps(r, ensure_ascii=False) for r in recipes))
+        call_command('import_recipes', path, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 1)
+        fried = Dish.objects.get(title='Жареный лук')
+        self.assertEqual(fried.ingredients_count, 1)
+        self.assertEqual(fried.dishingredient_set.get().quantity, '3 шт + 1 шт')
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+    def test_csv_import_resumes_after_checkpoint(self):
+        path = self.write('recipes.csv', (
+            'title,cooktime,starred,ingredients\n'
+            'Первое,10,true,Лук: 1 шт; Соль: щепотка\n'
+            'Второе,,false,Соль: 1 г\n'
+        ))
+        self.write('recipes.csv.progress', '1')
+        call_command('import_recipes', path, resume=True, stdout=StringIO())
+
+        self.assertEqual(list(Dish.objects.values_list('title', 'cooktime')), [('Второе', None)])
+
+
+class PossibleDishesBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        ingredient_index.rebuild()
+
+    def test_batch_matches_single_requests(self):
+        pantries = [
+            {'ingredients': [self.ingredients[0].id, self.ingredients[1].id], 'willing_to_buy': False},
+            {'ingredients': [self.ingredients[2].id], 'willing_to_buy': True,
+             'filters': {'ordering': '-cooktime'}},
+            {'ingredients': [i.id for i in self.ingredients], 'willing_to_buy': True,
+             'filters': {'category': 'Горячее'}, 'page_size': 1, 'page': 2},
+        ]
+        response = self.client.post('/dishes/possible/batch/', {'pantries': pantries}, format='json')
+        self.assertEqual(response.status_code, 200)
+        batch = response.json()['results']
+
+        single = [
+            ('', pantries[0]),
+            ('?ordering=-cooktime', pantries[1]),
+            ('?category=Горячее&page_size=1&page=2', pantries[2]),
+        ]
+        for result, (query, pantry) in zip(batch, single):
+            expected = self.client.post(
+                '/dishes/possible/' + query,
+                {'ingredients': pantry['ingredients'], 'willing_to_buy': pantry['willing_to_buy']},
+                format='json',
+            ).json()
+            self.assertEqual(result['count'], expected['count'])
+            self.assertEqual(result['results'], expected['results'])
+        self.assertEqual((batch[2]['previous_page'], batch[2]['next_page']), (1, None))
+
+    def test_batch_validates_input(self):
+        response = self.client.post('/dishes/possible/batch/', {'pantries': [{'ingredients': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        for filters in ({'cooktime_min': 'abc'}, {'cooktme_max': 30}):
+            response = self.client.post('/dishes/possible/batch/', {
+                'pantries': [{'ingredients': [self.ingredients[0].id], 'filters': filters}],
+            }, format='json')
+            self.assertEqual(response.status_code, 400, filters)
+        response = self.client.post('/dishes/possible/batch/', {
+            'pantries': [{'ingredients': [self.ingredients[0].id], 'willing_to_buy': True, 'filters': {'cooktime_max': '30'}}],
+        }, format='json')
+        self.assertEqual([d['title'] for d in response.json()['results'][0]['results']], ['Пюре'])
+
+
+class RankedPossibleDishesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        ingredient_index.rebuild()
+
+    def ranked(self, query='', **data):
+        response = self.client.post('/dishes/possible/' + query, dict(ranked=True, **data), format='json')
+        self.assertEqual(response.status_code, 200)
+        return [dish['title'] for dish in response.json()['results']]
+
+    def test_orders_by_match_ratio_and_tie_break(self):
+        pantry = [self.ingredients[0].id, self.ingredients[1].id]
+        # Пюре и Рагу — 100%, Борщ — 2/3, Салат — 1/2; при равной доле быстрее — выше
+        self.assertEqual(self.ranked(ingredients=pantry), ['Пюре', 'Рагу', 'Борщ', 'Салат'])
+        self.assertEqual(self.ranked(ingredients=pantry, limit=2), ['Пюре', 'Рагу'])
+        self.assertEqual(self.ranked(ingredients=pantry, min_match=60), ['Пюре', 'Рагу', 'Борщ'])
+
+    def test_starred_tie_break_and_filters(self):
+        Dish.objects.filter(title='Рагу').update(starred=True)
+        ingredient_index.rebuild()
+        pantry = [self.ingredients[0].id, self.ingredients[1].id]
+        self.assertEqual(self.ranked(ingredients=pantry, limit=1, tie_break='starred'), ['Рагу'])
+        self.assertEqual(self.ranked('?category=Горячее', ingredients=pantry, min_match=50), ['Пюре', 'Рагу'])
+
+    def test_matches_full_scan(self):
+        pantry = [self.ingredients[1].id, self.ingredients[2].id]
+        matches = ingredient_index.match(pantry, True)
+        expected = sorted(
+            matches,
+            key=lambda m: (-m.matching_ingredients_count / m.total_ingredients_count,
+                           m.cooktime if m.cooktime is not None else float('inf'), m.id),
+        )
+        top = ingredient_index.top_k(pantry, limit=3)
+        self.assertEqual([m.id for m in top], [m.id for m in expected[:3]])
+
+    def test_validates_input(self):
+        response = self.client.post(
+            '/dishes/possible/', {'ranked': True, 'ingredients': [1], 'limit': 500}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class AsyncViewsTests(TestCase):
+    """Асинхронные представления отдают то же, что и синхронные"""
+
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+        Dish.objects.filter(title__in=['Борщ', 'Салат']).update(starred=True)
+
+    async def assert_same(self, method, url, data=None):
+        sync = await self.async_client.generic(
+            method.upper(), url, json.dumps(data) if data else '', content_type='application/json'
+        )
+        response = await AsyncClient().generic(
+            method.upper(), '/async' + url, json.dumps(data) if data else '', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, sync.status_code)
+        self.assertEqual(
+            response.json(),
+            json.loads(sync.content.decode().replace('/dishes/', '/async/dishes/').replace('/starred/', '/async/starred/')),
+        )
+
+    async def test_lists(self):
+        await self.assert_same('get', '/dishes/all/?page_size=2&page=2&ordering=-cooktime')
+        await self.assert_same('get', '/dishes/all/?search=Лук')
+        await self.assert_same('get', '/dishes/all/?page=9')
+        await self.assert_same('get', '/starred/')
+
+    async def test_possible_dishes(self):
+        ids = [self.ingredients[0].id, self.ingredients[1].id]
+        await self.assert_same('post', '/dishes/possible/', {'ingredients': ids})
+        await self.assert_same('post', '/dishes/possible/?page_size=1&page=2', {'ingredients': ids, 'willing_to_buy': True})
+        await self.assert_same('post', '/dishes/possible/?category=Горячее', {'ingredients': ids, 'willing_to_buy': True})
+        await self.assert_same('post', '/dishes/possible/', {'ingredients': ids, 'ranked': True})
+
+    @override_settings(COOKING_MATCHING_ENGINE='memory')
+    async def test_possible_dishes_memory_engine(self):
+        await sync_to_async(ingredient_index.rebuild)()
+        ids = [self.ingredients[0].id, self.ingredients[2].id]
+        await self.assert_same('post', '/dishes/possible/?ordering=cooktime', {'ingredients': ids, 'willing_to_buy': True})
+        await self.assert_same('post', '/dishes/possible/?title=Салат', {'ingredients': ids, 'willing_to_buy': True})
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class FastSerializerTests(TestCase):
+    """Быстрые сериализаторы и FastJSONRenderer отдают те же байты, что и DRF"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        Dish.objects.filter(title='Борщ').update(
+            starred=True, photo='borsch.jpg', description='Строка\u2028с разделителем "и кавычками"',
+        )
+        Dish.objects.filter(title='Салат').update(starred=True)
+
+    def assert_same_bytes(self, method, url, data=None):
+        responses = []
+        for fast in (False, True):
+            with override_settings(COOKING_FAST_SERIALIZERS=fast):
+                response = getattr(self.client, method)(url, data, format='json')
+            self.assertEqual(response.status_code, 200)
+            responses.append(response.content)
+        self.assertEqual(responses[0], responses[1])
+
+    def test_lists(self):
+        self.assert_same_bytes('get', '/dishes/all/')
+        self.assert_same_bytes('get', '/dishes/all/?pagination=cursor&ordering=cooktime')
+        self.assert_same_bytes('get', '/starred/')
+
+    def test_possible_dishes(self):
+        ids = [self.ingredients[0].id, self.ingredients[2].id]
+        self.assert_same_bytes('post', '/dishes/possible/', {'ingredients': ids, 'willing_to_buy': True})
+        self.assert_same_bytes('post', '/dishes/possible/', {'ingredients': ids, 'ranked': True})
+        pantries = [{'ingredients': ids, 'willing_to_buy': True}, {'ingredients': ids[:1]}]
+        self.assert_same_bytes('post', '/dishes/possible/batch/', {'pantries': pantries})
+
+    def test_renderer(self):
+        data = self.client.get('/dishes/all/').data
+        self.assertIn('\u2028', data['results'][0]['description'])
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_scoped_to_hot_views(self):
+        response = self.client.post('/dishes/possible/', {'ingredients': [1]}, format='json')
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        # Справочники рендерит DRF по умолчанию
+        response = self.client.get('/categories/')
+        self.assertNotIsInstance(response.accepted_renderer, FastJSONRenderer)
+
+    @override_settings(COOKING_FAST_SERIALIZERS=True)
+    def test_schema_uses_drf_serializers(self):
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ingredients', response.json()['definitions']['Dish']['properties'])
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.dishes, self.ingredients = create_catalog()
+        self.data = {'ingredients': [i.id for i in self.ingredients[:2]], 'willing_to_buy': True}
+        registry.reset()
+
+    def timings(self, response):
+        return {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/dishes/possible/', self.data, format='json')
+        timings = self.timings(response)
+        self.assertIn(f'desc="{len(queries)} queries"', timings['db'])
+        self.assertIn('desc="4 rows"', timings['rows'])
+        for phase in ('total', 'match', 'filter', 'paginate', 'serialize'):
+            self.assertIn(phase, timings)
+
+    async def test_async_view_is_measured(self):
+        response = await self.async_client.post(
+            '/async/dishes/possible/', self.data, content_type='application/json'
+        )
+        self.assertNotIn('desc="0 queries"', self.timings(response)['db'])
+
+    @override_settings(COOKING_METRICS_TOKEN='secret')
+    def test_prometheus_endpoint(self):
+        self.client.post('/dishes/possible/', self.data, format='json')
+        self.client.post('/dishes/possible/', self.data, format='json')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        body = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('cooking_requests_total{route="dishes/possible/",method="POST",status="200"} 2', body)
+        self.assertIn('cooking_rows_returned_total{route="dishes/possible/",method="POST"} 8', body)
+        self.assertIn('cooking_request_duration_seconds_count{route="dishes/possible/",method="POST"} 2', body)
+
+    @override_settings(COOKING_SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('cooking.slow', 'WARNING') as logs:
+            self.client.post('/dishes/possible/', self.data, format='json')
+        self.assertIn('POST /dishes/possible/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        # Значения параметров по умолчанию не пишутся, только плейсхолдеры
+        self.assertIn('IN (%s, %s)', logs.output[0])
+        self.assertNotIn(f'({self.data["ingredients"][0]}, {self.data["ingredients"][1]})', logs.output[0])
+
+        with self.settings(COOKING_SLOW_LOG_PARAMS=True), self.assertLogs('cooking.slow', 'WARNING') as logs:
+            self.client.post('/dishes/possible/', self.data, format='json')
+        self.assertIn(f'({self.data["ingredients"][0]}, {self.data["ingredients"][1]})', logs.output[0])
+
+
+def photo_upload(name='photo.jpg', size=(1600, 1200)):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, 'JPEG', quality=95)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0, COOKING_PHOTO_ASYNC=False)
+class PhotoVariantsTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def test_upload_builds_hashed_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = Dish.objects.create(title='Борщ', description='', instructions='', photo=photo_upload())
+        self.assertRegex(dish.photo.name, r'^dishes/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+        dish.refresh_from_db()
+        sizes = dish.photo_variants['sizes']
+        self.assertEqual((sizes['card']['width'], sizes['card']['height']), (480, 360))
+        self.assertLess(default_storage.size(sizes['card']['webp']), default_storage.size(dish.photo.name) / 10)
+
+        result = self.client.get('/dishes/all/').json()['results'][0]
+        self.assertTrue(result['photo_variants']['thumb']['webp'].endswith('/thumb.webp'))
+        self.assertTrue(result['photo_variants']['large']['jpeg'].startswith('http://testserver/media/'))
+
+    def test_same_content_is_stored_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Dish.objects.create(title='А', description='', instructions='', photo=photo_upload('a.jpg'))
+            second = Dish.objects.create(title='Б', description='', instructions='', photo=photo_upload('b.jpg'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertEqual(first.photo_variants['digest'], second.photo_variants['digest'])
+        self.assertEqual(first.photo_variants['sizes'], second.photo_variants['sizes'])
+
+    def test_backfill_command(self):
+        name = default_storage.save('legacy.jpg', photo_upload())
+        Dish.objects.create(title='Старое', description='', instructions='', photo=name)
+        Dish.objects.update(photo_variants={})
+        self.assertIsNone(self.client.get('/dishes/all/').json()['results'][0]['photo_variants'])
+
+        out = StringIO()
+        call_command('generate_photo_variants', workers=1, stdout=out)
+        self.assertIn('Built variants for 1 photos', out.getvalue())
+        variants = self.client.get('/dishes/all/').json()['results'][0]['photo_variants']
+        self.assertEqual(set(variants), {'thumb', 'card', 'large'})
+
+
+class QuantityTests(TestCase):
+    def test_parse_quantity_normalizes_units(self):
+        cases = {
+            '200 г': ('200.000', 'г'),
+            '1,5 кг': ('1500.000', 'г'),
+            '2 ст. л.': ('30.000', 'мл'),
+            '1/2 стакана': ('125.000', 'мл'),
+            '1½ л': ('1500.000', 'мл'),
+            '2-3 шт': ('3.000', 'шт'),
+            '3': ('3.000', 'шт'),
+            '2 зубчика': ('2.000', 'зубчика'),
+            '3 шт + 1 шт': ('4.000', 'шт'),
+        }
+        for text, (amount, unit) in cases.items():
+            parsed_amount, parsed_unit = parse_quantity(text)
+            self.assertEqual((str(parsed_amount), parsed_unit), (amount, unit), text)
+        self.assertEqual(parse_quantity('по вкусу'), (None, ''))
+        # 1e11 г не помещается в DishIngredient.amount
+        self.assertEqual(parse_quantity('100000000 кг'), (None, ''))
+        self.assertEqual(str(parse_quantity('999999 кг')[0]), '999999000.000')
+
+    def test_save_accepts_amount_out_of_range(self):
+        dishes, ingredients = create_catalog()
+        row = DishIngredient.objects.create(dish=dishes[1], ingredient=ingredients[1], quantity='100000000 кг')
+        row.refresh_from_db()
+        self.assertEqual((row.amount, row.unit), (None, ''))
+
+    def test_save_and_backfill_fill_amount(self):
+        dishes, ingredients = create_catalog()
+        row = DishIngredient.objects.filter(dish=dishes[0]).first()
+        row.quantity = '0,5 кг'
+        row.save(update_fields=['quantity'])
+        row.refresh_from_db()
+        self.assertEqual((str(row.amount), row.unit), ('500.000', 'г'))
+
+        DishIngredient.objects.update(amount=None, unit='')
+        out = StringIO()
+        call_command('parse_quantities', stdout=out)
+        self.assertIn('8 updated', out.getvalue())
+        self.assertFalse(DishIngredient.objects.filter(amount__isnull=True).exists())
+
+    def test_shopping_list_sums_missing_ingredients(self):
+        dishes, ingredients = create_catalog()
+        DishIngredient.objects.filter(dish=dishes[0], ingredient=ingredients[1]).update(amount=None, unit='')
+        DishIngredient.objects.filter(dish=dishes[3], ingredient=ingredients[1]).update(amount=700, unit='г')
+        DishIngredient.objects.filter(dish=dishes[2], ingredient=ingredients[1]).update(amount=800, unit='г')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post('/shopping-list/', {
+                'dishes': [d.id for d in dishes], 'ingredients': [ingredients[0].id],
+            }, format='json')
+        self.assertEqual(len(queries), 1)
+        rows = [(r['ingredient']['name'], r['unit'], r['display'], r['dishes']) for r in response.json()['results']]
+        self.assertEqual(rows, [
+            ('Лук', 'шт', '2 шт', 2),
+            ('Морковь', '', '', 1),
+            ('Морковь', 'г', '1.5 кг', 2),
+        ])
+
+
+class IngredientSuggestTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+        Ingredient.objects.create(name='Зелёный лук')
+        suggest_index.rebuild()
+        self.client = APIClient()
+
+    def suggest(self, **params):
+        response = self.client.get('/ingredients/suggest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['name'], row['dishes']) for row in response.json()['results']]
+
+    def test_prefix_of_any_word_ranked_by_usage(self):
+        self.assertEqual(self.suggest(q='лу'), [('Лук', 2), ('Зелёный лук', 0)])
+        self.assertEqual(self.suggest(q='зеле'), [('Зелёный лук', 0)])
+        self.assertEqual(self.suggest(q='', limit=2), [('Картофель', 3), ('Морковь', 3)])
+        self.assertEqual(self.client.get('/ingredients/suggest/', {'limit': 0}).status_code, 400)
+
+    def test_index_follows_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Лавровый лист')
+            DishIngredient.objects.create(dish=self.dishes[1], ingredient=self.ingredients[2], quantity='1 шт')
+        self.assertEqual(self.suggest(q='л'), [('Лук', 3), ('Зелёный лук', 0), ('Лавровый лист', 0)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[2].delete()
+        self.assertEqual(self.suggest(q='л'), [('Зелёный лук', 0), ('Лавровый лист', 0)])
+
+    def test_index_follows_other_workers(self):
+        # Без колбэков после коммита — как изменение в другом воркере
+        DishIngredient.objects.create(dish=self.dishes[1], ingredient=self.ingredients[2], quantity='1 шт')
+        bump_catalog_version(INGREDIENTS)
+        self.assertEqual(self.suggest(q='лу'), [('Лук', 3), ('Зелёный лук', 0)])
+
+    def test_dish_edits_keep_index(self):
+        self.suggest(q='лу')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/starred/{self.dishes[0].pk}/', {'starred': True}, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.suggest(q='лу')
+        # Отметка избранного не меняет версию INGREDIENTS: индекс не перестраивается
+        self.assertFalse([q for q in queries if 'cooking_ingredient' in q['sql']])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        # Откат теста возвращает версии каталога, и ключи ответов повторились бы
+        cache.clear()
+        self.dishes, self.ingredients = create_catalog()
+        catalog_facets.rebuild()
+        self.client = APIClient()
+
+    def summary(self, facets):
+        return (
+            {row['name']: row['count'] for row in facets['category']},
+            {row['name']: row['count'] for row in facets['type']},
+            {row['bucket']: row['count'] for row in facets['cooktime']},
+        )
+
+    def test_all_dishes_facets_follow_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(title='Уха', description='', instructions='', cooktime=25,
+                                category=Category.objects.get(name='Супы'))
+        facets = self.client.get('/dishes/all/', {'facets': 'true'}).json()['facets']
+        self.assertEqual(self.summary(facets), (
+            {'Горячее': 2, 'Супы': 2}, {'Русская': 2}, {'quick': 2, 'medium': 2, 'long': 0},
+        ))
+
+        with CaptureQueriesContext(connection) as queries:
+            facets = self.client.get('/dishes/all/', {'facets': 'true', 'search': 'Борщ'}).json()['facets']
+        self.assertEqual(self.summary(facets), ({'Супы': 1}, {'Русская': 1}, {'quick': 0, 'medium': 1, 'long': 0}))
+        self.assertIn('GROUP BY', queries.captured_queries[-1]['sql'])
+
+    def test_all_dishes_facets_follow_other_workers(self):
+        # UPDATE без сигналов и колбэков — как изменение в другом воркере
+        Dish.objects.filter(title='Пюре').update(cooktime=90, updated_at=timezone.now())
+        self.dishes[3].delete()
+        bump_catalog_version()
+        facets = self.client.get('/dishes/all/', {'facets': 'true'}).json()['facets']
+        self.assertEqual(self.summary(facets), (
+            {'Горячее': 2, 'Супы': 1}, {'Русская': 2}, {'quick': 0, 'medium': 2, 'long': 1},
+        ))
+
+    def test_possible_dishes_facets_in_both_engines(self):
+        body = {'ingredients': [self.ingredients[0].id, self.ingredients[1].id], 'willing_to_buy': True}
+        expected = ({'Горячее': 2, 'Супы': 1}, {'Русская': 2}, {'quick': 1, 'medium': 2, 'long': 0})
+        for engine in ('orm', 'memory', 'postings'):
+            with self.subTest(engine=engine), override_settings(COOKING_MATCHING_ENGINE=engine):
+                ingredient_index.rebuild()
+                response = self.client.post('/dishes/possible/?facets=true', body, format='json').json()
+                self.assertEqual(response['count'], 4)
+                self.assertEqual(self.summary(response['facets']), expected)
+
+
+class PostingListTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+
+    def postings(self):
+        return {
+            row.ingredient.name: list(unpack(row.dish_ids))
+            for row in IngredientPostingList.objects.select_related('ingredient')
+        }
+
+    def test_lists_follow_signals_and_rebuild(self):
+        onion = self.ingredients[2]
+        self.assertEqual(self.postings()['Лук'], [self.dishes[0].id, self.dishes[3].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dishes[0].delete()
+            DishIngredient.objects.create(dish=self.dishes[1], ingredient=onion, quantity='1 шт')
+        self.assertEqual(self.postings()['Лук'], [self.dishes[1].id, self.dishes[3].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            onion.delete()
+        self.assertNotIn('Лук', self.postings())
+
+        expected = self.postings()
+        IngredientPostingList.objects.all().delete()
+        call_command('rebuild_postings', stdout=StringIO())
+        self.assertEqual(self.postings(), expected)
+
+    def test_changed_ingredient_leaves_old_list(self):
+        garlic = Ingredient.objects.create(name='Чеснок')
+        row = DishIngredient.objects.get(dish=self.dishes[0], ingredient=self.ingredients[2])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            row.ingredient = garlic
+            row.save()
+            row.quantity = '2 зубчика'
+            row.save()
+        # Оба списка пересчитаны одним колбэком на транзакцию
+        self.assertEqual(batch_flushes(callbacks).count('refresh_postings'), 1)
+        self.assertEqual(self.postings()['Лук'], [self.dishes[3].id])
+        self.assertEqual(self.postings()['Чеснок'], [self.dishes[0].id])
+
+        body = {'ingredients': [self.ingredients[2].id], 'willing_to_buy': True}
+        for engine in ('orm', 'postings'):
+            with self.subTest(engine=engine), self.settings(COOKING_MATCHING_ENGINE=engine):
+                titles = [row['title'] for row in APIClient().post('/dishes/possible/', body, format='json').json()['results']]
+                self.assertEqual(titles, ['Салат'])
+
+    @override_settings(COOKING_MATCHING_ENGINE='postings')
+    def test_too_many_candidates_fall_back_to_orm(self):
+        body = {'ingredients': [i.id for i in self.ingredients], 'willing_to_buy': True}
+        with self.settings(COOKING_POSTINGS_MAX_CANDIDATES=2), CaptureQueriesContext(connection) as queries:
+            data = APIClient().post('/dishes/possible/', body, format='json').json()
+        self.assertEqual(data['count'], 4)
+        self.assertTrue(any('cooking_dishingredient' in q['sql'] and 'GROUP BY' in q['sql']
+                            for q in queries.captured_queries))
+
+
+class BenchmarkTests(TestCase):
+    def test_compare_flags_only_real_regressions(self):
+        baseline = {'scenarios': {
+            'starred': {'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'throughput_rps': 100.0, 'queries_per_request': 2},
+            'categories': {'p50_ms': 0.2, 'p95_ms': 0.3, 'p99_ms': 0.4, 'queries_per_request': 1},
+        }}
+        current = {'scenarios': {
+            'starred': {'p50_ms': 11.0, 'p95_ms': 40.0, 'p99_ms': 30.0, 'throughput_rps': 60.0, 'queries_per_request': 3},
+            # На быстрых запросах двукратный рост меньше min_delta_ms — шум
+            'categories': {'p50_ms': 0.5, 'p95_ms': 0.6, 'p99_ms': 0.8, 'queries_per_request': 1},
+            'new_scenario': {'p50_ms': 100.0},
+        }}
+        found = {(r['scenario'], r['metric']) for r in compare_reports(baseline, current)}
+        self.assertEqual(found, {
+            ('starred', 'p95_ms'), ('starred', 'throughput_rps'), ('starred', 'queries_per_request'),
+        })
+
+    def test_deep_page_exists_in_small_catalog(self):
+        create_catalog()
+        urls = {name: url for name, _, url, _ in default_scenarios(pantry_sizes=(2,))}
+        self.assertEqual(urls['all_deep_page'], '/dishes/all/?page=1')
+        self.assertEqual(self.client.get(urls['all_deep_page']).status_code, 200)
+
+    def test_command_writes_report_and_compares(self):
+        create_catalog()
+        Dish.objects.filter(title='Борщ').update(starred=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'report.json')
+            call_command('benchmark', repeat=2, pantry_sizes='2', output=output, stdout=StringIO())
+            with open(output, encoding='utf-8') as fh:
+                report = json.load(fh)
+            self.assertEqual(report['catalog']['dishes'], 4)
+            self.assertIn('starred_update', report['scenarios'])
+            self.assertIn('possible_willing_2', report['scenarios'])
+            self.assertIn('throughput_rps', report['scenarios']['starred'])
+
+            # Базовый отчет с нулем запросов гарантирует регрессию
+            for summary in report['scenarios'].values():
+                summary['queries_per_request'] = 0
+            with open(output, 'w', encoding='utf-8') as fh:
+                json.dump(report, fh)
+            with self.assertRaises(CommandError):
+                call_command('benchmark', repeat=1, pantry_sizes='2', compare=output,
+                             stdout=StringIO(), stderr=StringIO())
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+        Dish.objects.filter(title__in=['Борщ', 'Салат']).update(starred=True)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'catalog.snapshot')
+        call_command('build_catalog_snapshot', output=self.path, stdout=StringIO())
+
+    def fetch(self, url, body=None):
+        client = APIClient()
+        if body is None:
+            return client.get(url)
+        return client.post(url, body, format='json')
+
+    def test_responses_match_database(self):
+        ids = [i.id for i in self.ingredients]
+        requests = [
+            ('/dishes/all/', None),
+            ('/dishes/all/?ordering=-cooktime', None),
+            ('/dishes/all/?ordering=cooktime&page_size=2&page=2', None),
+            ('/dishes/possible/', {'ingredients': ids[:2], 'willing_to_buy': False}),
+            ('/dishes/possible/', {'ingredients': ids[1:], 'willing_to_buy': True}),
+            ('/dishes/possible/?category=Горячее&cooktime_max=50', {'ingredients': ids, 'willing_to_buy': True}),
+            ('/dishes/possible/?ordering=-cooktime&page_size=2', {'ingredients': ids, 'willing_to_buy': True}),
+        ]
+        for url, body in requests:
+            with self.settings(COOKING_CACHE_TIMEOUT=0):
+                expected = self.fetch(url, body).content
+            with self.settings(COOKING_SNAPSHOT_PATH=self.path, COOKING_SNAPSHOT_CHECK_INTERVAL=0):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.fetch(url, body)
+            self.assertIn('X-Catalog-Snapshot', response, url)
+            # Из базы — только отметки избранного на странице
+            self.assertEqual(len(queries), 1, url)
+            self.assertEqual(response.content, expected, url)
+
+    @override_settings(COOKING_CACHE_TIMEOUT=0, COOKING_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_dish_without_ingredients_is_always_complete(self):
+        Dish.objects.create(title='Вода', description='', instructions='')
+        call_command('build_catalog_snapshot', output=self.path, stdout=StringIO())
+        body = {'ingredients': [self.ingredients[0].id], 'willing_to_buy': False}
+        expected = self.fetch('/dishes/possible/', body).content
+        with self.settings(COOKING_SNAPSHOT_PATH=self.path):
+            response = self.fetch('/dishes/possible/', body)
+        self.assertIn('X-Catalog-Snapshot', response)
+        self.assertEqual(response.content, expected)
+        self.assertEqual([d['title'] for d in response.json()['results']], ['Вода', 'Пюре'])
+
+    @override_settings(COOKING_CACHE_TIMEOUT=0, COOKING_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_starred_flags_are_live(self):
+        with self.settings(COOKING_SNAPSHOT_PATH=self.path):
+            self.fetch('/dishes/all/')
+            client = APIClient()
+            client.patch(f'/starred/{self.dishes[0].pk}/', {'starred': False}, format='json')
+            client.patch(f'/starred/{self.dishes[1].pk}/', {'starred': True}, format='json')
+            starred = self.fetch('/starred/')
+            rows = self.fetch('/dishes/all/').json()['results']
+            matches = self.fetch('/dishes/possible/', {'ingredients': [self.ingredients[0].id]}).json()['results']
+        self.assertNotIn('X-Catalog-Snapshot', starred)
+        self.assertEqual([d['title'] for d in starred.json()['results']], ['Пюре', 'Салат'])
+        self.assertEqual({d['title']: d['starred'] for d in rows}, {'Борщ': False, 'Пюре': True, 'Рагу': False, 'Салат': True})
+        self.assertEqual([(d['title'], d['starred']) for d in matches], [('Пюре', True)])
+
+    @override_settings(COOKING_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_unsupported_requests_fall_back_and_new_snapshot_is_picked_up(self):
+        with self.settings(COOKING_SNAPSHOT_PATH=self.path):
+            self.assertNotIn('X-Catalog-Snapshot', self.fetch('/dishes/all/?search=борщ'))
+            Dish.objects.filter(title='Пюре').update(title='Картофельное пюре')
+            stale = [d['title'] for d in self.fetch('/dishes/all/').json()['results']]
+
+            build_snapshot(self.path)
+            fresh = [d['title'] for d in self.fetch('/dishes/all/').json()['results']]
+        self.assertEqual(stale, ['Борщ', 'Пюре', 'Рагу', 'Салат'])
+        self.assertEqual(fresh, ['Борщ', 'Картофельное пюре', 'Рагу', 'Салат'])
+
+
+class SimilarDishesTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+        call_command('compute_similar_dishes', stdout=StringIO())
+
+    def similar(self, dish):
+        response = APIClient().get(f'/dishes/{dish.id}/similar/')
+        return [(row['title'], row['score']) for row in response.json()['results']]
+
+    def assert_exact(self):
+        for dish in Dish.objects.all():
+            stored = list(SimilarDish.objects.filter(dish=dish).order_by('rank').values_list('score', 'similar_id'))
+            self.assertEqual(stored, best(exact_scores(dish.id), 10), dish.title)
+
+    def test_endpoint_serves_precomputed_neighbors(self):
+        self.assert_exact()
+        with CaptureQueriesContext(connection) as queries:
+            neighbors = self.similar(self.dishes[0])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(neighbors, [('Рагу', 0.667), ('Салат', 0.667), ('Пюре', 0.333)])
+        self.assertEqual(APIClient().get('/dishes/999999/similar/').status_code, 404)
+
+    def test_neighbors_follow_ingredient_changes(self):
+        mash, stew = self.dishes[1], self.dishes[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            DishIngredient.objects.create(dish=mash, ingredient=self.ingredients[2], quantity='1 шт')
+        self.assertEqual(self.similar(mash)[0], ('Борщ', 0.667))
+        self.assert_exact()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stew.delete()
+        self.assertNotIn('Рагу', [title for title, _ in self.similar(self.dishes[0])])
+        self.assert_exact()
+
+    def test_one_refresh_per_transaction(self):
+        salad = self.dishes[3]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            DishIngredient.objects.filter(dish=salad).delete()
+            for ingredient in self.ingredients:
+                DishIngredient.objects.create(dish=salad, ingredient=ingredient, quantity='1 шт')
+        self.assertEqual(batch_flushes(callbacks).count('refresh_similar'), 1)
+        self.assertEqual(self.similar(salad)[0], ('Борщ', 1.0))
+        self.assert_exact()
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0)
+class IngredientSubstitutionTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+        potato, _, onion = self.ingredients
+        self.sweet_potato, shallot, self.leek = (
+            Ingredient.objects.create(name=name) for name in ('Батат', 'Шалот', 'Порей')
+        )
+        IngredientSubstitution.objects.create(ingredient=potato, substitute=self.sweet_potato, cost=1)
+        IngredientSubstitution.objects.create(ingredient=onion, substitute=shallot, cost=1)
+        IngredientSubstitution.objects.create(ingredient=shallot, substitute=self.leek, cost=1)
+        substitution_graph.invalidate()
+        ingredient_index.rebuild()
+
+    def possible(self, ingredients, willing_to_buy=False, substitutions=True):
+        response = APIClient().post('/dishes/possible/', {
+            'ingredients': [i.id for i in ingredients],
+            'willing_to_buy': willing_to_buy,
+            'substitutions': substitutions,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {row['title']: row for row in response.json()['results']}
+
+    def test_substitutes_cover_recipe_ingredients(self):
+        carrot = self.ingredients[1]
+        self.assertEqual(self.possible([self.sweet_potato, carrot], substitutions=False), {})
+        for engine in ('orm', 'memory', 'postings'):
+            for fast in (False, True):
+                with self.subTest(engine=engine, fast=fast), override_settings(
+                    COOKING_MATCHING_ENGINE=engine, COOKING_FAST_SERIALIZERS=fast
+                ):
+                    rows = self.possible([self.sweet_potato, carrot, self.leek])
+                    self.assertEqual(sorted(rows), ['Борщ', 'Пюре', 'Рагу', 'Салат'])
+                    self.assertEqual(rows['Борщ']['missing_ingredients'], [])
+                    self.assertEqual(rows['Борщ']['match_percentage'], 100.0)
+                    # Лук закрыт пореем через шалот: цены складываются
+                    self.assertEqual(rows['Борщ']['substitutions'], [
+                        {'ingredient_id': self.ingredients[0].id, 'ingredient': 'Картофель',
+                         'substitute_id': self.sweet_potato.id, 'substitute': 'Батат', 'cost': 1},
+                        {'ingredient_id': self.ingredients[2].id, 'ingredient': 'Лук',
+                         'substitute_id': self.leek.id, 'substitute': 'Порей', 'cost': 2},
+                    ])
+
+    def test_exact_ingredient_wins_and_cost_is_limited(self):
+        rows = self.possible([self.sweet_potato, *self.ingredients[:1]], willing_to_buy=True)
+        self.assertEqual(rows['Пюре']['substitutions'], [])
+        self.assertNotIn('substitutions', self.possible(self.ingredients[:1], substitutions=False)['Пюре'])
+
+        with override_settings(COOKING_SUBSTITUTION_MAX_COST=1):
+            substitution_graph.rebuild()
+            rows = self.possible([self.leek, self.ingredients[1]], willing_to_buy=True)
+        substitution_graph.invalidate()
+        self.assertEqual(rows['Салат']['missing_ingredients'], ['Лук'])
+        self.assertEqual(rows['Салат']['substitutions'], [])
+
+    def test_flag_is_parsed_as_boolean(self):
+        carrot = self.ingredients[1]
+        self.assertEqual(self.possible([self.sweet_potato, carrot], substitutions='false'), {})
+        self.assertEqual(sorted(self.possible([self.sweet_potato, carrot], substitutions='true')), ['Пюре', 'Рагу'])
+        response = APIClient().post('/dishes/possible/', {'ingredients': [carrot.id], 'substitutions': 'abc'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ranked_mode_uses_substitutions(self):
+        carrot = self.ingredients[1]
+        data = {'ingredients': [self.sweet_potato.id, carrot.id], 'ranked': True, 'min_match': 100}
+        response = APIClient().post('/dishes/possible/', data, format='json')
+        self.assertEqual(response.json()['results'], [])
+
+        response = APIClient().post('/dishes/possible/', {**data, 'substitutions': True}, format='json')
+        rows = {row['title']: row for row in response.json()['results']}
+        self.assertEqual(sorted(rows), ['Пюре', 'Рагу'])
+        self.assertEqual(rows['Рагу']['match_percentage'], 100.0)
+        self.assertEqual([s['substitute'] for s in rows['Рагу']['substitutions']], ['Батат'])
+
+    def test_graph_follows_other_workers(self):
+        self.assertEqual(sorted(self.possible([self.sweet_potato, self.leek])), ['Пюре'])
+        # Без колбэков после коммита — как правка замен в другом воркере
+        IngredientSubstitution.objects.create(ingredient=self.ingredients[1], substitute=self.leek, cost=1)
+        bump_catalog_version(SUBSTITUTIONS)
+        self.assertEqual(sorted(self.possible([self.sweet_potato, self.leek])), ['Борщ', 'Пюре', 'Рагу', 'Салат'])
+
+
+@override_settings(COOKING_CACHE_TIMEOUT=0, COOKING_EXPORT_CHUNK_SIZE=3, COOKING_EXPORT_OVERLAP=0)
+class DishExportTests(TestCase):
+    def setUp(self):
+        self.dishes, self.ingredients = create_catalog()
+
+    def export(self, query='', **headers):
+        response = self.client.get('/dishes/export/' + query, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        *rows, trailer = [json.loads(line) for line in body.splitlines()]
+        return rows, trailer['next_since']
+
+    def test_streams_whole_catalog(self):
+        response = self.client.get('/dishes/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows, _ = self.export()
+        dishes = DishSerializer(load_related(list(Dish.objects.order_by('id'))), many=True).data
+        self.assertEqual([{k: v for k, v in row.items() if k != 'updated_at'} for row in rows], json.loads(json.dumps(dishes)))
+        self.assertTrue(all(row['updated_at'] for row in rows))
+
+        self.assertEqual(self.client.get('/dishes/export/', headers={'accept-encoding': 'gzip'})['Content-Encoding'], 'gzip')
+        self.assertEqual(self.export(accept_encoding='gzip, deflate')[0], rows)
+
+    def titles(self, rows):
+        return [row.get('title', row['id']) for row in rows]
+
+    def test_since_exports_changes_and_deletions(self):
+        _, since = self.export()
+        # Граница включается: повтор последних блюд потребитель схлопывает по id
+        rows, next_since = self.export(f'?since={since}')
+        self.assertEqual(next_since, since)
+        self.assertTrue(all(row['updated_at'] == since for row in rows))
+
+        DishIngredient.objects.create(dish=self.dishes[1], ingredient=self.ingredients[2], quantity='1 шт')
+        self.dishes[0].category.save()
+        self.ingredients[1].name = 'Свекла'
+        self.ingredients[1].save()
+        rows, next_since = self.export(f'?since={since}')
+        self.assertEqual(self.titles(rows), ['Борщ', 'Пюре', 'Рагу', 'Салат'])
+        self.assertEqual(next_since, max(row['updated_at'] for row in rows))
+
+        salad_id = self.dishes[3].id
+        self.dishes[3].delete()
+        self.ingredients[0].save()
+        rows, _ = self.export(f'?since={next_since}')
+        self.assertEqual(self.titles(rows), ['Борщ', 'Пюре', 'Рагу', salad_id])
+        self.assertTrue(rows[-1]['deleted'])
+        self.assertEqual(self.client.get('/dishes/export/?since=вчера').status_code, 400)
+
+    @override_settings(COOKING_EXPORT_OVERLAP=60)
+    def test_next_since_overlaps_uncommitted_saves(self):
+        # Блюдо сохранено до чтения, а закоммичено после: его updated_at старше прочитанных
+        _, since = self.export()
+        Dish.objects.filter(pk=self.dishes[1].pk).update(updated_at=timezone.now() - datetime.timedelta(seconds=30))
+        rows, _ = self.export(f'?since={since}')
+        self.assertIn('Пюре', self.titles(rows))
@@ -1,5 +1,7 @@
 from django.urls import  path, re_path, include
-from .views import AllDishListView, PossibleDishesListView, StarredDishView, StarredUpdateView
+from .instrumentation import metrics_view
+from .async_views import AsyncAllDishListView, AsyncPossibleDishesListView, AsyncStarredDishView
+from .views import AllDishListView, CategoryList, DishExportView, IngredientSuggestView, PossibleDishesBatchView, PossibleDishesListView, ShoppingListView, SimilarDishesView, StarredDishView, StarredUpdateView, TypeList
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -23,8 +25,20 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('dishes/all/', AllDishListView.as_view()),
     path('dishes/possible/', PossibleDishesListView.as_view()),
+    path('dishes/possible/batch/', PossibleDishesBatchView.as_view()),
+    path('dishes/<int:pk>/similar/', SimilarDishesView.as_view()),
+    path('dishes/export/', DishExportView.as_view()),
     path('starred/',StarredDishView.as_view()),
     path('starred/<int:pk>/',StarredUpdateView.as_view()),
+    path('categories/', CategoryList.as_view()),
+    path('types/', TypeList.as_view()),
+    path('ingredients/suggest/', IngredientSuggestView.as_view()),
+    path('shopping-list/', ShoppingListView.as_view()),
+    path('metrics/', metrics_view),
+    # Асинхронные версии для развертывания под ASGI (см. async_views.py)
+    path('async/dishes/all/', AsyncAllDishListView.as_view()),
+    path('async/dishes/possible/', AsyncPossibleDishesListView.as_view()),
+    path('async/starred/', AsyncStarredDishView.as_view()),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
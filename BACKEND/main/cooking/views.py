@@ -1,136 +1,302 @@
 from rest_framework.generics import ListAPIView, UpdateAPIView
 from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from .models import Dish, Category, Type
-from .serializers import CategorySerializer, DishSerializer, DishUpdateSerializer, ElasticDishSerializer, TypeSerializer
-from django.db.models import Count, F, Q
+from .models import Dish, DishIngredient, Category, SimilarDish, Type
+from .serializers import CategorySerializer, DishSerializer, DishUpdateSerializer, ElasticDishSerializer, MatchModeSerializer, PantryBatchSerializer, RankedMatchSerializer, ShoppingListSerializer, SuggestQuerySerializer, TypeSerializer
+from .cache import CachedListMixin
+from .export import export_response
+from .facets import FacetsMixin, match_facets, queryset_facets, wants_facets
+from .instrumentation import record_rows, timed
+from .fast_serializers import FastDishSerializer, FastElasticDishSerializer, FastSerializerMixin, fast_serializers_enabled, query_ingredient_rows
+from .loaders import load_related, with_related
+from .matching import DishMatch, build_predicate, filter_matches, ingredient_index, load_dishes, memory_engine_enabled, request_ordering
+from .pagination import CursorPaginationMixin, get_paginator
+from .postings import postings_engine_enabled, postings_queryset
+from .quantities import format_quantity
+from .search import FullTextSearchFilter
+from .snapshot import SnapshotEntry, SnapshotListMixin, accepts_json, catalog_snapshot, json_response
+from .substitutions import substitution_graph
+from .suggest import suggest_index
+from django.db.models import Count, F, Q, Sum
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
+from .renderers import FastJSONRenderer
 
 class CustomPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 20
 
-class CategoryList(ListAPIView):
-    queryset = Category.objects.all()
+class CategoryList(CachedListMixin, ListAPIView):
+    # Постоянный порядок: страницы кэшируются, и одна запись не должна попасть на две
+    queryset = Category.objects.order_by('name', 'id')
     serializer_class = CategorySerializer
 
-class TypeList(ListAPIView):
-    queryset = Type.objects.all()
+class TypeList(CachedListMixin, ListAPIView):
+    queryset = Type.objects.order_by('name', 'id')
     serializer_class = TypeSerializer
 
-class StarredDishView(ListAPIView):
-    queryset = Dish.objects.filter(starred=True)
+class StarredDishView(CachedListMixin, FastSerializerMixin, ListAPIView):
+    # Не из снимка каталога: отметки избранного меняются на лету
+    queryset = with_related(Dish.objects.filter(starred=True).order_by('title', 'id'))
     serializer_class = DishSerializer
+    fast_serializer_class = FastDishSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
 class StarredUpdateView(UpdateAPIView):
     serializer_class = DishUpdateSerializer
     queryset = Dish.objects.all()
     lookup_field = 'pk'
 
-class AllDishListView(ListAPIView):
-    queryset = Dish.objects.all()
+class AllDishListView(SnapshotListMixin, CachedListMixin, FacetsMixin, CursorPaginationMixin, FastSerializerMixin, ListAPIView):
+    queryset = with_related(Dish.objects.all())
     serializer_class = DishSerializer
-    renderer_classes = [JSONRenderer]
+    fast_serializer_class = FastDishSerializer
+    renderer_classes = [FastJSONRenderer]
     pagination_class = CustomPagination  # Добавляем пагинацию
+    filter_backends = [OrderingFilter, FullTextSearchFilter]  # Только сортировка и полнотекстовый поиск
     ordering_fields = ['title', 'cooktime']  # Оставляем сортировку для клиента
     ordering = ['title']
 
-    # Убираем всю фильтрацию, оставляем только базовый queryset
+
+def match_serializer(dishes, user_ingredients, ingredient_rows=None, substitutions=None):
+    """Сериализатор страницы подбора: быстрый или ElasticDishSerializer"""
+    context = {'user_ingredients': user_ingredients}
+    if substitutions is not None:
+        context['substitutions'] = substitutions
+    if fast_serializers_enabled():
+        if ingredient_rows is not None:
+            context['ingredient_rows'] = ingredient_rows
+        return FastElasticDishSerializer(load_related(dishes, ingredients=False), many=True, context=context)
+    return ElasticDishSerializer(load_related(dishes), many=True, context=context)
 
 
 class PossibleDishesListView(APIView):
     pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    # FullTextSearchFilter после OrderingFilter: при поиске первой идет релевантность
+    filter_backends = [DjangoFilterBackend, OrderingFilter, FullTextSearchFilter]
     
     # Фильтрация по точным значениям
     filterset_fields = ['category__name', 'type__name']
     
-    # Поиск по частичному совпадению в title
-    search_fields = ['title']
-    
     # Сортировка
     ordering_fields = ['title', 'cooktime']
     ordering = ['title']
 
     def post(self, request):
+        mode = MatchModeSerializer(data=request.data)
+        mode.is_valid(raise_exception=True)
+        if mode.validated_data['ranked']:
+            return self.post_ranked(request, mode.validated_data['substitutions'])
+        
         user_ingredients = request.data.get('ingredients', [])
         willing_to_buy = request.data.get('willing_to_buy', False)
         
         if not user_ingredients:
             return self.get_paginated_response([])
         
-        # Аннотируем все блюда с количеством совпадающих ингредиентов
-        dishes = Dish.objects.annotate(
-            matching_ingredients_count=Count(
-                'dishingredient__ingredient_id',
-                filter=Q(dishingredient__ingredient_id__in=user_ingredients),
-                distinct=True
-            ),
-            total_ingredients_count=Count('dishingredient__ingredient_id', distinct=True)
-        )
+        self.set_default_ordering(willing_to_buy)
+        
+        # substitutions: true — ингредиенты, которые пользователь может заменить
+        # своими (substitutions.py), считаются имеющимися
+        substitutions = None
+        if mode.validated_data['substitutions']:
+            with timed('substitute'):
+                user_ingredients, substitutions = substitution_graph.expand(user_ingredients)
+        
+        snapshot = catalog_snapshot.get()
+        if snapshot is not None and substitutions is None and self.snapshot_supports(request, user_ingredients):
+            return self.post_from_snapshot(request, snapshot, user_ingredients, willing_to_buy)
+        
+        if memory_engine_enabled():
+            return self.post_in_memory(request, user_ingredients, willing_to_buy, substitutions)
+        
+        dishes = self.get_matching_queryset(request, user_ingredients, willing_to_buy)
+        
+        # Пагинация; queryset ленивый, так что здесь же выполняется и SQL подбора
+        paginator = get_paginator(request, self.pagination_class)
+        with timed('paginate'):
+            page = paginator.paginate_queryset(dishes, request, view=self)
+        
+        serializer = match_serializer(page, user_ingredients, substitutions=substitutions)
+        
+        response = paginator.get_paginated_response(serializer.data)
+        if wants_facets(request):
+            with timed('facets'):
+                response.data['facets'] = queryset_facets(dishes)
+        return response
+    
+    def set_default_ordering(self, willing_to_buy):
+        # Порядок по умолчанию для OrderingFilter зависит от режима подбора
+        self.ordering = ['-matching_ingredients_count', 'title'] if willing_to_buy else ['title']
+    
+    def get_matching_queryset(self, request, user_ingredients, willing_to_buy):
+        """Queryset подходящих блюд с фильтрами и сортировкой из query parameters"""
+        with timed('match'):
+            dishes = self.get_base_queryset(user_ingredients, willing_to_buy)
+        
+        # Применяем фильтрацию из query parameters
+        return self.apply_filters(dishes, request)
+    
+    def get_base_queryset(self, user_ingredients, willing_to_buy):
+        if postings_engine_enabled():
+            # Кандидаты — слияние списков блюд по ингредиентам пользователя (postings.py)
+            dishes = postings_queryset(user_ingredients, willing_to_buy)
+            if dishes is not None:
+                return dishes
         
+        # Общее число ингредиентов берем из денормализованного Dish.ingredients_count.
+        # Группируются только строки DishIngredient из набора пользователя (индекс
+        # ingredient_dish_idx), остальные строки состава не читаются
+        candidates = Q(dishingredient__ingredient_id__in=user_ingredients)
+        if not willing_to_buy:
+            # Блюдо без ингредиентов готовится из любого набора (0 = 0), как в индексе в памяти
+            candidates |= Q(ingredients_count=0)
+        dishes = Dish.objects.filter(candidates).annotate(
+            matching_ingredients_count=Count('dishingredient__ingredient_id', distinct=True),
+            total_ingredients_count=F('ingredients_count')
+        )
         if willing_to_buy:
-            # При willing_to_buy=True: показываем все блюда, где есть ХОТЯ БЫ ОДИН совпадающий ингредиент
-            dishes = dishes.filter(matching_ingredients_count__gte=1)
+            # При willing_to_buy=True: показываем все блюда, где есть ХОТЯ БЫ ОДИН совпадающий ингредиент.
             dishes = dishes.order_by('-matching_ingredients_count', 'title')
         else:
-            # При willing_to_buy=False: показываем только блюда, которые можно приготовить ПОЛНОСТЬЮ
-            dishes = dishes.filter(matching_ingredients_count=F('total_ingredients_count'))
+            # При willing_to_buy=False: показываем только блюда, которые можно приготовить ПОЛНОСТЬЮ:
+            # совпали все ингредиенты (HAVING COUNT(DISTINCT ...) = ingredients_count)
+            dishes = dishes.filter(matching_ingredients_count=F('ingredients_count'))
             dishes = dishes.order_by('title')
+        return dishes
+    
+    def post_in_memory(self, request, user_ingredients, willing_to_buy, substitutions=None):
+        """Подбор по битовому индексу в памяти: в базу уходит только страница id"""
+        with timed('match'):
+            matches = ingredient_index.match(user_ingredients, willing_to_buy)
+        with timed('filter'):
+            matches = filter_matches(matches, request.query_params, request_ordering(request, self))
         
-        # Применяем фильтрацию из query parameters
-        dishes = self.apply_filters(dishes, request)
+        paginator = get_paginator(request, self.pagination_class)
+        with timed('paginate'):
+            page = paginator.paginate_queryset(matches, request, view=self)
         
-        # Пагинация
-        paginator = self.pagination_class()
-        page = paginator.paginate_queryset(dishes, request, view=self)
+        serializer = match_serializer(load_dishes(page), user_ingredients, substitutions=substitutions)
         
-        serializer = ElasticDishSerializer(
-            page, 
-            many=True,
-            context={'user_ingredients': user_ingredients}
+        response = paginator.get_paginated_response(serializer.data)
+        if wants_facets(request):
+            with timed('facets'):
+                response.data['facets'] = match_facets(matches, ingredient_index)
+        return response
+    
+    # Параметры, которые снимок каталога обрабатывает сам
+    snapshot_params = frozenset({
+        'page', 'page_size', 'ordering', 'format', 'category', 'type',
+        'category__name', 'type__name', 'cooktime_min', 'cooktime_max',
+    })
+    
+    def snapshot_supports(self, request, user_ingredients):
+        return (
+            accepts_json(request)
+            and set(request.query_params) <= self.snapshot_params
+            and isinstance(user_ingredients, list)
+            and all(isinstance(i, int) and not isinstance(i, bool) for i in user_ingredients)
         )
+    
+    def post_from_snapshot(self, request, snapshot, user_ingredients, willing_to_buy):
+        """Подбор и строки ответа из снимка каталога (snapshot.py); база — только для отметок избранного"""
+        with timed('match'):
+            matches = [
+                DishMatch(SnapshotEntry(snapshot, index), count)
+                for index, count in snapshot.matches(user_ingredients, willing_to_buy)
+            ]
+        with timed('filter'):
+            matches = filter_matches(matches, request.query_params, request_ordering(request, self), snapshot)
+        
+        paginator = get_paginator(request, self.pagination_class)
+        with timed('paginate'):
+            page = paginator.paginate_queryset(matches, request, view=self)
+        
+        with timed('serialize'):
+            user_ingredients = set(user_ingredients)
+            starred = snapshot.starred_ids([match.entry.index for match in page])
+            rows = [
+                snapshot.match_row(
+                    match.entry.index, match.matching_ingredients_count, user_ingredients, request,
+                    match.id in starred,
+                )
+                for match in page
+            ]
+        record_rows(len(rows))
+        return json_response(request, snapshot, paginator, len(matches), rows)
+    
+    def post_ranked(self, request, use_substitutions=False):
+        """
+        Лучшие limit блюд по доле имеющихся ингредиентов (ranked: true).
+        Считается по индексу в памяти с ранней остановкой, без подсчета по
+        всему каталогу, поэтому count — число возвращенных блюд, а страниц нет.
+        С substitutions: true закрытые заменами ингредиенты считаются имеющимися.
+        """
+        serializer = RankedMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        user_ingredients, substitutions = params['ingredients'], None
+        if use_substitutions:
+            with timed('substitute'):
+                user_ingredients, substitutions = substitution_graph.expand(user_ingredients)
+        
+        with timed('filter'):
+            predicate = build_predicate(request.query_params)
+        with timed('match'):
+            matches = ingredient_index.top_k(
+                user_ingredients,
+                limit=params['limit'],
+                min_ratio=params['min_match'] / 100,
+                tie_break=params['tie_break'],
+                predicate=predicate,
+            )
+        
+        serializer = match_serializer(load_dishes(matches), user_ingredients, substitutions=substitutions)
         
-        return paginator.get_paginated_response(serializer.data)
+        return Response({
+            'count': len(matches),
+            'next': None,
+            'previous': None,
+            'results': serializer.data
+        })
     
     def apply_filters(self, queryset, request):
         """Применяет фильтрацию к queryset"""
+        with timed('filter'):
+            # Фильтрация по категории (точное совпадение)
+            category = request.query_params.get('category')
+            if category:
+                queryset = queryset.filter(category__name=category)
         
-        # Фильтрация по категории (точное совпадение)
-        category = request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category__name=category)
-        
-        # Фильтрация по типу (точное совпадение)
-        dish_type = request.query_params.get('type')
-        if dish_type:
-            queryset = queryset.filter(type__name=dish_type)
-        
-        # Фильтрация по диапазону cooktime
-        cooktime_min = request.query_params.get('cooktime_min')
-        cooktime_max = request.query_params.get('cooktime_max')
-        
-        if cooktime_min and cooktime_max:
-            queryset = queryset.filter(cooktime__gte=cooktime_min, cooktime__lte=cooktime_max)
-        elif cooktime_min:
-            queryset = queryset.filter(cooktime__gte=cooktime_min)
-        elif cooktime_max:
-            queryset = queryset.filter(cooktime__lte=cooktime_max)
-        
-        # Фильтрация по частичному совпадению в title
-        title_search = request.query_params.get('title')
-        if title_search:
-            queryset = queryset.filter(title__icontains=title_search)
-        
-        # Применяем стандартные фильтры DRF
-        for backend in self.filter_backends:
-            queryset = backend().filter_queryset(request, queryset, self)
-        
-        return queryset
+            # Фильтрация по типу (точное совпадение)
+            dish_type = request.query_params.get('type')
+            if dish_type:
+                queryset = queryset.filter(type__name=dish_type)
+        
+            # Фильтрация по диапазону cooktime
+            cooktime_min = request.query_params.get('cooktime_min')
+            cooktime_max = request.query_params.get('cooktime_max')
+        
+            if cooktime_min and cooktime_max:
+                queryset = queryset.filter(cooktime__gte=cooktime_min, cooktime__lte=cooktime_max)
+            elif cooktime_min:
+                queryset = queryset.filter(cooktime__gte=cooktime_min)
+            elif cooktime_max:
+                queryset = queryset.filter(cooktime__lte=cooktime_max)
+        
+            # Поиск по title и ?search= выполняет FullTextSearchFilter из filter_backends
+        
+            # Применяем стандартные фильтры DRF
+            for backend in self.filter_backends:
+                queryset = backend().filter_queryset(request, queryset, self)
+        
+            return queryset
     
     def get_paginated_response(self, data):
         return Response({
@@ -139,3 +305,151 @@ class PossibleDishesListView(APIView):
             'previous': None,
             'results': data
         })
+
+
+class PossibleDishesBatchView(APIView):
+    """
+    Подбор блюд сразу для нескольких наборов ингредиентов (киоски, планирование меню).
+    Все наборы считаются за один проход по индексу в памяти, блюда всех страниц
+    загружаются из базы одним пакетом.
+    """
+    ordering_fields = PossibleDishesListView.ordering_fields
+    renderer_classes = PossibleDishesListView.renderer_classes
+
+    def post(self, request):
+        serializer = PantryBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pantries = serializer.validated_data['pantries']
+
+        matched = ingredient_index.match_many(
+            [(pantry['ingredients'], pantry['willing_to_buy']) for pantry in pantries]
+        )
+
+        pages = []
+        for pantry, matches in zip(pantries, matched):
+            if not pantry['ingredients']:
+                matches = []
+            matches = filter_matches(matches, pantry['filters'], self.get_ordering(pantry))
+            start = (pantry['page'] - 1) * pantry['page_size']
+            pages.append((matches, matches[start:start + pantry['page_size']]))
+
+        # Связи и состав всех страниц загружаются один раз на пакет
+        fast = fast_serializers_enabled()
+        dishes = {dish.id: dish for dish in load_related(list(
+            Dish.objects.filter(id__in={m.id for _, page in pages for m in page})
+        ), ingredients=not fast)}
+        rows = query_ingredient_rows(list(dishes)) if fast else None
+
+        results = []
+        for pantry, (matches, page) in zip(pantries, pages):
+            serializer = match_serializer(load_dishes(page, dishes), pantry['ingredients'], rows)
+            last_page = max(1, -(-len(matches) // pantry['page_size']))
+            results.append({
+                'count': len(matches),
+                'page': pantry['page'],
+                'next_page': pantry['page'] + 1 if pantry['page'] < last_page else None,
+                'previous_page': pantry['page'] - 1 if pantry['page'] > 1 else None,
+                'results': serializer.data,
+            })
+        return Response({'results': results})
+
+    def get_ordering(self, pantry):
+        """Разбирает filters.ordering по тем же правилам, что и OrderingFilter"""
+        requested = [
+            field.strip() for field in pantry['filters'].get('ordering', '').split(',')
+            if field.strip().lstrip('-') in self.ordering_fields
+        ]
+        if requested:
+            return requested
+        return ['-matching_ingredients_count', 'title'] if pantry['willing_to_buy'] else ['title']
+
+
+class ShoppingListView(APIView):
+    """
+    Список покупок для выбранных блюд: недостающие ингредиенты, сложенные
+    по ингредиенту и единице одним GROUP BY по DishIngredient.amount/unit.
+    Количество без числа ("по вкусу") дает строку с amount = null.
+    """
+
+    def post(self, request):
+        serializer = ShoppingListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        with timed('aggregate'):
+            rows = list(
+                DishIngredient.objects
+                .filter(dish_id__in=params['dishes'])
+                .exclude(ingredient_id__in=params['ingredients'])
+                .values('ingredient_id', 'ingredient__name', 'unit')
+                .annotate(total=Sum('amount'), dishes=Count('dish_id', distinct=True))
+                .order_by('ingredient__name', 'ingredient_id', 'unit')
+            )
+
+        results = [{
+            'ingredient': {'id': row['ingredient_id'], 'name': row['ingredient__name']},
+            'amount': f'{row["total"]:.3f}' if row['total'] is not None else None,
+            'unit': row['unit'],
+            'display': format_quantity(row['total'], row['unit']),
+            'dishes': row['dishes'],
+        } for row in rows]
+        record_rows(len(results))
+        return Response({'count': len(results), 'results': results})
+
+
+class IngredientSuggestView(APIView):
+    """
+    Автодополнение ингредиентов: ?q=лу&limit=10. Ищет по началу любого слова
+    названия в индексе в памяти (suggest.py), самые используемые — первыми.
+    Пустой q возвращает самые популярные ингредиенты.
+    """
+    renderer_classes = [FastJSONRenderer]
+
+    def get(self, request):
+        serializer = SuggestQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        with timed('match'):
+            suggestions = suggest_index.suggest(params['q'], params['limit'])
+        record_rows(len(suggestions))
+        return Response({'results': [
+            {'id': ingredient_id, 'name': name, 'dishes': dishes}
+            for ingredient_id, name, dishes in suggestions
+        ]})
+
+
+class SimilarDishesView(APIView):
+    """
+    Похожие по составу блюда: соседи из SimilarDish (similar.py) по убыванию
+    меры Жаккара, одним запросом по индексу (dish, rank).
+    """
+    renderer_classes = [FastJSONRenderer]
+
+    def get(self, request, pk):
+        with timed('match'):
+            rows = list(
+                SimilarDish.objects.filter(dish_id=pk).order_by('rank').values_list(
+                    'similar_id', 'similar__title', 'similar__cooktime', 'similar__category__name',
+                    'similar__type__name', 'similar__starred', 'score',
+                )
+            )
+        # Пустой список отличаем от несуществующего блюда только здесь
+        if not rows and not Dish.objects.filter(pk=pk).exists():
+            raise NotFound()
+        record_rows(len(rows))
+        return Response({'results': [
+            {
+                'id': dish_id, 'title': title, 'cooktime': cooktime, 'category_name': category,
+                'type_name': dish_type, 'starred': starred, 'score': round(score, 3),
+            }
+            for dish_id, title, cooktime, category, dish_type, starred, score in rows
+        ]})
+
+
+class DishExportView(APIView):
+    """Весь каталог одним потоком NDJSON, с ?since= — только измененные блюда (export.py)"""
+
+    def get(self, request):
+        return export_response(request)
+
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы в Server-Timing и /metrics/ попадала вся обработка запроса
+    'cooking.instrumentation.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +63,7 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'main.urls'
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['Server-Timing']
 
 TEMPLATES = [
     {
@@ -81,12 +87,67 @@ WSGI_APPLICATION = 'main.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Профиль базы выбирается переменной COOKING_DB_PROFILE:
+#   'sqlite'   — файл SQLite с настройками по умолчанию (разработка);
+#   'wal'      — SQLite для нескольких воркеров: журнал WAL (читатели не ждут
+#                записи), synchronous=NORMAL, mmap и кэш страниц на каждом
+#                соединении, транзакции BEGIN IMMEDIATE и ожидание блокировки;
+#   'postgres' — PostgreSQL с постоянными соединениями (CONN_MAX_AGE) или пулом
+#                psycopg (COOKING_PG_POOL_MAX_SIZE > 0); драйвер и пул (psycopg,
+#                psycopg-binary, psycopg-pool) перечислены в requirements.txt.
+COOKING_DB_PROFILE = os.environ.get('COOKING_DB_PROFILE', 'sqlite')
+if COOKING_DB_PROFILE not in ('sqlite', 'wal', 'postgres'):
+    raise ImproperlyConfigured(
+        f"COOKING_DB_PROFILE={COOKING_DB_PROFILE!r}: expected 'sqlite', 'wal' or 'postgres'"
+    )
+
+if COOKING_DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('COOKING_PG_NAME', 'cooking'),
+            'USER': os.environ.get('COOKING_PG_USER', 'cooking'),
+            'PASSWORD': os.environ.get('COOKING_PG_PASSWORD', ''),
+            'HOST': os.environ.get('COOKING_PG_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('COOKING_PG_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('COOKING_PG_CONN_MAX_AGE', 60)),
+            # Проверка соединения перед повторным использованием после обрыва
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    COOKING_PG_POOL_MAX_SIZE = int(os.environ.get('COOKING_PG_POOL_MAX_SIZE', 0))
+    if COOKING_PG_POOL_MAX_SIZE:
+        # Пул psycopg несовместим с постоянными соединениями Django
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('COOKING_PG_POOL_MIN_SIZE', 2)),
+            'max_size': COOKING_PG_POOL_MAX_SIZE,
+            'timeout': int(os.environ.get('COOKING_PG_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # Отдельный файл удобен для бенчмарков: COOKING_SQLITE_PATH=bench.sqlite3
+            'NAME': os.environ.get('COOKING_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+    if COOKING_DB_PROFILE == 'wal':
+        DATABASES['default']['OPTIONS'] = {
+            # Прагмы выполняются при каждом новом соединении
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f"PRAGMA mmap_size={int(os.environ.get('COOKING_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+                f"PRAGMA cache_size=-{int(os.environ.get('COOKING_SQLITE_CACHE_KB', 64 * 1024))};"
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            # Блокировка записи берется в начале транзакции: ожидание по timeout
+            # вместо «database is locked» при повышении блокировки посреди транзакции
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.environ.get('COOKING_SQLITE_TIMEOUT', 20)),
+        }
 
 
 # Password validation
@@ -125,6 +186,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Загруженные фото блюд и их уменьшенные варианты
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('COOKING_MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -138,8 +203,88 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
-ELASTICSEARCH_DSL = {
-    'default': {
-        'hosts': 'localhost:9200'
-    },
-}
\ No newline at end of file
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию кэш в памяти процесса; COOKING_CACHE_DIR включает файловый кэш,
+# общий для всех воркеров (инвалидация версией тогда видна всем процессам)
+
+if os.environ.get('COOKING_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['COOKING_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cooking',
+        }
+    }
+
+# Кэш ответов списочных эндпоинтов (cooking/cache.py); TIMEOUT = 0 отключает его
+COOKING_CACHE_ALIAS = 'default'
+COOKING_CACHE_TIMEOUT = int(os.environ.get('COOKING_CACHE_TIMEOUT', 300))
+# Сколько секунд воркер держит копию версии каталога (cooking.CatalogVersion)
+# в кэше — столько он может не замечать изменение, сделанное другим воркером
+COOKING_CATALOG_VERSION_TTL = 1
+# При смене версии индексы в памяти перечитывают блюда, измененные после
+# прошлой синхронизации, с таким запасом в секундах на долгие транзакции
+COOKING_INDEX_SYNC_OVERLAP = 60
+
+# Движок подбора блюд для /dishes/possible/:
+# 'orm' — агрегирующий запрос к базе, 'memory' — битовый индекс в памяти процесса,
+# 'postings' — слияние списков блюд по ингредиентам из таблицы IngredientPostingList
+COOKING_MATCHING_ENGINE = 'orm'
+# Больше кандидатов движок 'postings' передает обычному запросу 'orm'
+COOKING_POSTINGS_MAX_CANDIDATES = 10000
+
+# Снимок каталога только для чтения (cooking/snapshot.py): файл из manage.py
+# build_catalog_snapshot, который воркеры отображают в память через mmap.
+# Пока путь задан и файл существует, списки блюд отдаются из снимка без базы;
+# новый снимок подхватывается не позже чем через CHECK_INTERVAL секунд
+COOKING_SNAPSHOT_PATH = os.environ.get('COOKING_SNAPSHOT_PATH')
+COOKING_SNAPSHOT_CHECK_INTERVAL = 1.0
+
+# Похожие блюда (cooking/similar.py): сколько соседей хранить на блюдо и
+# минимальная мера Жаккара наборов ингредиентов; полный пересчет —
+# manage.py compute_similar_dishes, после правок состава — сигналы
+COOKING_SIMILAR_TOP = 10
+COOKING_SIMILAR_MIN_SCORE = 0.2
+
+# Замены ингредиентов (cooking/substitutions.py): при подборе с
+# substitutions: true ингредиент рецепта считается имеющимся, если его можно
+# заменить цепочкой замен суммарной ценой не больше этой
+COOKING_SUBSTITUTION_MAX_COST = 3
+
+# Выгрузка каталога NDJSON (/dishes/export/, cooking/export.py): сколько блюд
+# читать из курсора и сериализовать за раз
+COOKING_EXPORT_CHUNK_SIZE = 2000
+# Запас next_since в выгрузке (секунды): больше самой долгой транзакции,
+# меняющей блюда, иначе изменение может не попасть ни в одну выгрузку
+COOKING_EXPORT_OVERLAP = 60
+
+# Полнотекстовый поиск по блюдам (cooking/search.py) без внешних сервисов:
+# 'auto' — SQLite FTS5 или Postgres tsvector по СУБД, 'fts5', 'postgres' или 'like'
+COOKING_SEARCH_BACKEND = 'auto'
+COOKING_SEARCH_CONFIG = 'russian'  # словарь to_tsvector для Postgres
+
+# Списки блюд сериализуются без полей DRF (cooking/fast_serializers.py);
+# JSON тот же, False возвращает DishSerializer/ElasticDishSerializer
+COOKING_FAST_SERIALIZERS = True
+
+# Запросы дольше порога (мс) пишутся в лог cooking.slow вместе с их SQL;
+# None отключает лог (cooking/instrumentation.py)
+COOKING_SLOW_REQUEST_MS = 500
+# Значения параметров SQL в этом логе (могут содержать данные пользователей)
+COOKING_SLOW_LOG_PARAMS = False
+# /metrics/ открыт сотрудникам (is_staff) и запросам с заголовком
+# Authorization: Bearer <токен>; без токена — только сотрудникам
+COOKING_METRICS_TOKEN = os.environ.get('COOKING_METRICS_TOKEN')
+
+# Варианты фото блюд (cooking/images.py): имя -> максимальная ширина в пикселях.
+# После загрузки они строятся в пуле из COOKING_PHOTO_WORKERS потоков
+COOKING_PHOTO_SIZES = {'thumb': 160, 'card': 480, 'large': 1200}
+COOKING_PHOTO_ASYNC = True
+COOKING_PHOTO_WORKERS = 2
@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from cooking import urls as cooking_urls
@@ -25,3 +27,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('',include(cooking_urls))
 ]
+
+# В разработке фото отдает сам Django, в продакшене — веб-сервер из MEDIA_ROOT
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)